@@ -1,7 +1,7 @@
+import time
 import subprocess
-import psutil
 
-from onedep_manager.services.handlers import Handler, Parser
+from onedep_manager.services.handlers import Handler, Parser, PidProbe, HttpProbe
 from onedep_manager.services.schemas import Status
 from wwpdb.utils.config.ConfigInfo import ConfigInfo
 
@@ -10,17 +10,26 @@ class ApacheHandler(Handler):
     def __init__(self) -> None:
         self.config = ConfigInfo()
 
+    def probes(self):
+        # the checks that must pass for the service to be up
+        return [PidProbe("httpd"), HttpProbe("http://localhost/")]
+
     def start(self):
         # execute a command on the os to start an application
         # and return the status
         site_config_dir = self.config.get("TOP_WWPDB_SITE_CONFIG_DIR")
+        started = time.monotonic()
 
         try:
             subprocess.run([f"{site_config_dir}/apache_config/httpd-opt", "start"], check=True)
         except subprocess.CalledProcessError as e:
             return Status.FAILED
 
-        return self.status()
+        # poll the probes until they pass, instead of sleeping
+        if not self.wait_ready(since=started):
+            return Status.FAILED
+
+        return Status.RUNNING
 
     def stop(self):
         ...
@@ -29,9 +38,8 @@ class ApacheHandler(Handler):
         ...
 
     def status(self):
-        for proc in psutil.process_iter(['pid', 'name', 'username']):
-            if proc.info['name'] == 'httpd':
-                return Status.RUNNING
+        if self.is_ready():
+            return Status.RUNNING
 
         return Status.STOPPED
 
@@ -39,4 +47,4 @@ class ApacheHandler(Handler):
 if __name__ == "__main__":
     # provide a command line parser to the handler
     handler = ApacheHandler()
-    Parser(handler=handler).run()
+    Parser(handler=handler).main()
@@ -46,7 +46,7 @@ class ConsolePrinter(Printer):
     def json(self, data: dict):
         print_json(data=data)
 
-    def table(self, header: list, data: list):
+    def build_table(self, header: list, data: list) -> Table:
         table = Table(show_header=True, header_style="bold blue")
 
         for col in header:
@@ -55,7 +55,10 @@ class ConsolePrinter(Printer):
         for row in data:
             table.add_row(*row)
 
-        self.console.print(table)
+        return table
+
+    def table(self, header: list, data: list):
+        self.console.print(self.build_table(header, data))
 
     # need to find a way to define these styles in a central place
     # and allow overrides
@@ -64,3 +67,13 @@ class ConsolePrinter(Printer):
 
     def error(self, message):
         self.console.print(f"[indian_red]⬢[/indian_red] {message}")
+
+
+def format_size(size):
+    """Human readable size of `size` bytes, e.g. '1.5 MB'"""
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if size < 1024 or unit == "TB":
+            break
+        size /= 1024
+
+    return f"{size:.1f} {unit}" if unit != "B" else f"{size} {unit}"
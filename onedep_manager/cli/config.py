@@ -5,6 +5,7 @@ import subprocess
 from rich.console import Console
 
 from onedep_manager.cli.common import ConsolePrinter
+from onedep_manager.snapshot import open_snapshot, remove_snapshot, MISSING
 
 from wwpdb.utils.config.ConfigInfo import ConfigInfo, getSiteId
 from wwpdb.utils.config.ConfigInfoFileExec import ConfigInfoFileExec
@@ -20,12 +21,18 @@ def config_group():
 @click.argument("variable", nargs=-1)
 def get(variable):
     """`get` command handler"""
-    ci = ConfigInfo()
+    snapshot = open_snapshot()
+    ci = None
     rows = []
 
     for v in variable:
         vcap = v.upper()
-        value = ci.get(vcap)
+        value = snapshot.lookup(vcap) if snapshot is not None else MISSING
+
+        if value is MISSING:
+            ci = ci or ConfigInfo()
+            value = ci.get(vcap)
+
         rows.append([vcap, str(value)])
 
     c = Console()
@@ -39,6 +46,7 @@ def rebuild(site_id, location):
     """`rebuild` command handler"""
     ci = ConfigInfoFileExec()
     ci.writeConfigCache(siteLoc=location, siteId=site_id)
+    remove_snapshot(site_id)
 
 
 @config_group.command(name="load", help="Load variables into shell environment")
@@ -1,7 +1,7 @@
 import click
 from rich.console import Console
 
-from onedep_manager.config import Config
+from onedep_manager.config import get_config
 from onedep_manager.instance.info import (
     InfoDataRetriever,
     InfoFormatter,
@@ -33,7 +33,7 @@ def status():
 def info():
     """`info` command handler - displays site configuration and paths"""
     console = Console()
-    config = Config()
+    config = get_config()
 
     # Create components following dependency injection principle
     data_retriever = InfoDataRetriever(config)
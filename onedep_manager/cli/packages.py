@@ -1,10 +1,13 @@
 import os
 import click
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from rich import console
+from rich.live import Live
 from rich.theme import Theme
 
-from onedep_manager.packages import get_package, get_wwpdb_packages, install_package, switch_reference, pull, clone, setup_pip_env, ONEDEP_PACKAGES
-from onedep_manager.cli.common import ConsolePrinter
+from onedep_manager.packages import get_package, get_wwpdb_packages, get_package_cache, install_package, install_packages, GIT_WORKERS, switch_reference, pull, clone, setup_pip_env, onedep_package_name, ONEDEP_PACKAGES, _normalize
+from onedep_manager.wheelhouse import get_wheelhouse, build_requires, requirement_name
+from onedep_manager.cli.common import ConsolePrinter, format_size
 
 from wwpdb.utils.config.ConfigInfo import ConfigInfo
 
@@ -43,11 +46,19 @@ def _format_path(path):
     return path
 
 
-def _get_packages_by_name(package):
+PACKAGE_ORDER = {_normalize(p): i for i, p in enumerate(ONEDEP_PACKAGES)}
+
+
+def _package_order(name):
+    """Sort key listing packages in ONEDEP_PACKAGES order"""
+    return PACKAGE_ORDER.get(_normalize(name), len(PACKAGE_ORDER)), name
+
+
+def _get_packages_by_name(package, **kwargs):
     """Helper to get packages based on 'all' or specific name"""
     if package == "all":
-        return get_wwpdb_packages(branch=True)
-    return get_wwpdb_packages(name=package, branch=True)
+        return get_wwpdb_packages(branch=True, **kwargs)
+    return get_wwpdb_packages(name=package, branch=True, **kwargs)
 
 
 @click.group(name="packages", help="Manage OneDep Python packages")
@@ -55,34 +66,130 @@ def packages_group():
     """`packages` command group"""
 
 
+def _fill_wheelhouse(wheelhouse, targets, printer, status, reuse=False):
+    """Builds wheels for (name, source, edit) targets. Editable packages
+    are installed from their checkout, so only the wheels needed to
+    build them are fetched. pip reuses wheels that are up to date.
+
+    If `reuse` is set, packages that already have a wheel in the
+    wheelhouse are not looked up again.
+    """
+    fill = []
+
+    for name, source, edit in targets:
+        if edit:
+            requirements = [(requirement_name(r), r) for r in build_requires(source)]
+        else:
+            requirements = [(name, name)]
+
+        fill.extend(r for r in requirements if r not in fill)
+
+    if reuse:
+        fill = wheelhouse.missing(fill)
+
+        if not fill:
+            return
+
+    status.update(f"Building wheels for {len(fill)} packages...")
+
+    if not wheelhouse.fill(fill):
+        printer.error("Failed to build some wheels. Check logs for more information.")
+
+
+def _install_targets(targets, batch, printer, status, wheelhouse=None, offline=False, reuse=False):
+    """Installs (name, source, edit) targets, with a single pip run if
+    `batch` is set. Returns a dict with the result for each name.
+
+    If a wheelhouse is given, it's filled before installing (unless
+    `offline` is set) and pip installs from its wheels. With `reuse`,
+    wheels already in the wheelhouse are not built again.
+    """
+    kwargs = {}
+
+    if wheelhouse is not None:
+        if not offline:
+            _fill_wheelhouse(wheelhouse, targets, printer, status, reuse=reuse)
+
+        kwargs["pip_args"] = wheelhouse.pip_args(offline=offline)
+
+    if batch and len(targets) > 1:
+        status.update(f"Installing {len(targets)} packages...")
+
+        if install_packages([(source, edit) for _, source, edit in targets], **kwargs):
+            return {name: True for name, _, _ in targets}
+
+        # pip installs all or nothing, retry one by one to find the culprits
+        printer.error("Failed to install packages together. Installing them one by one...")
+
+    results = {}
+
+    for name, source, edit in targets:
+        status.update(f"Installing '{name}'...")
+        results[name] = install_package(source, edit=edit, **kwargs)
+
+    return results
+
+
+def _install_target(p):
+    if p.editable:
+        return (p.name, p.path, True)
+    return (p.name, p.name, False)
+
+
 @packages_group.command(name="update", help="Updates a package to the latest remote version. If PACKAGE is set to 'all', will perform operations on all packages.")
 @click.argument("package")
-def update(package):
+@click.option("--no-batch", "no_batch", is_flag=True, default=False, help="If set, will run pip once per package instead of once for all packages.")
+@click.option("-j", "--jobs", "jobs", type=int, default=GIT_WORKERS, show_default=True, help="Number of repositories to pull concurrently.")
+@click.option("-w", "--wheelhouse", "use_wheelhouse", is_flag=True, default=False, help="If set, will build wheels into the site wheelhouse and install from there.")
+@click.option("--offline", "offline", is_flag=True, default=False, help="If set, will only install from wheels already in the site wheelhouse.")
+def update(package, no_batch, jobs, use_wheelhouse, offline):
     """`update` command handler"""
-    packages = _get_packages_by_name(package)
-    rows = []
+    wheelhouse = get_wheelhouse() if use_wheelhouse or offline else None
+    packages = list(_get_packages_by_name(package))
+    editable = [p for p in packages if p.editable]
+    rows = {}
+    pulled = []
+    results = {}
 
     c = console.Console(theme=Theme(table_theme))
     printer = ConsolePrinter(console=c)
-    with c.status("Checking out packages", spinner_style="green") as s:
-        for p in packages:
-            s.update(f"Updating '{p.name}'...")
 
-            if p.editable:
-                pull_success = pull(package=p)
-                if not pull_success:
+    with c.status("Updating packages", spinner_style="green") as s:
+        def install_now(p):
+            pulled.append(p)
+
+            if no_batch:
+                results.update(_install_targets([_install_target(p)], batch=False, printer=printer, status=s, wheelhouse=wheelhouse, offline=offline))
+
+        # pulls are network bound and run concurrently, while pip runs
+        # one package at a time in this thread as soon as a pull is done
+        with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(editable)))) as executor:
+            futures = {executor.submit(pull, package=p): p for p in editable}
+
+            for p in packages:
+                if not p.editable:
+                    install_now(p)
+
+            for i, future in enumerate(as_completed(futures), start=1):
+                p = futures[future]
+                s.update(f"Pulled '{p.name}' ({i}/{len(futures)})...")
+
+                if not future.result():
                     printer.error(f"Failed to pull '{p.name}'. Check logs for more information.")
-                    rows.append([p.name, f"[blink]{p.version}[/blink]", _format_path(p.path), _format_branch(p.branch)])
+                    rows[p.name] = [p.name, f"[blink]{p.version}[/blink]", _format_path(p.path), _format_branch(p.branch)]
                     continue
-                success = install_package(p.path, edit=True)
-            else:
-                success = install_package(p.name)
 
+                install_now(p)
+
+        if not no_batch:
+            results = _install_targets([_install_target(p) for p in packages if p in pulled], batch=True, printer=printer, status=s, wheelhouse=wheelhouse, offline=offline)
+
+        for p in pulled:
             path_text = _format_path(p.path)
 
-            if not success:
+            if not results[p.name]:
                 printer.error(f"Failed to update '{p.name}'. Check logs for more information.")
-                rows.append([p.name, f"[blink]{p.version}[/blink]", path_text, _format_branch(p.branch)])
+                rows[p.name] = [p.name, f"[blink]{p.version}[/blink]", path_text, _format_branch(p.branch)]
                 continue
 
             upd_package = get_package(name=p.name)
@@ -90,103 +197,156 @@ def update(package):
             if upd_package is None:
                 printer.error(f"Package '{p.name}' not found after update.")
                 version_text = f"[pversion]{p.version}[/pversion] -> [cversion]?[/cversion]"
-                rows.append([p.name, version_text, path_text, _format_branch(p.branch)])
+                rows[p.name] = [p.name, version_text, path_text, _format_branch(p.branch)]
                 continue
 
             version_text = f"[pversion]{p.version}[/pversion] -> [cversion]{upd_package.version}[/cversion]" if p.version != upd_package.version else f"[sversion]{p.version}[/sversion]"
-            rows.append([p.name, version_text, path_text, _format_branch(upd_package.branch)])
+            rows[p.name] = [p.name, version_text, path_text, _format_branch(upd_package.branch)]
 
-    printer.table(header=["Package", "Version", "Location", "Branch"], data=rows)
+    printer.table(header=["Package", "Version", "Location", "Branch"], data=[rows[p.name] for p in packages if p.name in rows])
 
 
 @packages_group.command(name="checkout", help="Checks out a package to a specific version. If PACKAGE is set to 'all', will perform operations on all packages. REFERENCE can be a tag, branch or commit hash.")
 @click.argument("package")
 @click.argument("reference")
-def checkout(package, reference):
+@click.option("-j", "--jobs", "jobs", type=int, default=GIT_WORKERS, show_default=True, help="Number of repositories to check out concurrently.")
+def checkout(package, reference, jobs):
     """`checkout` command handler"""
-    packages = _get_packages_by_name(package)
-    rows = []
+    packages = []
+    rows = {}
 
     c = console.Console(theme=Theme(table_theme))
     printer = ConsolePrinter(console=c)
+
+    for p in _get_packages_by_name(package):
+        if not p.editable:
+            printer.error(f"Package '{p.name}' is not in editable mode. Skipping...")
+            continue
+
+        packages.append(p)
+
     with c.status("Checking out packages", spinner_style="green") as s:
-        for p in packages:
-            if not p.editable:
-                printer.error(f"Package '{p.name}' is not in editable mode. Skipping...")
-                continue
+        with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(packages)))) as executor:
+            futures = {executor.submit(switch_reference, package=p, reference=reference): p for p in packages}
 
-            s.update(f"Checking out '{p.name}' to '{reference}'...")
-            success = switch_reference(package=p, reference=reference)
+            for i, future in enumerate(as_completed(futures), start=1):
+                p = futures[future]
+                s.update(f"Checked out '{p.name}' to '{reference}' ({i}/{len(futures)})...")
+                success = future.result()
 
-            upd_package = get_package(name=p.name)
+                upd_package = get_package(name=p.name)
 
-            if upd_package is None:
-                printer.error(f"Package '{p.name}' not found after checkout.")
-                continue
+                if upd_package is None:
+                    printer.error(f"Package '{p.name}' not found after checkout.")
+                    continue
 
-            branch_text = _format_branch(upd_package.branch)
+                branch_text = _format_branch(upd_package.branch)
 
-            if not success:
-                printer.error(f"Failed to checkout '{p.name}'")
-                branch_text = f"[blink]{branch_text}[/blink]"
+                if not success:
+                    printer.error(f"Failed to checkout '{p.name}'")
+                    branch_text = f"[blink]{branch_text}[/blink]"
 
-            path_text = _format_path(upd_package.path)
-            rows.append([upd_package.name, upd_package.version, path_text, branch_text])
+                path_text = _format_path(upd_package.path)
+                rows[p.name] = [upd_package.name, upd_package.version, path_text, branch_text]
 
-    printer.table(header=["Package", "Version", "Location", "Branch"], data=rows)
+    printer.table(header=["Package", "Version", "Location", "Branch"], data=[rows[p.name] for p in packages if p.name in rows])
 
 
 @packages_group.command(name="get", help="Checks the status of a package. If PACKAGE is set to 'all', will perform operations on all packages.")
 @click.argument("package")
-def get(package):
+@click.option("--no-cache", "no_cache", is_flag=True, default=False, help="If set, will inspect all packages again instead of reusing cached states.")
+@click.option("--fast", "fast", is_flag=True, default=False, help="If set, will read branches from .git/HEAD and skip the (slow) dirty checks.")
+@click.option("-j", "--jobs", "jobs", type=int, default=GIT_WORKERS, show_default=True, help="Number of repositories to inspect concurrently.")
+def get(package, no_cache, fast, jobs):
     """`get` command handler"""
-    packages = _get_packages_by_name(package)
-    rows = []
-
-    for pkg in packages:
-        branch_text = _format_branch(pkg.branch)
-        path_text = _format_path(pkg.path)
-        rows.append([pkg.name, pkg.version, path_text, branch_text])
+    header = ["Package", "Version", "Location", "Branch"]
+    rows = {}
 
     c = console.Console(theme=Theme(table_theme))
-    ConsolePrinter(console=c).table(header=["Package", "Version", "Location", "Branch"], data=rows)
+    printer = ConsolePrinter(console=c)
+
+    def add_row(pkg):
+        rows[pkg.name] = [pkg.name, pkg.version, _format_path(pkg.path), _format_branch(pkg.branch)]
+
+    def table_rows():
+        # packages arrive as their branches are resolved, list them in a stable order
+        return [rows[name] for name in sorted(rows, key=_package_order)]
+
+    if fast:
+        for pkg in _get_packages_by_name(package, dirty=False, workers=jobs):
+            add_row(pkg)
+
+        printer.table(header=header, data=table_rows())
+        return
+
+    cache = None if no_cache else get_package_cache()
+
+    if not c.is_terminal:
+        # no live updates when the output is piped
+        for pkg in _get_packages_by_name(package, cache=cache, workers=jobs):
+            add_row(pkg)
+
+        printer.table(header=header, data=table_rows())
+        return
+
+    if cache is None:
+        # nothing is cached, so show the branches from .git/HEAD (cheap)
+        # while the dirty checks run. Cached packages come first anyway
+        for pkg in _get_packages_by_name(package, dirty=False, workers=jobs):
+            add_row(pkg)
+
+    with Live(printer.build_table(header=header, data=table_rows()), console=c, auto_refresh=False) as live:
+        for pkg in _get_packages_by_name(package, cache=cache, workers=jobs):
+            add_row(pkg)
+            live.update(printer.build_table(header=header, data=table_rows()), refresh=True)
 
 
 @packages_group.command(name="install", help="Installs a package")
 @click.argument("package")
 @click.option("-d", "--dev", "dev", is_flag=True, default=False, help="If set, will install the package in development mode.")
-def install(package, dev):
+@click.option("--no-batch", "no_batch", is_flag=True, default=False, help="If set, will run pip once per package instead of once for all packages.")
+@click.option("-w", "--wheelhouse", "use_wheelhouse", is_flag=True, default=False, help="If set, will build wheels into the site wheelhouse and install from there.")
+@click.option("--offline", "offline", is_flag=True, default=False, help="If set, will only install from wheels already in the site wheelhouse.")
+def install(package, dev, no_batch, use_wheelhouse, offline):
     """`install` command handler"""
+    wheelhouse = get_wheelhouse() if use_wheelhouse or offline else None
     c = console.Console(theme=Theme(table_theme))
     printer = ConsolePrinter(console=c)
 
     if package == "all":
         packages = ONEDEP_PACKAGES
     else:
-        if package not in ONEDEP_PACKAGES:
+        name = onedep_package_name(package)
+
+        if name is None:
             printer.error(f"Package '{package}' is not a OneDep package.")
             return
 
-        packages = [package]
+        # 'wwpdb_io' or 'WWPDB.IO' are cloned and installed as 'wwpdb.io'
+        packages = [name]
 
     rows = []
+    targets = []
 
     with c.status("Installing packages", spinner_style="green") as s:
         for pkg_name in packages:
-            s.update(f"Installing '{pkg_name}'...")
-
             if dev:
+                s.update(f"Cloning '{pkg_name}'...")
                 repo_name = f"py-{pkg_name.replace('.', '_')}"
                 pkg_path = clone(package_name=repo_name, reference="develop")
                 if pkg_path is None:
                     printer.error(f"Failed to clone '{pkg_name}'")
                     continue
 
-                success = install_package(pkg_path, edit=True)
+                targets.append((pkg_name, pkg_path, True))
             else:
-                success = install_package(pkg_name)
+                targets.append((pkg_name, pkg_name, False))
+
+        # update is what picks up new versions, install uses the wheels it has
+        results = _install_targets(targets, batch=not no_batch, printer=printer, status=s, wheelhouse=wheelhouse, offline=offline, reuse=True)
 
-            if not success:
+        for pkg_name, _, _ in targets:
+            if not results[pkg_name]:
                 printer.error(f"Failed to install '{pkg_name}'")
                 continue
 
@@ -196,3 +356,28 @@ def install(package, dev):
                 rows.append([installed_pkg.name, installed_pkg.version, _format_path(installed_pkg.path), _format_branch(installed_pkg.branch)])
 
     printer.table(header=["Package", "Version", "Location", "Branch"], data=rows)
+
+
+@packages_group.group(name="wheelhouse", help="Manage the wheelhouse used by install and update")
+def wheelhouse_group():
+    """`wheelhouse` command group"""
+
+
+@wheelhouse_group.command(name="size", help="Shows the number of wheels in the wheelhouse and their size")
+def wheelhouse_size():
+    """`wheelhouse size` command handler"""
+    printer = ConsolePrinter(console=console.Console())
+    wheelhouse = get_wheelhouse()
+    count, size = wheelhouse.size()
+
+    printer.table(header=["Location", "Wheels", "Size"], data=[[wheelhouse.root, str(count), format_size(size)]])
+
+
+@wheelhouse_group.command(name="prune", help="Removes old wheels from the wheelhouse")
+@click.option("-k", "--keep", "keep", type=click.IntRange(min=1), default=1, show_default=True, help="Number of wheels to keep for each package.")
+def wheelhouse_prune(keep):
+    """`wheelhouse prune` command handler"""
+    printer = ConsolePrinter(console=console.Console())
+    removed, freed = get_wheelhouse().prune(keep=keep)
+
+    printer.info(f"Removed {removed} wheels ({format_size(freed)})")
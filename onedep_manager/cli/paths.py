@@ -1,14 +1,17 @@
 import os
+import sys
+import json
+import time
 import click
+import logging
 from rich.console import Console
 from pathlib import Path
 
-from onedep_manager.cli.common import ConsolePrinter
-from onedep_manager.config import Config
-from onedep_manager.packages import get_package
+from onedep_manager.cli.common import ConsolePrinter, format_size
+from onedep_manager.config import get_config
+from onedep_manager.paths import PathResolver, PATH_TYPES, parse_entry
+from onedep_manager.usage import SCAN_TYPES, SCAN_WORKERS, dep_id_number, location_roots, get_usage_index, scan as scan_usage
 
-from wwpdb.io.locator.PathInfo import PathInfo
-from wwpdb.io.locator.ChemRefPathInfo import ChemRefPathInfo
 from wwpdb.utils.config.ConfigInfo import getSiteId
 
 
@@ -27,40 +30,208 @@ def get(type_, identifier, site):
     """
     c = Console()
     printer = ConsolePrinter(console=c)
-    config = Config()
-    pathinfo = PathInfo()
-    ccdpathinfo = ChemRefPathInfo()
 
-    if type_ not in ('tempdep', 'deposit', 'archive', 'upload', 'pickles', 'wfinst', 'session', 'ccid', 'package', 'wfxml', 'tool'):
-        printer.error(f"Invalid path type: {type_}\nValid types are: tempdep, deposit, archive, upload, wfinst, session, ccid, package, wfxml, tool")
+    if type_ not in PATH_TYPES:
+        printer.error(f"Invalid path type: {type_}\nValid types are: {', '.join(PATH_TYPES)}")
         return
 
-    if type_ == 'tempdep':
-        print(pathinfo.getTempDepPath(dataSetId=identifier))
-    elif type_ == 'deposit':
-        print(pathinfo.getDepositPath(dataSetId=identifier))
-    elif type_ == 'archive':
-        print(pathinfo.getArchivePath(dataSetId=identifier))
-    elif type_ == 'upload':
-        deposit_path = config.from_site("SITE_ARCHIVE_STORAGE_PATH")
-        print(os.path.join(deposit_path, "deposit", "temp_files", "deposition_uploads", identifier))
-    elif type_ == 'pickles':
-        deposit_path = config.from_site("SITE_ARCHIVE_STORAGE_PATH")
-        print(os.path.join(deposit_path, "deposit", "temp_files", "deposition-v-200", identifier))
-    elif type_ == 'wfinst':
-        dep_id = identifier.split(":")[0]
-        wf_instance = identifier.split(":")[1]
-        print(pathinfo.getInstancePath(dataSetId=dep_id, wfInstanceId=wf_instance))
-    elif type_ == 'session':
-        print(os.path.join(config.from_site("SITE_WEB_APPS_SESSIONS_PATH"), identifier))
-    elif type_ == 'ccid':
-        print(ccdpathinfo.getFilePath(idCode=identifier))
-    elif type_ == 'package':
-        print(get_package(identifier).path)
-    elif type_ == 'wfxml':
-        print(os.path.join(config.from_site("SITE_WF_XML_PATH"), f"{identifier}.xml"))
-    elif type_ == 'tool':
-        print("Not implemented yet")
+    try:
+        print(PathResolver(site=site).resolve(type_, identifier))
+    except ValueError as e:
+        printer.error(str(e))
+
+
+@paths_group.command(name="batch", help="Get the paths of many identifiers, read one per line from FILE (or stdin). Lines can set their own type, e.g. 'deposit:D_1000'.")
+@click.argument("type_", required=False)
+@click.option("-f", "--file", "input_", type=click.File("r"), default="-", help="File with one identifier per line. Defaults to stdin.")
+@click.option("--jsonl", "jsonl", is_flag=True, default=False, help="If set, will print one JSON object per line instead of 'id<TAB>path'.")
+@click.option("-i", "--site", "site", help="wwPDB site ID (e.g. WWPDB_DEPLOY_TEST_RU). Defaults to the current site.")
+def batch(type_, input_, jsonl, site):
+    """`batch` command handler
+    Paths are written as soon as they are resolved. Identifiers that
+    can't be resolved get an empty path and the error goes to stderr.
+    """
+    if type_ is not None and type_ not in PATH_TYPES:
+        raise click.BadParameter(f"valid types are: {', '.join(PATH_TYPES)}", param_hint="TYPE")
+
+    resolver = PathResolver(site=site)
+    failed = 0
+
+    for line in input_:
+        if not line.strip():
+            continue
+
+        entry_type, identifier = parse_entry(line, default_type=type_)
+        path, error = None, None
+
+        try:
+            if entry_type is None:
+                raise ValueError("No path type given")
+
+            path = resolver.resolve(entry_type, identifier)
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            failed += 1
+
+        if jsonl:
+            click.echo(json.dumps({"type": entry_type, "id": identifier, "path": path, "error": error}))
+        else:
+            click.echo(f"{identifier}\t{path or ''}")
+
+            if error:
+                click.echo(f"{line.strip()}: {error}", err=True)
+
+    if failed:
+        sys.exit(1)
+
+
+@paths_group.command(name="scan", help="Count the files and bytes of the deposition directories of each location. Scans DEP_IDS, or every deposition found.")
+@click.argument("dep_ids", nargs=-1)
+@click.option("-t", "--type", "types", multiple=True, type=click.Choice(SCAN_TYPES), help="Location to scan, can be repeated. Defaults to all of them.")
+@click.option("--from", "first", help="Only depositions from this id on (e.g. D_1000).")
+@click.option("--to", "last", help="Only depositions up to this id (e.g. D_2000).")
+@click.option("--older-than", "older_than", type=float, help="Only trees not modified in this many days.")
+@click.option("--newer-than", "newer_than", type=float, help="Only trees modified in the last this many days.")
+@click.option("--jsonl", "jsonl", is_flag=True, default=False, help="If set, will print one JSON object per line instead of a table.")
+@click.option("-j", "--jobs", "jobs", type=int, default=SCAN_WORKERS, show_default=True, help="Number of directory trees to walk concurrently.")
+@click.option("-i", "--site", "site", help="wwPDB site ID (e.g. WWPDB_DEPLOY_TEST_RU). Defaults to the current site.")
+def scan(dep_ids, types, first, last, older_than, newer_than, jsonl, jobs, site):
+    """`scan` command handler
+    Rows are printed as soon as each tree is measured.
+    """
+    bounds = _id_bounds(first, last)
+    roots = location_roots(PathResolver(site=site), types or SCAN_TYPES)
+    day = 24 * 3600
+    results = scan_usage(
+        roots,
+        dep_ids=dep_ids or None,
+        first=bounds[0],
+        last=bounds[1],
+        older_than=older_than * day if older_than is not None else None,
+        newer_than=newer_than * day if newer_than is not None else None,
+        workers=jobs,
+    )
+
+    if not jsonl:
+        click.echo(f"{'Deposition':<16}{'Location':<10}{'Files':>10}{'Size':>12}  Modified")
+
+    files, size = 0, 0
+
+    for usage in results:
+        files += usage.files
+        size += usage.size
+
+        if jsonl:
+            _print_usage([usage], jsonl=True)
+        else:
+            modified = time.strftime("%Y-%m-%d %H:%M", time.localtime(usage.mtime))
+            click.echo(f"{usage.dep_id:<16}{usage.location:<10}{usage.files:>10}{format_size(usage.size):>12}  {modified}")
+
+    if not jsonl:
+        click.echo(f"{'Total':<26}{files:>10}{format_size(size):>12}")
+
+
+def _id_bounds(first, last):
+    bounds = []
+
+    for name, dep_id in (("--from", first), ("--to", last)):
+        if dep_id is not None and dep_id_number(dep_id) is None:
+            raise click.BadParameter(f"'{dep_id}' is not a deposition id", param_hint=name)
+
+        bounds.append(dep_id_number(dep_id) if dep_id is not None else None)
+
+    return bounds
+
+
+def _print_usage(usages, jsonl):
+    if jsonl:
+        for usage in usages:
+            click.echo(json.dumps({"id": usage.dep_id, "location": usage.location, "path": usage.path, "files": usage.files, "bytes": usage.size, "mtime": usage.mtime}))
+        return
+
+    rows = [[u.dep_id, u.location, str(u.files), format_size(u.size), time.strftime("%Y-%m-%d %H:%M", time.localtime(u.mtime))] for u in usages]
+    ConsolePrinter(console=Console()).table(header=["Deposition", "Location", "Files", "Size", "Modified"], data=rows)
+
+
+@paths_group.group(name="usage", help="Query the disk usage index of deposition directories")
+def usage_group():
+    """`usage` command group"""
+
+
+@usage_group.command(name="refresh", help="Update the usage index, listing only the directories that changed since the last refresh. Interrupted refreshes continue where they stopped.")
+@click.option("-t", "--type", "types", multiple=True, type=click.Choice(SCAN_TYPES), help="Location to index, can be repeated. Defaults to all of them.")
+@click.option("--from", "first", help="Only depositions from this id on (e.g. D_1000).")
+@click.option("--to", "last", help="Only depositions up to this id (e.g. D_2000).")
+@click.option("-r", "--rate", "rate", type=float, default=None, help="Maximum number of directories to list or stat per second.")
+@click.option("-i", "--site", "site", help="wwPDB site ID (e.g. WWPDB_DEPLOY_TEST_RU). Defaults to the current site.")
+def usage_refresh(types, first, last, rate, site):
+    """`usage refresh` command handler"""
+    c = Console()
+    printer = ConsolePrinter(console=c)
+    first, last = _id_bounds(first, last)
+    roots = location_roots(PathResolver(site=site), types or SCAN_TYPES)
+    index = get_usage_index()
+    count, size = 0, 0
+
+    try:
+        with c.status("Refreshing usage index", spinner_style="green") as s:
+            for usage in index.refresh(roots, first=first, last=last, rate=rate):
+                count += 1
+                size += usage.size
+                s.update(f"Indexed {usage.location}/{usage.dep_id} ({count} trees, {format_size(size)})")
+    except KeyboardInterrupt:
+        printer.error(f"Interrupted after {count} trees, run again to continue")
+        return
+    finally:
+        index.close()
+
+    printer.info(f"Indexed {count} trees ({format_size(size)})")
+
+
+@usage_group.command(name="top", help="Show the largest deposition trees in the usage index")
+@click.option("-n", "--limit", "limit", type=int, default=50, show_default=True, help="Number of trees to show.")
+@click.option("-t", "--type", "types", multiple=True, type=click.Choice(SCAN_TYPES), help="Location to include, can be repeated. Defaults to all of them.")
+@click.option("--jsonl", "jsonl", is_flag=True, default=False, help="If set, will print one JSON object per line instead of a table.")
+def usage_top(limit, types, jsonl):
+    """`usage top` command handler"""
+    index = get_usage_index()
+
+    try:
+        _print_usage(index.top(limit=limit, locations=types or None), jsonl)
+    finally:
+        index.close()
+
+
+@usage_group.command(name="older", help="Show the deposition trees in the usage index not modified in DAYS days")
+@click.argument("days", type=float)
+@click.option("-n", "--limit", "limit", type=int, default=None, help="Maximum number of trees to show.")
+@click.option("-t", "--type", "types", multiple=True, type=click.Choice(SCAN_TYPES), help="Location to include, can be repeated. Defaults to all of them.")
+@click.option("--jsonl", "jsonl", is_flag=True, default=False, help="If set, will print one JSON object per line instead of a table.")
+def usage_older(days, limit, types, jsonl):
+    """`usage older` command handler"""
+    index = get_usage_index()
+
+    try:
+        _print_usage(index.older(days, locations=types or None, limit=limit), jsonl)
+    finally:
+        index.close()
+
+
+@paths_group.command(name="serve", help="Run a path server on a Unix socket, used by the 'odmpath' shell helper.")
+@click.option("-s", "--socket", "socket_path", help="Socket to listen on. Defaults to $ODM_PATH_SOCKET or a per user socket in $XDG_RUNTIME_DIR.")
+@click.option("-i", "--site", "site", help="wwPDB site ID (e.g. WWPDB_DEPLOY_TEST_RU). Defaults to the current site.")
+def serve(socket_path, site):
+    """`serve` command handler"""
+    from onedep_manager.path_server import serve as serve_paths
+
+    logging.basicConfig(level=logging.INFO)
+
+    try:
+        serve_paths(socket_path=socket_path, site=site)
+    except FileExistsError as e:
+        ConsolePrinter(console=Console()).error(str(e))
+    except KeyboardInterrupt:
+        pass
 
 
 @paths_group.command(name="generate-funcs", help="Generate .onedep_funcs bash file with environment variables and helper functions")
@@ -75,27 +246,27 @@ def generate_funcs(site):
 
     c = Console()
     printer = ConsolePrinter(console=c)
-    config = Config()
+    config = get_config()
     mock_dep_id = "D_000000"
-    pi = PathInfo(siteId=site)
+    resolver = PathResolver(config=config, site=site)
 
     # Define path mappings: (type, variable_suffix, function_suffix, base_path_getter)
     # Regular paths that get cd/ls functions
     regular_path_mappings = [
-        ('tempdep', 'TEMPDEP', 't', lambda: pi.getTempDepPath(dataSetId=mock_dep_id).rsplit('/', 1)[0]),
-        ('deposit', 'DEPOSIT', 'd', lambda: pi.getDepositPath(dataSetId=mock_dep_id).rsplit('/', 1)[0]),
-        ('deposit', 'DEPOSIT_UI', 'ui', lambda: pi.getDepositUIPath(dataSetId=mock_dep_id).rsplit('/', 1)[0]),
-        ('archive', 'ARCHIVE', 'a', lambda: pi.getArchivePath(dataSetId=mock_dep_id).rsplit('/', 1)[0]),
+        ('tempdep', 'TEMPDEP', 't', lambda: resolver.resolve('tempdep', mock_dep_id).rsplit('/', 1)[0]),
+        ('deposit', 'DEPOSIT', 'd', lambda: resolver.resolve('deposit', mock_dep_id).rsplit('/', 1)[0]),
+        ('deposit', 'DEPOSIT_UI', 'ui', lambda: resolver.pathinfo.getDepositUIPath(dataSetId=mock_dep_id).rsplit('/', 1)[0]),
+        ('archive', 'ARCHIVE', 'a', lambda: resolver.resolve('archive', mock_dep_id).rsplit('/', 1)[0]),
         ('session', 'SESSION', 's', lambda: config.from_site("SITE_WEB_APPS_SESSIONS_PATH")),
-        ('upload', 'UPLOAD', 'up', lambda: pi.getDirPath(dataSetId=mock_dep_id, fileSource='uploads').rsplit('/', 1)[0]),
-        ('pickles', 'PICKLES', 'pkl', lambda: pi.getDirPath(dataSetId=mock_dep_id, fileSource='pickles').rsplit('/', 1)[0]),
-        ('wfinst', 'WFINST', 'wfi', lambda: pi.getInstancePath(dataSetId=mock_dep_id, wfInstanceId='W_001').rsplit('/', 3)[0]),
+        ('upload', 'UPLOAD', 'up', lambda: resolver.pathinfo.getDirPath(dataSetId=mock_dep_id, fileSource='uploads').rsplit('/', 1)[0]),
+        ('pickles', 'PICKLES', 'pkl', lambda: resolver.pathinfo.getDirPath(dataSetId=mock_dep_id, fileSource='pickles').rsplit('/', 1)[0]),
+        ('wfinst', 'WFINST', 'wfi', lambda: resolver.resolve('wfinst', f'{mock_dep_id}:W_001').rsplit('/', 3)[0]),
     ]
 
     # Special paths that get vi functions or custom handling
     special_path_mappings = [
         ('package', 'PACKAGE', 'pkg', lambda: config.from_site("TOP_WWPDB_WEBAPPS_DIR").rsplit('/', 2)[0]),
-        ('ccid', 'CCID', 'ccid', lambda: ChemRefPathInfo().getFilePath(idCode='ABC').rsplit('/', 3)[0]),
+        ('ccid', 'CCID', 'ccid', lambda: resolver.resolve('ccid', 'ABC').rsplit('/', 3)[0]),
         ('wfxml', 'WFXML', 'wfx', lambda: config.from_site("SITE_WF_XML_PATH")),
     ]
 
@@ -120,6 +291,8 @@ def generate_funcs(site):
             printer.error(f"Failed to get path for {type_name}: {e}")
             continue
 
+    from onedep_manager.path_server import default_socket_path
+    lines.append(f"export ODM_PATH_SOCKET=\"${{ODM_PATH_SOCKET:-{default_socket_path(site)}}}\"")
     lines.append("")
 
     # Add cd functions for regular paths
@@ -234,6 +407,30 @@ def generate_funcs(site):
         "",
     ])
 
+    # odmpath: asks the path server (see `paths serve`), falling back to the cli
+    lines.extend([
+        "function odmpath() {",
+        "    if [ -z \"$1\" ] || [ -z \"$2\" ]; then",
+        "        echo \"Usage: odmpath <type> <identifier>\"",
+        "        return 1",
+        "    fi",
+        "    local reply=\"\"",
+        "    if [ -S \"$ODM_PATH_SOCKET\" ]; then",
+        "        if command -v socat >/dev/null 2>&1; then",
+        "            reply=$(printf '%s %s\\n' \"$1\" \"$2\" | socat -t 1 - UNIX-CONNECT:\"$ODM_PATH_SOCKET\" 2>/dev/null)",
+        "        elif command -v nc >/dev/null 2>&1; then",
+        "            reply=$(printf '%s %s\\n' \"$1\" \"$2\" | nc -U -N -w 1 \"$ODM_PATH_SOCKET\" 2>/dev/null)",
+        "        fi",
+        "    fi",
+        "    case \"$reply\" in",
+        "        \"OK \"*) echo \"${reply#OK }\" ;;",
+        "        \"ERR \"*) echo \"Error: ${reply#ERR }\" >&2; return 1 ;;",
+        "        *) onedep-manager paths get \"$1\" \"$2\" ;;",
+        "    esac",
+        "}",
+        "",
+    ])
+
     # Write to file
     output_file = Path.home() / f".onedep_funcs_{site.lower()}"
     try:
@@ -1,10 +1,59 @@
+import time
 import click
 import logging
 from rich import console
+from rich.console import Group
+from rich.live import Live
 
 from onedep_manager.services.dispatcher import LocalDispatcher, RemoteDispatcher
+from onedep_manager.services.agent import AgentServer
+from onedep_manager.services.schemas import Status, Commands
 from onedep_manager.cli.common import ConsolePrinter
-from onedep_manager.config import Config
+from onedep_manager.config import get_config
+
+
+def _format_latency(latency):
+    if latency is None:
+        return ""
+
+    return f"{latency:.2f}s"
+
+
+def _stream_status(printer):
+    """Returns a callback that reports each host as soon as it answers"""
+    def on_status(s):
+        ready = f", ready in {_format_latency(s.ready_time)}" if s.ready_time is not None else ""
+        printer.info(f"{s.hostname}: {s.status} ({_format_latency(s.latency)}{ready})")
+
+    return on_status
+
+
+def _print_status(printer, status):
+    rows = []
+    for s in status:
+        rows.append([s.hostname, str(s.status), _format_latency(s.latency), _format_latency(s.ready_time)])
+
+    printer.table(header=["Hostname", "Status", "Latency", "Ready in"], data=rows)
+
+
+def _run_stack(printer, config, dispatcher, command):
+    from onedep_manager.services.stack import run_stack
+
+    def on_status(service, s):
+        printer.info(f"{service} on {s.hostname}: {s.status} ({_format_latency(s.latency)})")
+
+    try:
+        results = run_stack(config, dispatcher, command, on_status=on_status)
+    except Exception as e:
+        printer.error(f"Could not {command} services: {e}")
+        return
+
+    rows = []
+    for service, status in results.items():
+        for s in status:
+            rows.append([service, s.hostname, str(s.status), _format_latency(s.latency)])
+
+    printer.table(header=["Service", "Hostname", "Status", "Latency"], data=rows)
 
 
 @click.group(name="services", help="Manage OneDep services")
@@ -12,12 +61,13 @@ def services_group():
     """`services` command group"""
 
 
-@services_group.command(name="start", help="Start the service on all registered services or locally only.")
+@services_group.command(name="start", help="Start the service on all registered services or locally only. Use 'all' as SERVICE to start every service, after the ones it depends on.")
 @click.argument("service")
 @click.option("-l", "--local", "local", is_flag=True, default=False, help="If set, perform operations only on the current host.")
-def start(service, local):
+@click.option("-t", "--timeout", "timeout", type=float, default=60, show_default=True, help="Seconds to wait for all remote hosts to answer.")
+def start(service, local, timeout):
     """`start` command handler"""
-    config = Config()
+    config = get_config()
     c = console.Console()
     printer = ConsolePrinter(console=c)
 
@@ -26,28 +76,29 @@ def start(service, local):
         dispatcher = LocalDispatcher(config=config)
     else:
         printer.info(f"Starting {service} on all registered hosts")
-        dispatcher = RemoteDispatcher(config=config)
+        dispatcher = RemoteDispatcher(config=config, timeout=timeout)
+
+    if service == "all":
+        _run_stack(printer, config, dispatcher, Commands.START)
+        return
 
     try:
-        status = dispatcher.start_service(service)
+        status = dispatcher.start_service(service, on_status=_stream_status(printer))
     except Exception as e:
         printer.error(f"Could not start service {service}: {e}")
         return
 
-    rows = []
-    for s in status:
-        rows.append([s.hostname, str(s.status)])
-
-    printer.table(header=["Hostname", "Status"], data=rows)
+    _print_status(printer, status)
 
 
-@services_group.command(name="stop", help="Stop the service on all registered services or locally only.")
+@services_group.command(name="stop", help="Stop the service on all registered services or locally only. Use 'all' as SERVICE to stop every service, before the ones it depends on.")
 @click.argument("service")
 @click.option("-f", "--force", "force", is_flag=True, default=False, help="If set, will forcefully kill services' processes.")
 @click.option("-l", "--local", "local", is_flag=True, default=False, help="If set, perform operations only on the current host.")
-def stop(service, force, local):
+@click.option("-t", "--timeout", "timeout", type=float, default=60, show_default=True, help="Seconds to wait for all remote hosts to answer.")
+def stop(service, force, local, timeout):
     """`stop` command handler"""
-    config = Config()
+    config = get_config()
     c = console.Console()
     printer = ConsolePrinter(console=c)
 
@@ -56,28 +107,44 @@ def stop(service, force, local):
         dispatcher = LocalDispatcher(config=config)
     else:
         printer.info(f"Stopping {service} on all registered hosts")
-        dispatcher = RemoteDispatcher(config=config)
+        dispatcher = RemoteDispatcher(config=config, timeout=timeout)
+
+    if service == "all":
+        _run_stack(printer, config, dispatcher, Commands.STOP)
+        return
 
     try:
-        status = dispatcher.stop_service(service)
+        status = dispatcher.stop_service(service, on_status=_stream_status(printer))
     except Exception as e:
         printer.error(f"Could not stop service {service}: {e}")
         return
 
-    rows = []
-    for s in status:
-        rows.append([s.hostname, str(s.status)])
-
-    printer.table(header=["Hostname", "Status"], data=rows)
+    _print_status(printer, status)
 
 
 @services_group.command(name="restart", help="Restart the service on all registered services or locally only.")
 @click.argument("service")
 @click.option("-f", "--force", "force", is_flag=True, default=False, help="If set, will forcefully kill services' processes.")
 @click.option("-l", "--local", "local", is_flag=True, default=False, help="If set, perform operations only on the current host.")
-def restart(service, force, local):
+@click.option("-t", "--timeout", "timeout", type=float, default=60, show_default=True, help="Seconds to wait for all remote hosts to answer (for each batch, with --rolling).")
+@click.option("-r", "--rolling", "rolling", is_flag=True, default=False, help="If set, restart the hosts a batch at a time, waiting for each batch to be ready before the next one.")
+@click.option("-b", "--batch", "batch", default="1", show_default=True, help="Hosts per batch of a rolling restart, as a number or a percentage (e.g. 25%).")
+@click.option("--continue-on-failure", "keep_going", is_flag=True, default=False, help="If set, a rolling restart goes on after a batch fails.")
+@click.pass_context
+def restart(ctx, service, force, local, timeout, rolling, batch, keep_going):
     """`restart` command handler"""
-    config = Config()
+    if local:
+        given = {
+            "--rolling": rolling,
+            "--batch": ctx.get_parameter_source("batch") != click.core.ParameterSource.DEFAULT,
+            "--continue-on-failure": keep_going,
+        }
+        conflicts = [option for option, is_set in given.items() if is_set]
+
+        if conflicts:
+            raise click.UsageError(f"{', '.join(conflicts)} can't be used with --local", ctx=ctx)
+
+    config = get_config()
     c = console.Console()
     printer = ConsolePrinter(console=c)
 
@@ -85,46 +152,157 @@ def restart(service, force, local):
         printer.info(f"Restarting local instance of {service}")
         dispatcher = LocalDispatcher(config=config)
     else:
-        printer.info(f"Restarting {service} on all registered hosts")
-        dispatcher = RemoteDispatcher(config=config)
+        printer.info(f"Restarting {service} on all registered hosts" + (f", {batch} at a time" if rolling else ""))
+        dispatcher = RemoteDispatcher(config=config, timeout=timeout)
 
     try:
-        status = dispatcher.restart_service(service)
+        if rolling:
+            status = dispatcher.rolling_restart(service, batch=batch, abort_on_failure=not keep_going, on_status=_stream_status(printer))
+        else:
+            status = dispatcher.restart_service(service, on_status=_stream_status(printer))
     except Exception as e:
         printer.error(f"Could not restart service {service}: {e}")
         return
 
+    _print_status(printer, status)
+    skipped = [s for s in status if s.status == Status.SKIPPED]
+
+    if skipped:
+        printer.error(f"Rolling restart stopped after a failed batch, {len(skipped)} hosts were not restarted")
+
+
+def _print_matrix(printer, matrix, as_json=False):
+    services = []
+    for statuses in matrix.values():
+        services.extend(name for name in statuses if name not in services)
+
+    if as_json:
+        printer.json({host: {name: str(s.status) for name, s in statuses.items()} for host, statuses in matrix.items()})
+        return
+
     rows = []
-    for s in status:
-        rows.append([s.hostname, str(s.status)])
+    for host, statuses in matrix.items():
+        rows.append([host] + [str(statuses[name].status) if name in statuses else "" for name in services])
 
-    printer.table(header=["Hostname", "Status"], data=rows)
+    printer.table(header=["Hostname"] + services, data=rows)
 
 
-@services_group.command(name="status", help="Check the status of a service on all registered services or locally only.")
+@services_group.command(name="status", help="Check the status of a service on all registered services or locally only. Use 'all' as SERVICE to check every service in the config.")
 @click.argument("service")
 @click.option("-l", "--local", "local", is_flag=True, default=False, help="If set, perform operations only on the current host.")
-def status(service, local):
+@click.option("-t", "--timeout", "timeout", type=float, default=60, show_default=True, help="Seconds to wait for all remote hosts to answer.")
+@click.option("-j", "--json", "as_json", is_flag=True, default=False, help="If set, print the status of 'all' services as JSON.")
+def status(service, local, timeout, as_json):
     """`status` command handler"""
-    config = Config()
+    config = get_config()
     c = console.Console()
     printer = ConsolePrinter(console=c)
 
+    if service == "all":
+        dispatcher = LocalDispatcher(config=config) if local else RemoteDispatcher(config=config, timeout=timeout)
+
+        try:
+            matrix = dispatcher.get_all_status()
+        except Exception as e:
+            printer.error(f"Could not get status of services: {e}")
+            return
+
+        _print_matrix(printer, matrix, as_json=as_json)
+        return
+
     if local:
         printer.info(f"Checking status of local instance of {service}")
         dispatcher = LocalDispatcher(config=config)
     else:
         printer.info(f"Checking status of {service} on all registered hosts")
-        dispatcher = RemoteDispatcher(config=config)
+        dispatcher = RemoteDispatcher(config=config, timeout=timeout)
 
     try:
-        status = dispatcher.get_status(service)
+        status = dispatcher.get_status(service, on_status=_stream_status(printer))
     except Exception as e:
         printer.error(f"Could not get status of service {service}: {e}")
         return
 
+    _print_status(printer, status)
+
+
+def _format_since(since):
+    if since is None:
+        return ""
+
+    return time.strftime("%H:%M:%S", time.localtime(since))
+
+
+def _render_watch(printer, state):
+    services = state.services
     rows = []
-    for s in status:
-        rows.append([s.hostname, str(s.status)])
 
-    printer.table(header=["Hostname", "Status"], data=rows)
+    for host, cells in state.cells.items():
+        row = [host]
+
+        for name in services:
+            cell = cells.get(name)
+
+            if cell is None or cell.status is None:
+                row.append("")
+            else:
+                row.append(f"{cell.status} (since {_format_since(cell.since)})")
+
+        rows.append(row)
+
+    transitions = [[_format_since(t.at), t.host, t.service, f"{t.old} → {t.new}"] for t in reversed(state.transitions)]
+
+    return Group(
+        printer.build_table(header=["Hostname"] + services, data=rows),
+        printer.build_table(header=["Time", "Hostname", "Service", "Change"], data=transitions),
+    )
+
+
+@services_group.command(name="watch", help="Show the status of services on all their hosts, updated as it changes. Watches SERVICES, or every service in the config.")
+@click.argument("services", nargs=-1)
+@click.option("-i", "--interval", "interval", type=float, default=1, show_default=True, help="Seconds between polls of hosts whose services are changing.")
+@click.option("-s", "--slow-interval", "slow", type=float, default=30, show_default=True, help="Longest time between polls of hosts whose services are stable.")
+@click.option("-t", "--timeout", "timeout", type=float, default=10, show_default=True, help="Seconds each host has to answer a poll.")
+def watch(services, interval, slow, timeout):
+    """`watch` command handler"""
+    from onedep_manager.services.watch import Watcher
+
+    config = get_config()
+    c = console.Console()
+    printer = ConsolePrinter(console=c)
+
+    try:
+        watcher = Watcher(RemoteDispatcher(config=config, host_timeout=timeout), services=list(services) or None, fast=interval, slow=slow)
+    except Exception as e:
+        printer.error(f"Could not watch services: {e}")
+        return
+
+    # only redrawn when a status changes
+    with Live(_render_watch(printer, watcher.state), console=c, auto_refresh=False) as live:
+        try:
+            watcher.run(on_change=lambda state: live.update(_render_watch(printer, state), refresh=True))
+        except KeyboardInterrupt:
+            pass
+
+
+@services_group.command(name="agent", help="Run the service agent for the current host. Remote commands are sent to it instead of spawning the service handlers.")
+@click.option("-p", "--port", "port", type=int, default=None, help="Port to listen on (localhost only). Defaults to 'agent_port' in the config.")
+def agent(port):
+    """`agent` command handler"""
+    config = get_config()
+    c = console.Console()
+    printer = ConsolePrinter(console=c)
+
+    try:
+        server = AgentServer(config=config, port=port)
+    except (OSError, ValueError) as e:
+        printer.error(f"Could not start agent: {e}")
+        return
+
+    printer.info(f"Agent listening on {server.server_address[0]}:{server.server_address[1]}")
+
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            printer.info("Agent stopped")
@@ -1,16 +1,23 @@
 import os
 import yaml
+import threading
 
 from onedep_manager.schemas import Service
+from onedep_manager.tracing import span
+from onedep_manager.snapshot import open_snapshot, MISSING
 from wwpdb.utils.config.ConfigInfo import ConfigInfo
 
 
 class Config:
     GITHUB_PACKAGE_HOST = "wwPDB"
+    AGENT_PORT = 8765
 
     def __init__(self, config_file: str = None):
-        self._odconfig = ConfigInfo()
-        self.ODM_CONFIG_DIR = os.path.join(self._odconfig.get("TOP_WWPDB_SITE_CONFIG_DIR"), "odm")
+        self._lock = threading.RLock()
+        self._snapshot = open_snapshot()
+        self._odconfig = None
+        self._site_values = {}
+        self.ODM_CONFIG_DIR = os.path.join(self.from_site("TOP_WWPDB_SITE_CONFIG_DIR"), "odm")
 
         if not config_file:
             config_file = os.path.join(self.ODM_CONFIG_DIR, "config.yaml")
@@ -22,26 +29,90 @@ class Config:
 
         self._config_file = config_file
         self._config = self._load_config()
-    
+        self._services = self._index_services()
+
     def _load_config(self):
         with open(self._config_file, "r") as f:
             config = yaml.safe_load(f)
         return config
 
-    def get_services(self):
-        services = []
+    def _index_services(self):
+        return {service["name"]: Service(**service) for service in self._config["services"]}
 
-        for service in self._config["services"]:
-            services.append(Service(**service))
-        
-        return services
+    def reload(self):
+        """Reads config.yaml and the site config again. Meant for long
+        running processes (e.g. the agent); commands don't need it.
+        """
+        with self._lock:
+            self._config = self._load_config()
+            self._services = self._index_services()
+            self._snapshot = open_snapshot()
+            self._odconfig = None
+            self._site_values = {}
+
+    def get_services(self):
+        return list(self._services.values())
 
     def get_service(self, name):
-        for service in self._config["services"]:
-            if service["name"] == name:
-                return Service(**service)
+        try:
+            return self._services[name]
+        except KeyError:
+            raise Exception(f"Service {name} not found in config")
+
+    def get_agent_port(self):
+        return self._config.get("agent_port", self.AGENT_PORT)
 
-        raise Exception(f"Service {name} not found in config")
+    def get_agent_token(self):
+        """Secret shared by the agents and the remote dispatchers. None
+        if not set, in which case agents are not used.
+        """
+        return self._config.get("agent_token")
 
     def from_site(self, variable: str):
-        return self._odconfig.get(variable)
+        try:
+            return self._site_values[variable]
+        except KeyError:
+            pass
+
+        with self._lock:
+            value = MISSING
+
+            if self._snapshot is not None:
+                value = self._snapshot.lookup(variable)
+
+            # values that can't be snapshotted, or no snapshot at all
+            if value is MISSING:
+                if self._odconfig is None:
+                    with span("site config", "config"):
+                        self._odconfig = ConfigInfo()
+
+                value = self._odconfig.get(variable)
+
+            self._site_values[variable] = value
+
+        return value
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def get_config(config_file: str = None) -> Config:
+    """Returns the Config of `config_file` (or of the default
+    config.yaml), creating it on first use. The same instance is shared
+    by the whole process, call `Config.reload` to pick up changes.
+    """
+    key = os.path.abspath(config_file) if config_file else None
+
+    with _registry_lock:
+        if key not in _registry:
+            with span("config load", "config"):
+                _registry[key] = Config(config_file=config_file)
+
+        return _registry[key]
+
+
+def clear_configs():
+    """Forgets all shared Config instances"""
+    with _registry_lock:
+        _registry.clear()
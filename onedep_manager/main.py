@@ -1,25 +1,91 @@
 import click
-from onedep_manager.cli.services import services_group
-from onedep_manager.cli.tools import tools_group
-from onedep_manager.cli.packages import packages_group
-from onedep_manager.cli.instance import instance_group
-from onedep_manager.cli.config import config_group
-from onedep_manager.cli.paths import paths_group
+import importlib
 
+from onedep_manager import tracing
 
-@click.group()
-def cli():
-    """CLI entry point"""
 
+class LazyGroup(click.Group):
+    """Group that only imports the module of a subcommand when that
+    subcommand is looked up, so one command doesn't pay for the imports
+    of all the others (paramiko, GitPython, psutil, ...).
+
+    `lazy_subcommands` maps command names to the dotted path of the
+    click object, e.g. {"paths": "onedep_manager.cli.paths.paths_group"}.
+    """
+    def __init__(self, *args, lazy_subcommands: dict = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_subcommands = lazy_subcommands or {}
+
+    def list_commands(self, ctx):
+        return sorted(super().list_commands(ctx) + list(self.lazy_subcommands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazy_subcommands:
+            return self._load(cmd_name)
+
+        return super().get_command(ctx, cmd_name)
+
+    def _load(self, cmd_name):
+        module, attr = self.lazy_subcommands[cmd_name].rsplit(".", 1)
+
+        with tracing.span(f"import {module}", "import"):
+            return getattr(importlib.import_module(module), attr)
+
+
+def _report_profile(ctx):
+    tracer = tracing.get_tracer()
+    output = ctx.meta.get("odm.profile_output")
+    tracing.disable()
+
+    if tracer is None:
+        return
 
-cli.add_command(services_group)
-cli.add_command(tools_group)
-cli.add_command(packages_group)
-cli.add_command(instance_group)
-cli.add_command(config_group)
-cli.add_command(paths_group)
+    if output:
+        tracer.write_chrome_trace(output)
+        click.echo(f"Trace written to {output}", err=True)
+
+    if ctx.meta.get("odm.profile"):
+        from rich.console import Console
+        from onedep_manager.cli.common import ConsolePrinter
+
+        rows = [[r["category"], str(r["spans"]), f"{r['wall']:.3f}s", f"{r['busy']:.3f}s", f"{r['slowest']} ({r['max']:.3f}s)"] for r in tracer.summary()]
+        ConsolePrinter(console=Console(stderr=True)).table(header=["Phase", "Spans", "Wall time", "Busy time", "Slowest"], data=rows)
+
+
+def _enable_profiling(ctx, param, value):
+    """Starts tracing as soon as the option is parsed, so the import of
+    the subcommand is traced too. The report is made when the command
+    is done.
+    """
+    if not value:
+        return
+
+    ctx.meta[f"odm.{param.name}"] = value
+
+    if tracing.get_tracer() is None:
+        tracing.enable()
+        ctx.call_on_close(lambda: _report_profile(ctx))
+
+
+@click.group(
+    cls=LazyGroup,
+    lazy_subcommands={
+        "services": "onedep_manager.cli.services.services_group",
+        "tools": "onedep_manager.cli.tools.tools_group",
+        "packages": "onedep_manager.cli.packages.packages_group",
+        "instance": "onedep_manager.cli.instance.instance_group",
+        "config": "onedep_manager.cli.config.config_group",
+        "paths": "onedep_manager.cli.paths.paths_group",
+    },
+)
+@click.option("--profile", "profile", is_flag=True, default=False, is_eager=True, expose_value=False, envvar="ODM_PROFILE", callback=_enable_profiling, help="Print how long each phase of the command took (also ODM_PROFILE=1).")
+@click.option("--profile-output", "profile_output", type=click.Path(dir_okay=False), is_eager=True, expose_value=False, envvar="ODM_PROFILE_OUTPUT", callback=_enable_profiling, help="Write the timings of the command to a Chrome trace file (also ODM_PROFILE_OUTPUT).")
+@click.pass_context
+def cli(ctx):
+    """CLI entry point"""
+    if tracing.get_tracer() is not None:
+        ctx.with_resource(tracing.span(f"command {ctx.invoked_subcommand}", "command"))
 
 
 if __name__ == "__main__":
     cli()
-
@@ -1,26 +1,47 @@
 import os
+import re
+import sys
 import git
 import json
 import logging
 import subprocess
 import urllib.parse
+from typing import Optional
+from dataclasses import asdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from importlib import metadata
 
 from onedep_manager.schemas import PackageDistribution
-from onedep_manager.config import Config
+from onedep_manager.config import get_config
+from onedep_manager.tracing import span, traced
 
 
-lconfig = Config()
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-logger.propagate = False
-log_file = os.path.join(lconfig.ODM_CONFIG_DIR, "packages.log")
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-file_handler = logging.FileHandler(log_file)
-file_handler.setLevel(logging.DEBUG)
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
+
+
+def _setup_logger():
+    """Attaches the console and 'packages.log' handlers on first use,
+    so importing this module doesn't load the config or open files.
+    """
+    if logger.handlers:
+        return
+
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    logger.addHandler(console_handler)
+
+    try:
+        lconfig = get_config()
+        log_file = os.path.join(lconfig.ODM_CONFIG_DIR, "packages.log")
+        file_handler = logging.FileHandler(log_file)
+    except Exception as e:
+        logger.warning("Not logging to file: %s", e)
+        return
+
+    file_handler.setLevel(logging.DEBUG)
+    logger.addHandler(file_handler)
 
 
 ONEDEP_PACKAGES = [
@@ -61,7 +82,177 @@ ONEDEP_PACKAGES = [
 ]
 
 
-def install_package(source, version="latest", edit=False):
+def _normalize(name: str) -> str:
+    """PEP 503 normalization, so 'wwpdb.utils.config', 'wwpdb_utils_config'
+    and 'wwpdb-utils-config' are the same package.
+    """
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+ONEDEP_NAMES = {_normalize(p): p for p in ONEDEP_PACKAGES}
+
+# number of repositories inspected concurrently
+GIT_WORKERS = 8
+
+
+def is_onedep_package(name: str) -> bool:
+    return _normalize(name) in ONEDEP_NAMES
+
+
+def onedep_package_name(name: str) -> Optional[str]:
+    """Name of `name` as listed in ONEDEP_PACKAGES, e.g. 'wwpdb.io'
+    for 'WWPDB_IO'. None if it's not a OneDep package.
+    """
+    return ONEDEP_NAMES.get(_normalize(name))
+
+
+class PackageIndex:
+    """Maps normalized distribution names to their metadata directory
+    (.dist-info or .egg-info), built from a single listing of each
+    entry in `paths`. This covers regular and editable installs, as
+    the source directories of the latter are added to `sys.path`.
+
+    Unlike `metadata.distributions()`, building the index doesn't
+    read any METADATA file, which is only parsed for the packages
+    that are actually looked up.
+    """
+    def __init__(self, paths: list = None) -> None:
+        self._paths = paths
+        self._index = None
+
+    @traced("metadata", "metadata scan")
+    def _scan(self) -> dict:
+        index = {}
+
+        for entry in (self._paths if self._paths is not None else sys.path):
+            try:
+                entries = os.scandir(entry or ".")
+            except OSError:
+                continue
+
+            with entries:
+                for e in entries:
+                    if not e.name.endswith((".dist-info", ".egg-info")) or not e.is_dir():
+                        continue
+
+                    # <name>-<version>.dist-info, <name>.egg-info or <name>-<version>-<python>.egg-info
+                    name = _normalize(e.name.rsplit(".", 1)[0].split("-", 1)[0])
+                    # first match wins, as with the import system
+                    index.setdefault(name, e.path)
+
+        return index
+
+    def find(self, name: str) -> Optional[str]:
+        """Returns the metadata directory of the distribution `name`"""
+        if self._index is None:
+            self._index = self._scan()
+
+        return self._index.get(_normalize(name))
+
+    def distribution(self, name: str) -> Optional[metadata.Distribution]:
+        path = self.find(name)
+
+        if path is None:
+            return None
+
+        return metadata.Distribution.at(path)
+
+    def refresh(self) -> None:
+        """Drops the index, so it's rebuilt on the next lookup. Must be
+        called after installing packages, as the metadata directories
+        are renamed on version changes.
+        """
+        self._index = None
+
+
+_package_index = PackageIndex()
+
+
+class PackageCache:
+    """On-disk cache of package states. Each entry is stored with the
+    mtimes of the package metadata directory and of the `.git/HEAD`
+    and `.git/index` files of its source, and is only reused while
+    those are unchanged, i.e. until the package is reinstalled, checked
+    out or committed to.
+
+    Edits to the working tree that don't touch the git index are not
+    picked up, so the dirty flag of a cached branch can be stale.
+    """
+    def __init__(self, cache_file: str) -> None:
+        self._cache_file = cache_file
+        self._entries = self._load()
+        self._changed = False
+
+    def _load(self) -> dict:
+        try:
+            with open(self._cache_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _mtime(path) -> Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns
+        except (OSError, TypeError):
+            return None
+
+    def _fingerprint(self, dist_path: str, package_path: Optional[str]) -> list:
+        git_dir = os.path.join(package_path, ".git") if package_path else None
+
+        return [
+            self._mtime(dist_path),
+            self._mtime(git_dir and os.path.join(git_dir, "HEAD")),
+            self._mtime(git_dir and os.path.join(git_dir, "index")),
+        ]
+
+    def get(self, dist_path: str) -> Optional[PackageDistribution]:
+        entry = self._entries.get(dist_path)
+
+        if entry is None:
+            return None
+
+        if entry["fingerprint"] != self._fingerprint(dist_path, entry["package"]["path"]):
+            return None
+
+        return PackageDistribution(**entry["package"])
+
+    def put(self, dist_path: str, package: PackageDistribution) -> None:
+        self._entries[dist_path] = {
+            "fingerprint": self._fingerprint(dist_path, package.path),
+            "package": asdict(package),
+        }
+        self._changed = True
+
+    def save(self) -> None:
+        if not self._changed:
+            return
+
+        tmp_file = f"{self._cache_file}.tmp"
+
+        try:
+            with open(tmp_file, "w") as f:
+                json.dump(self._entries, f)
+
+            os.replace(tmp_file, self._cache_file)
+        except OSError as e:
+            # not being able to cache shouldn't break the command
+            logger.debug("Could not write package cache: %s", e)
+            return
+
+        self._changed = False
+
+
+def get_package_cache() -> PackageCache:
+    config = get_config()
+    return PackageCache(os.path.join(config.ODM_CONFIG_DIR, "packages_cache.json"))
+
+
+def get_package_index() -> PackageIndex:
+    return _package_index
+
+
+def install_package(source, version="latest", edit=False, pip_args=()):
     """
     Install a package from either a package name or a path to a repository.
 
@@ -69,27 +260,71 @@ def install_package(source, version="latest", edit=False):
         source (str): The name of the package or the path to the repository.
         version (str, optional): The version of the package to install. Defaults to "latest".
         edit (bool, optional): Whether to install the package in editable mode. Defaults to False.
+        pip_args (list, optional): Extra arguments for pip, e.g. from `Wheelhouse.pip_args`.
 
     Returns:
         bool: True if the package was installed successfully, False otherwise.
     """
 
+    _setup_logger()
+
     if version != "latest":
         source = f"{source}=={version}"
 
     try:
-        if edit:
-            result = subprocess.run(["pip", "install", "-U", "-e", source], text=True, capture_output=True)
-        else:
-            result = subprocess.run(["pip", "install", "-U", source], text=True, capture_output=True)
+        with span("pip install", "pip", source=source):
+            if edit:
+                result = subprocess.run(["pip", "install", "-U", *pip_args, "-e", source], text=True, capture_output=True)
+            else:
+                result = subprocess.run(["pip", "install", "-U", *pip_args, source], text=True, capture_output=True)
 
         logger.debug(result.stdout.strip())
         logger.debug(result.stderr.strip())
     except Exception as e:
         logger.error(e)
         return False
+    finally:
+        get_package_index().refresh()
 
-    return True
+    return result.returncode == 0
+
+
+def install_packages(targets, pip_args=()):
+    """
+    Install several packages with a single pip invocation, so the
+    dependency graph is resolved (and the index queried) only once.
+
+    Args:
+        targets (list): (source, edit) pairs, where source is the name of
+            the package or the path to the repository, and edit whether
+            to install it in editable mode.
+        pip_args (list, optional): Extra arguments for pip, e.g. from `Wheelhouse.pip_args`.
+
+    Returns:
+        bool: True if all packages were installed successfully, False otherwise.
+            As pip installs all or nothing, there's no per-package result.
+    """
+
+    _setup_logger()
+
+    command = ["pip", "install", "-U", *pip_args]
+
+    for source, edit in targets:
+        command.extend(["-e", source] if edit else [source])
+
+    try:
+        with span("pip install", "pip", packages=len(targets)):
+            result = subprocess.run(command, text=True, capture_output=True)
+
+        logger.debug(result.stdout.strip())
+        logger.debug(result.stderr.strip())
+    except Exception as e:
+        logger.error(e)
+        return False
+    finally:
+        get_package_index().refresh()
+
+    return result.returncode == 0
 
 
 def setup_pip_env(cs_user, cs_pass, cs_url):
@@ -99,6 +334,7 @@ def setup_pip_env(cs_user, cs_pass, cs_url):
     Returns:
         bool: True if the environment was setup successfully, False otherwise.
     """
+    _setup_logger()
     urlreq = urllib.parse.urlparse(cs_url)
     urlpath = "{}://{}:{}@{}{}/dist/simple/".format(urlreq.scheme, cs_user, cs_pass, urlreq.netloc, urlreq.path)
 
@@ -110,7 +346,8 @@ def setup_pip_env(cs_user, cs_pass, cs_url):
 
     try:
         for command in commands:
-            result = subprocess.run(command, text=True, capture_output=True)
+            with span("pip config", "pip"):
+                result = subprocess.run(command, text=True, capture_output=True)
 
             logger.debug(result.stdout.strip())
             logger.debug(result.stderr.strip())
@@ -158,13 +395,8 @@ def _get_distribution_path(distribution: metadata.Distribution):
     return path
 
 
-def get_package(name, branch=True):
-    try:
-        distribution = metadata.distribution(name)
-    except metadata.PackageNotFoundError:
-        return None
-    
-    package_name = distribution.metadata["Name"]
+def _to_package(distribution: metadata.Distribution, branch=True):
+    package_name = distribution.metadata["Name"] # had some issues accessing distribution.name directly
     package_version = distribution.metadata["Version"]
     package_path = _get_distribution_path(distribution)
     package_branch = _get_branch(package_path) if branch else None
@@ -173,30 +405,116 @@ def get_package(name, branch=True):
     return PackageDistribution(name=package_name, version=package_version, path=package_path, branch=package_branch, editable=package_editable)
 
 
-def get_wwpdb_packages(name="wwpdb", branch=True):
-    distributions = metadata.distributions()
+def get_package(name, branch=True):
+    distribution = get_package_index().distribution(name)
+
+    if distribution is None:
+        return None
+
+    return _to_package(distribution, branch=branch)
+
+
+def get_wwpdb_packages(name="wwpdb", branch=True, cache: PackageCache = None, dirty=True, workers=GIT_WORKERS):
+    """Yields the installed OneDep packages whose names contain `name`.
+
+    Branches are resolved concurrently, in up to `workers` threads, and
+    packages are yielded as soon as their branch is known, so the order
+    is not guaranteed. If `dirty` is False, branches are read straight
+    from `.git/HEAD` and no dirty check is made.
+
+    If `cache` is given, packages whose metadata and git state didn't
+    change since they were cached are not inspected again. The cache
+    only holds packages with their full branch state, so it's ignored
+    when `branch` or `dirty` are False.
+    """
+    index = get_package_index()
+    cache = cache if branch and dirty else None
+    missing = []
+
+    try:
+        for package_name in ONEDEP_PACKAGES:
+            if name not in package_name:
+                continue
+
+            dist_path = index.find(package_name)
+
+            if dist_path is None:
+                continue
+
+            package = cache.get(dist_path) if cache else None
+
+            if package is not None:
+                yield package
+                continue
+
+            package = _to_package(metadata.Distribution.at(dist_path), branch=False)
+
+            if not branch:
+                yield package
+                continue
 
-    for distribution in distributions:
-        package_name = distribution.metadata["Name"] # had some issues accessing distribution.name directly
+            missing.append((dist_path, package))
 
-        if package_name not in ONEDEP_PACKAGES:
-            continue
+        for dist_path, package in _with_branches(missing, dirty=dirty, workers=workers):
+            if cache:
+                cache.put(dist_path, package)
 
-        if name not in package_name:
-            continue
+            yield package
+    finally:
+        if cache:
+            cache.save()
 
-        package_version = distribution.metadata["Version"]
-        package_path = _get_distribution_path(distribution)
-        package_branch = _get_branch(package_path) if branch else None
-        package_editable = _is_editable(distribution)
 
-        yield PackageDistribution(name=package_name, version=package_version, path=package_path, branch=package_branch, editable=package_editable)
+def _with_branches(packages: list, dirty=True, workers=GIT_WORKERS):
+    """Resolves the branches of (dist_path, package) pairs concurrently
+    and yields each pair as soon as its branch is set.
+    """
+    if not packages:
+        return
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(packages))) as executor:
+        futures = {executor.submit(_get_branch, p.path, dirty): (d, p) for d, p in packages}
 
+        for future in as_completed(futures):
+            dist_path, package = futures[future]
+            package.branch = future.result()
+            yield dist_path, package
 
-def _get_branch(path):
+
+def _read_head(path):
+    """Reads the current branch from `.git/HEAD` without calling git.
+    Returns 'HEAD' for detached heads, like `_get_branch`.
+    """
     if path is None:
         return None
 
+    git_dir = os.path.join(path, ".git")
+
+    try:
+        if os.path.isfile(git_dir):
+            # worktrees and submodules point to the actual git dir
+            with open(git_dir) as f:
+                git_dir = os.path.join(path, f.read().strip().split("gitdir:", 1)[1].strip())
+
+        with open(os.path.join(git_dir, "HEAD")) as f:
+            head = f.read().strip()
+    except (OSError, IndexError):
+        return None
+
+    if head.startswith("ref: refs/heads/"):
+        return head[len("ref: refs/heads/"):]
+
+    return "HEAD"
+
+
+@traced("git", "git branch")
+def _get_branch(path, dirty=True):
+    if path is None:
+        return None
+
+    if not dirty:
+        return _read_head(path)
+
     try:
         repo = git.Repo(path)
         is_dirty = "*" if repo.is_dirty() else ""
@@ -207,6 +525,7 @@ def _get_branch(path):
         return None
 
 
+@traced("git", "git checkout")
 def switch_reference(package: PackageDistribution, reference="master"):
     try:
         repo = git.Repo(package.path)
@@ -217,6 +536,7 @@ def switch_reference(package: PackageDistribution, reference="master"):
     return True
 
 
+@traced("git", "git pull")
 def pull(package: PackageDistribution):
     try:
         repo = git.Repo(package.path)
@@ -227,8 +547,9 @@ def pull(package: PackageDistribution):
     return True
 
 
+@traced("git", "git clone")
 def clone(package_name: str, reference="develop"):
-    config = Config()
+    config = get_config()
     source_dir = os.path.join(config.from_site("SITE_DEPLOY_PATH"), "source")
 
     if not os.path.exists(source_dir):
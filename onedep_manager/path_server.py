@@ -0,0 +1,175 @@
+import os
+import sys
+import stat
+import signal
+import socket
+import logging
+import time
+import tempfile
+import threading
+import socketserver
+from typing import Optional
+
+from onedep_manager.config import get_config
+from onedep_manager.paths import PathResolver, TEMPLATE_SHAPES
+from onedep_manager.snapshot import fingerprint
+
+from wwpdb.utils.config.ConfigInfo import getSiteId
+
+
+logger = logging.getLogger(__name__)
+
+
+def default_socket_path(site: Optional[str] = None) -> str:
+    """Socket of the path server of a site. Per user, so servers of
+    different users don't answer each other.
+    """
+    if os.getenv("ODM_PATH_SOCKET"):
+        return os.environ["ODM_PATH_SOCKET"]
+
+    run_dir = os.getenv("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(run_dir, f"onedep-paths-{os.getuid()}-{(site or getSiteId()).lower()}.sock")
+
+
+class PathRequestHandler(socketserver.StreamRequestHandler):
+    """Answers `<type> <identifier>` lines with `OK <path>` or
+    `ERR <message>` lines, until the client closes its side.
+    """
+    def handle(self):
+        for line in self.rfile:
+            line = line.decode("utf-8").strip()
+
+            if not line:
+                continue
+
+            try:
+                request = line.split(None, 1)
+
+                if len(request) != 2:
+                    raise ValueError("Expected '<type> <identifier>'")
+
+                type_, identifier = request[0], request[1].strip()
+                path = self.server.get_resolver().resolve(type_, identifier)
+
+                if path is None:
+                    raise ValueError(f"No path for {identifier}")
+
+                reply = f"OK {path}"
+            except Exception as e:
+                reply = f"ERR {str(e) or e.__class__.__name__}"
+
+            self.wfile.write(f"{reply}\n".encode("utf-8"))
+            self.wfile.flush()
+
+
+def remove_stale_socket(socket_path: str) -> None:
+    """Removes the socket left behind by a server that didn't shut down
+    cleanly. Anything else at `socket_path`, including the socket of a
+    server still listening on it, is left alone.
+
+    Raises:
+        FileExistsError: if `socket_path` exists and is not a stale
+            socket.
+    """
+    try:
+        mode = os.stat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{socket_path} exists and is not a socket")
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(socket_path)
+        except ConnectionRefusedError:
+            os.remove(socket_path)
+            return
+
+    raise FileExistsError(f"A path server is already listening on {socket_path}")
+
+
+class PathServer(socketserver.ThreadingUnixStreamServer):
+    """Resident process that resolves paths for the shell helpers, so a
+    lookup costs a round trip on a Unix socket instead of starting the
+    interpreter and loading the site config and locators.
+
+    The resolver it makes is rebuilt, along with the site config and
+    the package index, when the fingerprint of the site config sources
+    changes. A `resolver` that is passed in is kept as it is.
+    """
+    daemon_threads = True
+    # seconds between checks of the site config fingerprint
+    reload_interval = 1.0
+
+    def __init__(self, socket_path: str, resolver: Optional[PathResolver] = None, site: Optional[str] = None) -> None:
+        self.socket_path = socket_path
+        self.site = site
+        self.resolver = resolver or PathResolver(site=site)
+        self._reloads = resolver is None
+        self._reload_lock = threading.Lock()
+        self._fingerprint = fingerprint(site) if self._reloads else None
+        self._checked = time.monotonic()
+
+        remove_stale_socket(socket_path)
+        # only the owner may connect, from the moment the socket exists
+        umask = os.umask(0o077)
+
+        try:
+            super().__init__(socket_path, PathRequestHandler)
+        finally:
+            os.umask(umask)
+
+    def get_resolver(self) -> PathResolver:
+        """Returns the resolver, rebuilt first if the site config changed
+        since it was made. Checked at most every `reload_interval`.
+        """
+        if not self._reloads or time.monotonic() - self._checked < self.reload_interval:
+            return self.resolver
+
+        with self._reload_lock:
+            self._checked = time.monotonic()
+            fp = fingerprint(self.site)
+
+            if fp != self._fingerprint:
+                from onedep_manager.packages import get_package_index
+
+                logger.info("Site config changed, reloading the path resolver")
+                get_config().reload()
+                get_package_index().refresh()
+                self.resolver = PathResolver(site=self.site)
+                self._fingerprint = fp
+
+        return self.resolver
+
+    def warm_up(self):
+        """Builds the locators, path templates and package index before
+        the first request needs them.
+        """
+        from onedep_manager.packages import get_package_index
+
+        for type_, shape, _, _ in TEMPLATE_SHAPES:
+            self.resolver.templates.get(type_, shape)
+
+        self.resolver.pathinfo
+        self.resolver.ccdpathinfo
+        get_package_index().find("wwpdb.utils.config")
+
+    def server_close(self):
+        super().server_close()
+
+        try:
+            os.remove(self.socket_path)
+        except OSError:
+            pass
+
+
+def serve(socket_path: Optional[str] = None, site: Optional[str] = None):
+    server = PathServer(socket_path or default_socket_path(site), site=site)
+    server.warm_up()
+    logger.info("onedep-manager path server listening on %s", server.socket_path)
+    # exit through `with` on SIGTERM too, so the socket is removed
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+
+    with server:
+        server.serve_forever()
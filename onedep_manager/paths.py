@@ -0,0 +1,321 @@
+import os
+import re
+import sys
+import json
+import logging
+from typing import Callable, Optional, Tuple
+
+from onedep_manager.config import Config, get_config
+from onedep_manager.snapshot import fingerprint
+
+from wwpdb.io.locator.PathInfo import PathInfo
+from wwpdb.io.locator.ChemRefPathInfo import ChemRefPathInfo
+
+
+logger = logging.getLogger(__name__)
+
+PATH_TYPES = ('tempdep', 'deposit', 'archive', 'upload', 'pickles', 'wfinst', 'session', 'ccid', 'package', 'wfxml')
+
+# Identifier shapes that share a path layout, for the types resolved by
+# the wwpdb locators: (type, shape, pattern, sentinels). Templates are
+# derived from the first sentinel and checked against the second one.
+# Sentinels mix cases and use distinct characters, so upper-casing and
+# hashing (e.g. the first letter of a CCD id) can be told apart.
+TEMPLATE_SHAPES = (
+    ('tempdep', 'dep', r'D_\d+', ('d_8000000017', 'D_8100000023')),
+    ('deposit', 'dep', r'D_\d+', ('d_8000000017', 'D_8100000023')),
+    ('archive', 'dep', r'D_\d+', ('d_8000000017', 'D_8100000023')),
+    ('wfinst', 'dep', r'D_\d+:W_\d+', ('d_8000000017:w_917', 'D_8100000023:W_002')),
+    ('ccid', 'cc', r'[A-Z0-9]{1,3}', ('xq7', 'K4M')),
+    ('ccid', 'cc_ext', r'[A-Z0-9]{4,5}', ('xq7k9', 'A1B2')),
+    ('ccid', 'prdcc', r'PRDCC_\d+', ('prdcc_800017', 'PRDCC_000042')),
+    ('ccid', 'prd', r'PRD_\d+', ('prd_800017', 'PRD_000042')),
+    ('ccid', 'family', r'FAM_\d+', ('fam_800017', 'FAM_000042')),
+)
+
+_SHAPE_PATTERNS = [(t, shape, re.compile(pattern, re.IGNORECASE)) for t, shape, pattern, _ in TEMPLATE_SHAPES]
+
+
+def _template_fields(identifier: str) -> dict:
+    """Values a template can use: each ':' separated part as given
+    (p0, p1...) and upper-cased (P0, P1...), and the first letter,
+    last letter and last two letters of the upper-cased first part.
+    """
+    parts = identifier.split(":")
+    fields = {}
+
+    for i, part in enumerate(parts):
+        fields[f"p{i}"] = part
+        fields[f"P{i}"] = part.upper()
+
+    head = parts[0].upper()
+    fields.update(first=head[:1], last=head[-1:], last2=head[-2:])
+
+    return fields
+
+
+def derive_template(sentinel: str, path: str) -> str:
+    """Turns the path of a sentinel identifier into a format string, by
+    replacing the parts of the path that came from the identifier.
+    """
+    fields = _template_fields(sentinel)
+    parts = [(k, v) for k, v in fields.items() if k[0] in "pP"]
+    # longest first, so 'D_1:W_2' parts don't shadow each other
+    parts.sort(key=lambda kv: len(kv[1]), reverse=True)
+    components = []
+
+    for component in path.split("/"):
+        component = component.replace("{", "{{").replace("}", "}}")
+        matched = False
+
+        for key, value in parts:
+            if value in component:
+                component = component.replace(value, f"{{{key}}}")
+                matched = True
+
+        if not matched:
+            for key in ("first", "last", "last2"):
+                if component == fields[key]:
+                    component = f"{{{key}}}"
+                    break
+
+        components.append(component)
+
+    return "/".join(components)
+
+
+def template_shape(type_: str, identifier: str) -> Optional[str]:
+    for t, shape, pattern in _SHAPE_PATTERNS:
+        if t == type_ and pattern.fullmatch(identifier):
+            return shape
+
+    return None
+
+
+def templates_cache_path(site: Optional[str] = None) -> Optional[str]:
+    """Where derived templates are kept, next to the site config
+    snapshot, so other processes don't have to derive them again.
+    """
+    top_dir = os.getenv("TOP_WWPDB_SITE_CONFIG_DIR")
+
+    if not top_dir:
+        return None
+
+    from wwpdb.utils.config.ConfigInfo import getSiteId
+
+    return os.path.join(top_dir, "odm", f"path_templates_{(site or getSiteId()).lower()}.json")
+
+
+def _templates_fingerprint(site: Optional[str] = None) -> str:
+    """Templates depend on the site config and on the locators code"""
+    stamps = [fingerprint(site).hex()]
+
+    for cls in (PathInfo, ChemRefPathInfo):
+        try:
+            st = os.stat(sys.modules[cls.__module__].__file__)
+            stamps.append(f"{st.st_mtime_ns}:{st.st_size}")
+        except (KeyError, OSError, TypeError):
+            stamps.append("-")
+
+    return "/".join(stamps)
+
+
+class PathTemplates:
+    """Format strings for the paths the wwpdb locators compute, derived
+    once per identifier shape by asking the locators (through `locate`)
+    for sentinel identifiers, and kept in `cache_file` for as long as
+    `stamp` doesn't change. A template is only kept if it reproduces
+    the locator's path for a second sentinel; shapes without a template
+    are left to the locators.
+    """
+    def __init__(self, locate: Callable[[str, str], Optional[str]], cache_file: Optional[str] = None, stamp: str = "") -> None:
+        self._locate = locate
+        self._cache_file = cache_file
+        self._stamp = stamp
+        self._templates = None
+
+    def _load(self) -> Optional[dict]:
+        if self._cache_file is None:
+            return None
+
+        try:
+            with open(self._cache_file) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if cached.get("stamp") != self._stamp:
+            return None
+
+        return cached.get("templates")
+
+    def _save(self) -> None:
+        if self._cache_file is None:
+            return
+
+        tmp_file = f"{self._cache_file}.{os.getpid()}.tmp"
+
+        try:
+            os.makedirs(os.path.dirname(self._cache_file), exist_ok=True)
+
+            with open(tmp_file, "w") as f:
+                json.dump({"stamp": self._stamp, "templates": self._templates}, f, indent=2)
+
+            os.replace(tmp_file, self._cache_file)
+        except OSError as e:
+            logger.debug("Could not write path templates to %s: %s", self._cache_file, e)
+
+    def _derive(self, type_: str, shape: str) -> Optional[str]:
+        sentinel, check = next(sentinels for t, sh, _, sentinels in TEMPLATE_SHAPES if t == type_ and sh == shape)
+
+        try:
+            template = derive_template(sentinel, self._locate(type_, sentinel))
+        except Exception as e:
+            logger.debug("Could not derive a template for %s/%s: %s", type_, shape, e)
+            return None
+
+        if template.format(**_template_fields(check)) != self._locate(type_, check):
+            logger.debug("Template %s for %s/%s doesn't match the locator, not using it", template, type_, shape)
+            return None
+
+        return template
+
+    def get(self, type_: str, shape: str) -> Optional[str]:
+        """Returns the template of a shape, deriving it on first use.
+        Shapes without a template are remembered as None.
+        """
+        if self._templates is None:
+            self._templates = self._load() or {}
+
+        key = f"{type_}/{shape}"
+
+        if key not in self._templates:
+            self._templates[key] = self._derive(type_, shape)
+            self._save()
+
+        return self._templates[key]
+
+    def render(self, type_: str, identifier: str) -> Optional[str]:
+        """Returns the path of `identifier`, or None if there is no
+        template for its shape.
+        """
+        shape = template_shape(type_, identifier)
+
+        if shape is None:
+            return None
+
+        template = self.get(type_, shape)
+
+        if template is None:
+            return None
+
+        return template.format(**_template_fields(identifier))
+
+
+class PathResolver:
+    """Resolves OneDep paths by type and identifier. Paths computed by
+    the wwpdb locators come from PathTemplates when possible; otherwise
+    the locators are only built when a type needs them, and then reused
+    for every identifier, so resolving many paths costs a single setup.
+    """
+    def __init__(self, config: Optional[Config] = None, site: Optional[str] = None, templates: bool = True) -> None:
+        self._config = config
+        self._site = site
+        self._pathinfo = None
+        self._ccdpathinfo = None
+        self._templates = None
+        self._use_templates = templates
+
+    @property
+    def config(self) -> Config:
+        if self._config is None:
+            self._config = get_config()
+        return self._config
+
+    @property
+    def pathinfo(self) -> PathInfo:
+        if self._pathinfo is None:
+            self._pathinfo = PathInfo(siteId=self._site)
+        return self._pathinfo
+
+    @property
+    def ccdpathinfo(self) -> ChemRefPathInfo:
+        if self._ccdpathinfo is None:
+            self._ccdpathinfo = ChemRefPathInfo(siteId=self._site)
+        return self._ccdpathinfo
+
+    @property
+    def templates(self) -> PathTemplates:
+        if self._templates is None:
+            self._templates = PathTemplates(self._locate, cache_file=templates_cache_path(self._site), stamp=_templates_fingerprint(self._site))
+        return self._templates
+
+    def resolve(self, type_: str, identifier: str) -> str:
+        """Returns the path of `identifier`.
+
+        Raises:
+            ValueError: if `type_` is not one of PATH_TYPES or the
+                identifier is not valid for it.
+        """
+        if type_ not in PATH_TYPES:
+            raise ValueError(f"Invalid path type: {type_}")
+
+        if self._use_templates:
+            path = self.templates.render(type_, identifier)
+
+            if path is not None:
+                return path
+
+        return self._locate(type_, identifier)
+
+    def _locate(self, type_: str, identifier: str) -> str:
+        if type_ == 'tempdep':
+            return self.pathinfo.getTempDepPath(dataSetId=identifier)
+        elif type_ == 'deposit':
+            return self.pathinfo.getDepositPath(dataSetId=identifier)
+        elif type_ == 'archive':
+            return self.pathinfo.getArchivePath(dataSetId=identifier)
+        elif type_ == 'upload':
+            deposit_path = self.config.from_site("SITE_ARCHIVE_STORAGE_PATH")
+            return os.path.join(deposit_path, "deposit", "temp_files", "deposition_uploads", identifier)
+        elif type_ == 'pickles':
+            deposit_path = self.config.from_site("SITE_ARCHIVE_STORAGE_PATH")
+            return os.path.join(deposit_path, "deposit", "temp_files", "deposition-v-200", identifier)
+        elif type_ == 'wfinst':
+            if identifier.count(":") != 1:
+                raise ValueError(f"Invalid workflow instance: {identifier}, expected DEP_ID:WF_INSTANCE_ID")
+
+            dep_id, wf_instance = identifier.split(":")
+            return self.pathinfo.getInstancePath(dataSetId=dep_id, wfInstanceId=wf_instance)
+        elif type_ == 'session':
+            return os.path.join(self.config.from_site("SITE_WEB_APPS_SESSIONS_PATH"), identifier)
+        elif type_ == 'ccid':
+            return self.ccdpathinfo.getFilePath(idCode=identifier)
+        elif type_ == 'package':
+            # imported here to keep GitPython out of the other path lookups
+            from onedep_manager.packages import get_package
+
+            package = get_package(identifier)
+
+            if package is None:
+                raise ValueError(f"Package not found: {identifier}")
+
+            return package.path
+        elif type_ == 'wfxml':
+            return os.path.join(self.config.from_site("SITE_WF_XML_PATH"), f"{identifier}.xml")
+
+        raise ValueError(f"Invalid path type: {type_}")
+
+
+def parse_entry(entry: str, default_type: Optional[str] = None) -> Tuple[Optional[str], str]:
+    """Splits a batch entry into (type, identifier). Entries may carry
+    their own type, as in 'deposit:D_1000'; otherwise `default_type` is
+    used. Workflow instances keep their colon ('wfinst:D_1000:W_001').
+    """
+    entry = entry.strip()
+    prefix, sep, rest = entry.partition(":")
+
+    if sep and prefix in PATH_TYPES:
+        return prefix, rest
+
+    return default_type, entry
@@ -7,6 +7,8 @@ class Service:
     description: str
     handler: str
     hosts: list
+    # names of the services that must be up before this one starts
+    depends_on: list = field(default_factory=list)
 
 
 @dataclass
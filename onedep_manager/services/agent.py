@@ -0,0 +1,113 @@
+import hmac
+import socket
+import logging
+import argparse
+import socketserver
+
+from onedep_manager.config import Config, get_config
+from onedep_manager.services.dispatcher import LocalDispatcher
+from onedep_manager.services.schemas import Status, Commands, InstanceStatus
+from onedep_manager.services.handlers import format_reply, format_replies
+
+
+logger = logging.getLogger(__name__)
+
+
+class AgentRequestHandler(socketserver.StreamRequestHandler):
+    """Handles one request per connection: a `<token> <command>
+    <service>` line, answered with a line holding the resulting status
+    (and the time to ready, see `format_reply`). Requests can name
+    several services, which are answered with `<service>=<status>`
+    pairs. Requests without the agent token are answered as failed.
+    """
+    def handle(self):
+        token, _, line = self.rfile.readline().decode("utf-8").strip().partition(" ")
+
+        if not self.server.authorized(token):
+            logger.warning("Rejected a request from %s without the agent token", self.client_address)
+            self.wfile.write(f"{format_reply(Status.FAILED)}\n".encode("utf-8"))
+            return
+
+        try:
+            command, *services = line.split()
+
+            if not services:
+                raise ValueError("No service given")
+
+            if len(services) == 1:
+                result = self.server.dispatch(Commands(command), services[0])
+                reply = format_reply(result.status, result.ready_time)
+            else:
+                reply = format_replies({service: self.server.dispatch_status(Commands(command), service) for service in services})
+        except Exception as e:
+            logger.error("Could not handle request '%s': %s", line, e)
+            reply = format_reply(Status.FAILED)
+
+        self.wfile.write(f"{reply}\n".encode("utf-8"))
+
+
+class AgentServer(socketserver.ThreadingTCPServer):
+    """Resident process that serves service commands for the current
+    host. Handlers of all services in the config are imported once at
+    startup and their instances reused, so requests don't pay for
+    interpreter startup, config loading and handler imports.
+
+    The agent only listens on localhost; remote dispatchers reach it
+    through their SSH connection. As any local user can connect to it,
+    requests must start with the `agent_token` of the config.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, config: Config, port: int = None, host: str = "127.0.0.1") -> None:
+        self._config = config
+        self._token = config.get_agent_token()
+
+        if not self._token:
+            raise ValueError("Set 'agent_token' in the config to run the agent")
+
+        # resolves the handlers of all services
+        self._dispatcher = LocalDispatcher(config=config)
+
+        if port is None:
+            port = config.get_agent_port()
+
+        super().__init__((host, port), AgentRequestHandler)
+
+    def authorized(self, token: str) -> bool:
+        return hmac.compare_digest(token.encode("utf-8"), self._token.encode("utf-8"))
+
+    def dispatch(self, command: Commands, service: str) -> InstanceStatus:
+        actions = {
+            Commands.START: self._dispatcher.start_service,
+            Commands.STOP: self._dispatcher.stop_service,
+            Commands.RESTART: self._dispatcher.restart_service,
+            Commands.STATUS: self._dispatcher.get_status,
+        }
+
+        return actions[command](service)[0]
+
+    def dispatch_status(self, command: Commands, service: str) -> Status:
+        """Like `dispatch`, but reports unknown services as failed"""
+        try:
+            return self.dispatch(command, service).status
+        except Exception as e:
+            logger.error("Could not run '%s' for %s: %s", command, service, e)
+            return Status.FAILED
+
+
+def serve(port: int = None):
+    server = AgentServer(config=get_config(), port=port)
+    logger.info("onedep-manager agent listening on %s:%s (%s)", *server.server_address, socket.gethostname())
+
+    with server:
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="onedep-manager service agent")
+    parser.add_argument("-p", "--port", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    serve(port=args.port)
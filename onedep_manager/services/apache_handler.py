@@ -1,25 +1,38 @@
+import os
 import time
-import psutil
 import subprocess
 
-from onedep_manager.services.handlers import Handler, Parser
+from onedep_manager.services.handlers import Handler, Parser, PidProbe
 from onedep_manager.services.schemas import Status
 from wwpdb.utils.config.ConfigInfo import ConfigInfo
 
 
 class ApacheHandler(Handler):
+    # where httpd-opt setups write the PID file, relative to apache_config
+    PID_FILES = ("httpd.pid", "logs/httpd.pid", "run/httpd.pid")
+
     def __init__(self) -> None:
         self.config = ConfigInfo()
 
+    def probes(self):
+        apache_config = os.path.join(self.config.get("TOP_WWPDB_SITE_CONFIG_DIR"), "apache_config")
+        return [PidProbe("httpd", pid_files=[os.path.join(apache_config, f) for f in self.PID_FILES])]
+
     def start(self):
         site_config_dir = self.config.get("TOP_WWPDB_SITE_CONFIG_DIR")
+        started = time.monotonic()
 
         try:
             subprocess.run([f"{site_config_dir}/apache_config/httpd-opt", "start"], check=True, stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
         except subprocess.CalledProcessError as e:
             return Status.FAILED
 
-        return self.status()
+        ready_time = self.wait_ready(since=started)
+
+        if ready_time is None:
+            return Status.FAILED
+
+        return Status.RUNNING, ready_time
 
     def stop(self):
         try:
@@ -27,21 +40,22 @@ class ApacheHandler(Handler):
         except subprocess.CalledProcessError as e:
             return Status.FAILED
 
-        return self.status()
+        if not self.wait_stopped():
+            return Status.FAILED
+
+        return Status.STOPPED
 
     def restart(self):
         self.stop()
-        time.sleep(1) # needed this
         return self.start()
 
     def status(self):
-        for proc in psutil.process_iter(['pid', 'name', 'username']):
-            if proc.info['name'] == 'httpd':
-                return Status.RUNNING
+        if self.is_ready():
+            return Status.RUNNING
 
         return Status.STOPPED
 
 
 if __name__ == "__main__":
     handler = ApacheHandler()
-    print(Parser(handler=handler).run())
+    Parser(handler=handler).main()
@@ -0,0 +1,137 @@
+import time
+import atexit
+import logging
+import threading
+
+from typing import Dict, Optional, Tuple
+from paramiko.channel import Channel
+from paramiko.client import SSHClient, MissingHostKeyPolicy
+from paramiko.ssh_exception import SSHException
+
+from onedep_manager.tracing import span
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """Keeps one authenticated SSH connection per host and reuses
+    it for every command sent to that host. Each command runs on its
+    own channel over the shared transport, so concurrent commands to
+    the same host don't need extra handshakes.
+
+    Connections unused for `idle_timeout` seconds, or whose transport
+    died, are closed and replaced on the next request.
+    """
+    def __init__(self, idle_timeout: float = 300, keepalive: int = 30, connect_timeout: float = 10, host_key_policy: Optional[MissingHostKeyPolicy] = None, **connect_kwargs) -> None:
+        self._idle_timeout = idle_timeout
+        self._keepalive = keepalive
+        self._connect_timeout = connect_timeout
+        self._host_key_policy = host_key_policy
+        self._connect_kwargs = connect_kwargs
+        self._clients: Dict[str, Tuple[SSHClient, float]] = {}
+        self._host_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _host_lock(self, host: str) -> threading.Lock:
+        with self._lock:
+            return self._host_locks.setdefault(host, threading.Lock())
+
+    def _connect(self, host: str) -> SSHClient:
+        client = SSHClient()
+        client.load_system_host_keys()
+
+        if self._host_key_policy is not None:
+            client.set_missing_host_key_policy(self._host_key_policy)
+
+        try:
+            with span("ssh connect", "ssh", host=host):
+                client.connect(host, timeout=self._connect_timeout, **self._connect_kwargs)
+        except:
+            client.close()
+            raise
+
+        client.get_transport().set_keepalive(self._keepalive)
+        logger.debug("Opened SSH connection to %s", host)
+
+        return client
+
+    @staticmethod
+    def _is_alive(client: SSHClient) -> bool:
+        transport = client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def get(self, host: str) -> SSHClient:
+        """Returns a connected client for `host`, opening a new
+        connection only if there is no live one in the pool.
+        """
+        self.evict_idle()
+
+        with self._host_lock(host):
+            with self._lock:
+                entry = self._clients.get(host)
+
+            if entry is not None and self._is_alive(entry[0]):
+                client = entry[0]
+            else:
+                if entry is not None:
+                    logger.debug("Dropping broken SSH connection to %s", host)
+                    entry[0].close()
+
+                client = self._connect(host)
+
+            with self._lock:
+                self._clients[host] = (client, time.monotonic())
+
+        return client
+
+    def exec_command(self, host: str, command: str, environment: Optional[dict] = None, timeout: Optional[float] = None) -> str:
+        """Runs `command` on `host` and returns its stripped standard output."""
+        client = self.get(host)
+
+        try:
+            with span("ssh exec", "ssh", host=host):
+                stdin, stdout, stderr = client.exec_command(command, environment=environment, timeout=timeout)
+                return stdout.read().decode("utf-8").strip()
+        except SSHException:
+            self.discard(host)
+            raise
+
+    def open_tunnel(self, host: str, port: int, timeout: Optional[float] = None) -> Channel:
+        """Opens a channel to `port` on the loopback interface of `host`,
+        forwarded through the pooled connection. Raises ChannelException
+        if nothing is listening there.
+        """
+        client = self.get(host)
+        channel = client.get_transport().open_channel("direct-tcpip", ("127.0.0.1", port), ("127.0.0.1", 0), timeout=timeout)
+        channel.settimeout(timeout)
+
+        return channel
+
+    def discard(self, host: str) -> None:
+        with self._lock:
+            entry = self._clients.pop(host, None)
+
+        if entry is not None:
+            entry[0].close()
+
+    def evict_idle(self) -> None:
+        now = time.monotonic()
+
+        with self._lock:
+            idle = [h for h, (_, last_used) in self._clients.items() if now - last_used >= self._idle_timeout]
+
+        for host in idle:
+            logger.debug("Closing idle SSH connection to %s", host)
+            self.discard(host)
+
+    def close(self) -> None:
+        with self._lock:
+            hosts = list(self._clients)
+
+        for host in hosts:
+            self.discard(host)
+
+
+default_pool = ConnectionPool()
+atexit.register(default_pool.close)
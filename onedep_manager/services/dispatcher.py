@@ -1,31 +1,66 @@
+import math
+import time
+import shlex
 import socket
 import logging
-import importlib
 
 from abc import ABC
-from typing import List
-from paramiko.client import SSHClient
-from paramiko.ssh_exception import SSHException, AuthenticationException
+from typing import Callable, Dict, List, Optional, Union
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from paramiko.ssh_exception import SSHException, AuthenticationException, ChannelException
 
 from onedep_manager.config import Config
+from onedep_manager.schemas import Service
+from onedep_manager.tracing import span
+from onedep_manager.services.connections import ConnectionPool, default_pool
 from onedep_manager.services.schemas import Status, InstanceStatus, Commands
+from onedep_manager.services.handlers import Handler, HandlerRegistry, default_registry, parse_reply, parse_replies
 
-from wwpdb.utils.config.ConfigInfo import ConfigInfo, getSiteId
+from wwpdb.utils.config.ConfigInfo import getSiteId
 
 
 logger = logging.getLogger(__name__)
 paramiko_logger = logging.getLogger("paramiko")
 paramiko_logger.setLevel(logging.ERROR)
 
+StatusCallback = Callable[[InstanceStatus], None]
+# host -> service -> status
+StatusMatrix = Dict[str, Dict[str, InstanceStatus]]
+
+
+def batch_size(batch: Union[int, str], hosts: int) -> int:
+    """Number of hosts per batch, from a count (e.g. 2) or a percentage
+    of `hosts` (e.g. '25%'). Always at least one host.
+
+    Raises:
+        ValueError: if `batch` is not a positive count or percentage.
+    """
+    text = str(batch).strip()
+
+    if text.endswith("%"):
+        percent = float(text[:-1])
+
+        if not 0 < percent <= 100:
+            raise ValueError(f"Invalid batch size: {batch}, expected a percentage between 0 and 100")
+
+        return max(1, math.ceil(hosts * percent / 100))
+
+    size = int(text)
+
+    if size < 1:
+        raise ValueError(f"Invalid batch size: {batch}, expected a positive number of hosts")
+
+    return size
+
 
 class Dispatcher(ABC):
     def __init__(self, config: Config) -> None:
         super().__init__()
 
-    def start_service(self, service: str) -> InstanceStatus:
+    def start_service(self, service: str, on_status: Optional[StatusCallback] = None) -> List[InstanceStatus]:
         raise NotImplementedError()
 
-    def stop_service(self, service: str) -> InstanceStatus:
+    def stop_service(self, service: str, on_status: Optional[StatusCallback] = None) -> List[InstanceStatus]:
         raise NotImplementedError()
 
 
@@ -34,68 +69,68 @@ class LocalDispatcher(Dispatcher):
     responsible for starting processes. It just calls
     the registered handler, which will then start the
     service in its current host.
+
+    Handlers are taken from `handlers`, which defaults to a registry
+    shared by the whole process, and are loaded when a service is
+    first asked for, as hosts only have the modules of the services
+    they run.
     """
-    def __init__(self, config: Config) -> None:
+    def __init__(self, config: Config, handlers: Optional[HandlerRegistry] = None) -> None:
         self._config = config
         self._hostname = socket.gethostname()
+        self._handlers = handlers or default_registry
     
-    def _get_handler(self, handler: str) -> None:
-        module, klass = handler.rsplit(".", 1)
-
+    def _get_handler(self, service: Service) -> type:
         try:
-            mod = importlib.import_module(module)
-            handler = getattr(mod, klass)
-            return handler
+            return self._handlers.resolve(service.handler)
         except Exception as e:
-            raise Exception(f"Could not load handler {handler}: {e}")
+            logger.warning("Handler of %s can't be used: %s", service.name, e)
+            raise
 
-    def start_service(self, service: str) -> List[InstanceStatus]:
+    def _run_handler(self, service: str, command: Commands, on_status: Optional[StatusCallback] = None) -> List[InstanceStatus]:
         serv = self._config.get_service(service)
-        handler = self._get_handler(serv.handler)
-        status = Status.UNKNOWN
-        
+        self._get_handler(serv)
+        start = time.monotonic()
+        ready_time = None
+
         try:
-            status = handler().start()
+            with span(f"{command} {service}", "handler"):
+                status, ready_time = self._handlers.run(serv.handler, command)
         except:
-            return [InstanceStatus(hostname=self._hostname, status=Status.FAILED)]
-        
-        return [InstanceStatus(hostname=self._hostname, status=status)]
+            status = Status.FAILED
 
-    def stop_service(self, service: str) -> InstanceStatus:
-        serv = self._config.get_service(service)
-        handler = self._get_handler(serv.handler)
-        status = Status.UNKNOWN
+        result = InstanceStatus(hostname=self._hostname, status=status, latency=time.monotonic() - start, ready_time=ready_time)
 
-        try:
-            status = handler().stop()
-        except:
-            return [InstanceStatus(hostname=self._hostname, status=Status.FAILED)]
-        
-        return [InstanceStatus(hostname=self._hostname, status=status)]
+        if on_status:
+            on_status(result)
 
-    def restart_service(self, service: str) -> InstanceStatus:
-        serv = self._config.get_service(service)
-        handler = self._get_handler(serv.handler)
-        status = Status.UNKNOWN
+        return [result]
 
-        try:
-            status = handler().restart()
-        except:
-            return [InstanceStatus(hostname=self._hostname, status=Status.FAILED)]
-        
-        return [InstanceStatus(hostname=self._hostname, status=status)]
+    def start_service(self, service: str, on_status: Optional[StatusCallback] = None) -> List[InstanceStatus]:
+        return self._run_handler(service, Commands.START, on_status)
 
-    def get_status(self, service: str) -> InstanceStatus:
-        serv = self._config.get_service(service)
-        handler = self._get_handler(serv.handler)
-        status = Status.UNKNOWN
-        
-        try:
-            status = handler().status()
-        except:
-            return [InstanceStatus(hostname=self._hostname, status=Status.FAILED)]
-        
-        return [InstanceStatus(hostname=self._hostname, status=status)]
+    def stop_service(self, service: str, on_status: Optional[StatusCallback] = None) -> List[InstanceStatus]:
+        return self._run_handler(service, Commands.STOP, on_status)
+
+    def restart_service(self, service: str, on_status: Optional[StatusCallback] = None) -> List[InstanceStatus]:
+        return self._run_handler(service, Commands.RESTART, on_status)
+
+    def get_status(self, service: str, on_status: Optional[StatusCallback] = None) -> List[InstanceStatus]:
+        return self._run_handler(service, Commands.STATUS, on_status)
+
+    def get_all_status(self, services: Optional[List[str]] = None) -> StatusMatrix:
+        """Status of `services` (all of them by default) on this host"""
+        names = services or [s.name for s in self._config.get_services()]
+        statuses = {}
+
+        for name in names:
+            try:
+                statuses[name] = self._run_handler(name, Commands.STATUS)[0]
+            except Exception as e:
+                logger.error("Could not get the status of %s: %s", name, e)
+                statuses[name] = InstanceStatus(hostname=self._hostname, status=Status.FAILED)
+
+        return {self._hostname: statuses}
 
 
 class RemoteDispatcher(Dispatcher):
@@ -103,73 +138,254 @@ class RemoteDispatcher(Dispatcher):
     responsible for starting processes. It just calls
     the registered handler, which will then start the
     service in its current host.
+
+    Commands are sent to all hosts of a service at once, using
+    at most `max_workers` concurrent connections. Each host has
+    `host_timeout` seconds to connect and answer, plus `ready_timeout`
+    for commands whose handler waits for the service to come up or
+    go down. Hosts that have not answered after `timeout` seconds are
+    reported with an unknown status.
+
+    SSH connections are taken from `pool`, which defaults to a pool
+    shared by the whole process. If `use_agent` is set and the config
+    has an `agent_token`, commands are sent to the onedep-manager
+    agent of each host through the SSH connection, falling back to
+    running the handler module when no agent is listening.
     """
-    def __init__(self, config: Config) -> None:
+    def __init__(self, config: Config, max_workers: int = 16, host_timeout: float = 10, timeout: float = 60, pool: Optional[ConnectionPool] = None, use_agent: bool = True,
+                 ready_timeout: float = Handler.ready_timeout) -> None:
         self._config = config
-        self._ci = ConfigInfo()
+        self._pool = pool or default_pool
+        self._agent_port = config.get_agent_port()
+        self._agent_token = config.get_agent_token()
+        self._use_agent = use_agent and bool(self._agent_token)
+        self._max_workers = max_workers
+        self._host_timeout = host_timeout
+        self._ready_timeout = ready_timeout
+        self._timeout = timeout
         self._setup_env()
     
     def _setup_env(self):
         self.env = {
             "WWPDB_SITE_ID": getSiteId(),
-            "WWPDB_SITE_LOC": self._ci.get("WWPDB_SITE_LOC"),
-            "ONEDEP_PATH": self._ci.get("TOP_SOFTWARE_DIR"),
-            "SITE_SUFFIX": self._ci.get("SITE_SUFFIX"),
+            "WWPDB_SITE_LOC": self._config.from_site("WWPDB_SITE_LOC"),
+            "ONEDEP_PATH": self._config.from_site("TOP_SOFTWARE_DIR"),
+            "SITE_SUFFIX": self._config.from_site("SITE_SUFFIX"),
         }
 
-    def _run_onhost(self, host: str, module: str, command: Commands):
-        client = SSHClient()
-        client.load_system_host_keys()
+    def _reply_timeout(self, command: Commands) -> float:
+        """Seconds a host has to answer `command`. Handlers don't answer
+        start, stop and restart before their probes settle.
+        """
+        if command == Commands.STATUS:
+            return self._host_timeout
+
+        return self._host_timeout + self._ready_timeout
 
+    def _ask_agent(self, host: str, service: str, command: Commands) -> Optional[str]:
+        """Sends `command` to the agent running on `host`. Returns None
+        if there is no agent to talk to.
+        """
         try:
-            client.connect(host, timeout=10)
-            stdin, stdout, stderr = client.exec_command(f"python -m {module} {command}", environment=self.env)
-        except (SSHException, AuthenticationException):
-            logger.error("Couldn't connect to host %s", host, exc_info=True)
-            return InstanceStatus(hostname=host, status=Status.FAILED)
+            channel = self._pool.open_tunnel(host, self._agent_port, timeout=self._host_timeout)
+        except ChannelException:
+            logger.debug("No agent listening on %s:%s", host, self._agent_port)
+            return None
 
-        status = stdout.read().decode("utf-8").strip()
-        if Status(status) != Status.RUNNING:
-            return InstanceStatus(hostname=host, status=Status.FAILED)
+        try:
+            channel.settimeout(self._reply_timeout(command))
+            channel.sendall(f"{self._agent_token} {command} {service}\n".encode("utf-8"))
+            data = b""
 
-        return InstanceStatus(hostname=host, status=Status(status))
+            while not data.endswith(b"\n"):
+                chunk = channel.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+        finally:
+            channel.close()
 
-    def start_service(self, service: str) -> List[InstanceStatus]:
-        status = []
-        serv = self._config.get_service(service)
-        module, klass = serv.handler.rsplit(".", 1)
+        return data.decode("utf-8").strip() or None
+
+    def _run_onhost(self, host: str, service: str, module: str, command: Commands) -> InstanceStatus:
+        start = time.monotonic()
 
-        for h in serv.hosts:
-            status.append(self._run_onhost(h, module, Commands.START))
+        try:
+            with span(f"{command} {service}", "remote", host=host):
+                reply = self._ask_agent(host, service, command) if self._use_agent else None
 
-        return status
+                if reply is None:
+                    reply = self._pool.exec_command(host, f"python -m {module} {command}", environment=self.env, timeout=self._reply_timeout(command))
+        except (SSHException, AuthenticationException, OSError):
+            logger.error("Couldn't run '%s' on host %s", command, host, exc_info=True)
+            return InstanceStatus(hostname=host, status=Status.FAILED, latency=time.monotonic() - start)
 
-    def stop_service(self, service: str) -> InstanceStatus:
-        status = []
-        serv = self._config.get_service(service)
-        module, klass = serv.handler.rsplit(".", 1)
+        latency = time.monotonic() - start
+        # handlers may print before answering, like `tail -n 1` in get_host_status
+        lines = (reply or "").strip().splitlines()
+        status, ready_time = parse_reply(lines[-1] if lines else "")
+
+        if status is None:
+            return InstanceStatus(hostname=host, status=Status.FAILED, latency=latency)
 
-        for h in serv.hosts:
-            status.append(self._run_onhost(h, module, Commands.STOP))
+        return InstanceStatus(hostname=host, status=status, latency=latency, ready_time=ready_time)
 
-        return status
+    def _fan_out(self, service: str, command: Commands, on_status: Optional[StatusCallback] = None, hosts: Optional[List[str]] = None) -> List[InstanceStatus]:
+        """Run `command` on all hosts of `service` (or on `hosts`)
+        concurrently.
 
-    def restart_service(self, service: str) -> InstanceStatus:
-        status = []
+        `on_status` is called with each result as soon as it arrives.
+        The returned list keeps the order of the hosts in the config.
+        """
         serv = self._config.get_service(service)
         module, klass = serv.handler.rsplit(".", 1)
+        hosts = serv.hosts if hosts is None else hosts
+        results = {}
 
-        for h in serv.hosts:
-            status.append(self._run_onhost(h, module, Commands.RESTART))
+        if not hosts:
+            return []
 
-        return status
+        executor = ThreadPoolExecutor(max_workers=min(self._max_workers, len(hosts)))
+        futures = {executor.submit(self._run_onhost, h, service, module, command): h for h in hosts}
 
-    def get_status(self, service: str) -> InstanceStatus:
-        status = []
-        serv = self._config.get_service(service)
-        module, klass = serv.handler.rsplit(".", 1)
+        try:
+            for future in as_completed(futures, timeout=self._timeout):
+                result = future.result()
+                results[futures[future]] = result
+
+                if on_status:
+                    on_status(result)
+        except FuturesTimeoutError:
+            for future, host in futures.items():
+                if host in results:
+                    continue
+
+                future.cancel()
+                logger.error("Host %s did not answer '%s' in %ss", host, command, self._timeout)
+                result = InstanceStatus(hostname=host, status=Status.UNKNOWN, latency=self._timeout)
+                results[host] = result
+
+                if on_status:
+                    on_status(result)
+        finally:
+            executor.shutdown(wait=False)
+
+        return [results[h] for h in hosts]
+
+    def start_service(self, service: str, on_status: Optional[StatusCallback] = None) -> List[InstanceStatus]:
+        return self._fan_out(service, Commands.START, on_status)
 
-        for h in serv.hosts:
-            status.append(self._run_onhost(h, module, Commands.STATUS))
+    def stop_service(self, service: str, on_status: Optional[StatusCallback] = None) -> List[InstanceStatus]:
+        return self._fan_out(service, Commands.STOP, on_status)
 
-        return status
+    def restart_service(self, service: str, on_status: Optional[StatusCallback] = None) -> List[InstanceStatus]:
+        return self._fan_out(service, Commands.RESTART, on_status)
+
+    def get_host_status(self, host: str, modules: Dict[str, str]) -> Dict[str, InstanceStatus]:
+        """Status of several services (name -> handler module) of
+        `host`, asked for in a single request.
+        """
+        start = time.monotonic()
+        names = list(modules)
+
+        try:
+            with span("status", "remote", host=host, services=len(names)):
+                reply = self._ask_agent(host, " ".join(names), Commands.STATUS) if self._use_agent else None
+
+                if reply is None:
+                    script = "; ".join(f'echo {shlex.quote(name + "=")}"$(python -m {module} {Commands.STATUS} 2>/dev/null | tail -n 1)"' for name, module in modules.items())
+                    reply = self._pool.exec_command(host, script, environment=self.env, timeout=self._host_timeout)
+        except (SSHException, AuthenticationException, OSError):
+            logger.error("Couldn't get the status of services on host %s", host, exc_info=True)
+            reply = ""
+
+        latency = time.monotonic() - start
+        statuses = parse_replies(reply)
+
+        if not statuses and len(names) == 1:
+            # agents answer requests for a single service with its status only
+            statuses = {names[0]: parse_reply(reply)[0]}
+
+        return {name: InstanceStatus(hostname=host, status=statuses.get(name) or Status.FAILED, latency=latency) for name in names}
+
+    def services_by_host(self, services: Optional[List[str]] = None) -> Dict[str, Dict[str, str]]:
+        """Maps each host to the services it runs (name -> handler
+        module), for `services` or all of them.
+        """
+        names = services or [s.name for s in self._config.get_services()]
+        by_host = {}
+
+        for name in names:
+            serv = self._config.get_service(name)
+            module, klass = serv.handler.rsplit(".", 1)
+
+            for host in serv.hosts:
+                by_host.setdefault(host, {})[name] = module
+
+        return by_host
+
+    def get_all_status(self, services: Optional[List[str]] = None) -> StatusMatrix:
+        """Status of `services` (all of them by default) on all their
+        hosts. Each host is asked once for all of its services, and
+        hosts are asked concurrently. Hosts that have not answered after
+        `timeout` seconds are reported with an unknown status.
+        """
+        by_host = self.services_by_host(services)
+
+        if not by_host:
+            return {}
+
+        results = {}
+        executor = ThreadPoolExecutor(max_workers=min(self._max_workers, len(by_host)))
+        futures = {executor.submit(self.get_host_status, host, modules): host for host, modules in by_host.items()}
+
+        try:
+            for future in as_completed(futures, timeout=self._timeout):
+                results[futures[future]] = future.result()
+        except FuturesTimeoutError:
+            for future, host in futures.items():
+                if host in results:
+                    continue
+
+                future.cancel()
+                logger.error("Host %s did not answer 'status' in %ss", host, self._timeout)
+                results[host] = {name: InstanceStatus(hostname=host, status=Status.UNKNOWN, latency=self._timeout) for name in by_host[host]}
+        finally:
+            executor.shutdown(wait=False)
+
+        return {host: results[host] for host in by_host}
+
+    def rolling_restart(self, service: str, batch: Union[int, str] = 1, abort_on_failure: bool = True, on_status: Optional[StatusCallback] = None) -> List[InstanceStatus]:
+        """Restarts the hosts of `service` a batch at a time, in the
+        order of the config, so the rest of them keep serving. `batch`
+        is a number of hosts or a percentage of them (e.g. '25%').
+
+        A batch only counts as done once all of its hosts report the
+        service as running, which handlers do once it is ready. If a
+        batch fails and `abort_on_failure` is set, the hosts of later
+        batches are not restarted and are reported as skipped.
+        """
+        hosts = self._config.get_service(service).hosts
+        size = batch_size(batch, len(hosts))
+        results = []
+
+        for i in range(0, len(hosts), size):
+            done = self._fan_out(service, Commands.RESTART, on_status, hosts=hosts[i:i + size])
+            results.extend(done)
+
+            if abort_on_failure and any(s.status != Status.RUNNING for s in done):
+                logger.error("Stopping the rolling restart of %s, hosts failed: %s", service, ", ".join(s.hostname for s in done if s.status != Status.RUNNING))
+
+                for host in hosts[i + size:]:
+                    result = InstanceStatus(hostname=host, status=Status.SKIPPED)
+                    results.append(result)
+
+                    if on_status:
+                        on_status(result)
+
+                break
+
+        return results
+
+    def get_status(self, service: str, on_status: Optional[StatusCallback] = None) -> List[InstanceStatus]:
+        return self._fan_out(service, Commands.STATUS, on_status)
@@ -1,14 +1,200 @@
+import os
 import sys
+import time
+import socket
+import inspect
+import logging
+import importlib
+import threading
 from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 from onedep_manager.config import Config
 from onedep_manager.services.schemas import Status, Commands
 
 
+logger = logging.getLogger(__name__)
+
+PROC_DIR = "/proc"
+# names in /proc/<pid>/comm are truncated to this many characters
+COMM_LENGTH = 15
+
+
+def read_pid_file(path: str) -> Optional[int]:
+    try:
+        with open(path) as f:
+            return int(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def process_name(pid: int, proc_dir: str = PROC_DIR) -> Optional[str]:
+    """Name of a running process, or None if there is no such process"""
+    try:
+        with open(os.path.join(proc_dir, str(pid), "comm")) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def find_process(name: str, pid_files: Iterable[str] = (), proc_dir: str = PROC_DIR) -> Optional[int]:
+    """Returns the PID of a running process called `name`, or None.
+
+    PID files are tried first, each costing a single read in /proc.
+    Otherwise /proc is scanned until the first match. Without /proc
+    (e.g. macOS) psutil is used instead.
+    """
+    comm = name[:COMM_LENGTH]
+
+    for pid_file in pid_files:
+        pid = read_pid_file(pid_file)
+
+        if pid is not None and process_name(pid, proc_dir) == comm:
+            return pid
+
+    try:
+        entries = os.scandir(proc_dir)
+    except OSError:
+        import psutil
+
+        for proc in psutil.process_iter(['name']):
+            if proc.info['name'] == name:
+                return proc.pid
+
+        return None
+
+    with entries:
+        for entry in entries:
+            if entry.name.isdigit() and process_name(entry.name, proc_dir) == comm:
+                return int(entry.name)
+
+    return None
+
+
+def poll(condition: Callable[[], bool], timeout: float, interval: float = 0.05, factor: float = 2, max_interval: float = 1) -> Optional[float]:
+    """Calls `condition` until it returns True, waiting `interval`
+    seconds after the first failure and `factor` times longer after
+    each other one (up to `max_interval`). Returns the seconds it took,
+    or None if `condition` still failed after `timeout` seconds.
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+
+    while True:
+        if condition():
+            return time.monotonic() - start
+
+        now = time.monotonic()
+
+        if now >= deadline:
+            return None
+
+        time.sleep(min(interval, deadline - now))
+        interval = min(interval * factor, max_interval)
+
+
+class Probe(ABC):
+    """A check that tells whether a service is up on this host"""
+    @abstractmethod
+    def check(self) -> bool:
+        raise NotImplementedError()
+
+
+class PidProbe(Probe):
+    """Up if a process called `name` is running"""
+    def __init__(self, name: str, pid_files: Iterable[str] = ()) -> None:
+        self.name = name
+        self.pid_files = list(pid_files)
+
+    def check(self) -> bool:
+        return find_process(self.name, pid_files=self.pid_files) is not None
+
+    def __str__(self) -> str:
+        return f"process {self.name}"
+
+
+class TcpProbe(Probe):
+    """Up if `host:port` accepts connections"""
+    def __init__(self, port: int, host: str = "127.0.0.1", timeout: float = 1) -> None:
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def check(self) -> bool:
+        try:
+            socket.create_connection((self.host, self.port), timeout=self.timeout).close()
+        except OSError:
+            return False
+
+        return True
+
+    def __str__(self) -> str:
+        return f"tcp {self.host}:{self.port}"
+
+
+class HttpProbe(Probe):
+    """Up if `url` answers with a status below 400"""
+    def __init__(self, url: str, timeout: float = 2) -> None:
+        self.url = url
+        self.timeout = timeout
+
+    def check(self) -> bool:
+        from urllib.request import urlopen
+
+        try:
+            with urlopen(self.url, timeout=self.timeout) as response:
+                return response.status < 400
+        except Exception:
+            return False
+
+    def __str__(self) -> str:
+        return f"http {self.url}"
+
+
 class Handler(ABC):
+    """Base class of service handlers.
+
+    Handlers can list the probes that tell when their service is up in
+    `probes`, and call `wait_ready` after starting it (or `wait_stopped`
+    after stopping it) instead of sleeping. Commands return a `Status`,
+    or a `(Status, ready_time)` pair to report the time it took to get
+    ready along with the status.
+
+    A single instance may run several commands at once (e.g. `status`
+    while `start` waits for its probes), so commands shouldn't keep
+    their state on it.
+    """
+    # seconds to wait for the probes before giving up
+    ready_timeout = 60
+
     def __init__(self, config: Config) -> None:
         self._config = config
 
+    def probes(self) -> List[Probe]:
+        return []
+
+    def is_ready(self) -> bool:
+        return all(probe.check() for probe in self.probes())
+
+    def wait_ready(self, since: Optional[float] = None) -> Optional[float]:
+        """Polls the probes until all of them pass. Returns the seconds
+        it took to get ready, or None if the probes still failed after
+        `ready_timeout`. `since` is the `time.monotonic()` at which the
+        service was started, to count the time to ready from there.
+        """
+        since = time.monotonic() if since is None else since
+        probes = self.probes()
+
+        if poll(lambda: all(probe.check() for probe in probes), self.ready_timeout) is None:
+            return None
+
+        return time.monotonic() - since
+
+    def wait_stopped(self) -> bool:
+        """Polls the probes until none of them pass"""
+        probes = self.probes()
+        return poll(lambda: not any(probe.check() for probe in probes), self.ready_timeout) is not None
+
     @abstractmethod
     def start(self) -> Status:
         raise NotImplementedError()
@@ -26,11 +212,138 @@ class Handler(ABC):
         raise NotImplementedError()
 
 
+def split_result(result) -> Tuple[Status, Optional[float]]:
+    """Status and time to ready of what a handler command returned"""
+    if isinstance(result, tuple):
+        return result
+
+    return result, None
+
+
+class HandlerRegistry:
+    """Resolves dotted handler paths (e.g. 'onedep_manager.services.
+    apache_handler.ApacheHandler') to classes once, and keeps one
+    instance of each handler for the life of the process, so handlers
+    can hold on to what they load (e.g. ConfigInfo).
+
+    Only handlers that loaded are kept: paths that can't be used are
+    tried again the next time they are asked for, so a missing package
+    can be installed without restarting the process.
+    """
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._classes = {}
+        self._instances = {}
+
+    @staticmethod
+    def _load(path: str) -> type:
+        try:
+            module, klass = path.rsplit(".", 1)
+            handler = getattr(importlib.import_module(module), klass)
+        except Exception as e:
+            raise Exception(f"Could not load handler {path}: {e}")
+
+        if not isinstance(handler, type):
+            raise Exception(f"Could not load handler {path}: not a class")
+
+        if not issubclass(handler, Handler):
+            raise Exception(f"Could not load handler {path}: not a Handler")
+
+        if inspect.isabstract(handler):
+            missing = ", ".join(sorted(handler.__abstractmethods__))
+            raise Exception(f"Could not load handler {path}: {missing} not implemented")
+
+        return handler
+
+    def resolve(self, path: str) -> type:
+        """Returns the handler class of `path`"""
+        with self._lock:
+            if path not in self._classes:
+                self._classes[path] = self._load(path)
+
+            return self._classes[path]
+
+    def instance(self, path: str):
+        """Returns the shared instance of the handler of `path`"""
+        handler = self.resolve(path)
+
+        with self._lock:
+            if path not in self._instances:
+                self._instances[path] = handler()
+
+            return self._instances[path]
+
+    def run(self, path: str, command: Commands) -> Tuple[Status, Optional[float]]:
+        """Runs `command` with the handler of `path`. Returns its status
+        and the time it took to get ready, if it waited for that.
+        """
+        return split_result(getattr(self.instance(path), str(command))())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._classes.clear()
+            self._instances.clear()
+
+
+default_registry = HandlerRegistry()
+
+
+def format_reply(status: Status, ready_time: Optional[float] = None) -> str:
+    """Line a handler answers with: its status, followed by the
+    seconds it took to get ready if it waited for that.
+    """
+    if ready_time is None:
+        return str(status)
+
+    return f"{status} {ready_time:.3f}"
+
+
+def parse_reply(reply: str) -> Tuple[Optional[Status], Optional[float]]:
+    """Reverse of `format_reply`. Unknown replies give (None, None)."""
+    parts = (reply or "").split()
+
+    try:
+        status = Status(parts[0])
+        ready_time = float(parts[1]) if len(parts) > 1 else None
+    except (IndexError, ValueError):
+        return None, None
+
+    return status, ready_time
+
+
+def format_replies(statuses: Dict[str, Status]) -> str:
+    """Line answering a request for several services at once, as
+    `<service>=<status>` pairs.
+    """
+    return " ".join(f"{service}={status}" for service, status in statuses.items())
+
+
+def parse_replies(reply: str) -> Dict[str, Optional[Status]]:
+    """Reverse of `format_replies`, also accepting one pair per line.
+    Services with an unknown reply map to None.
+    """
+    statuses = {}
+
+    for token in (reply or "").split():
+        service, sep, status = token.partition("=")
+
+        if sep:
+            statuses[service] = parse_reply(status)[0]
+
+    return statuses
+
+
 class Parser:
     def __init__(self, handler: Handler) -> None:
         self._handler = handler
-    
-    def run(self) -> Status:
+
+    def main(self) -> None:
+        """Runs the command given in the command line and prints the
+        reply for the dispatcher.
+        """
+        print(format_reply(*split_result(self.run())))
+
+    def run(self):
         command = Commands(sys.argv[1])
 
         if command == Commands.START:
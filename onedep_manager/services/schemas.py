@@ -1,4 +1,5 @@
 from enum import Enum
+from typing import Optional
 from dataclasses import dataclass
 
 
@@ -17,6 +18,8 @@ class Status(Enum):
     RUNNING = "running"
     FAILED = "failed"
     STOPPED = "stopped"
+    # not attempted, e.g. after an earlier batch of a rolling restart failed
+    SKIPPED = "skipped"
 
     def __str__(self) -> str:
         return self.value
@@ -26,3 +29,6 @@ class Status(Enum):
 class InstanceStatus:
     hostname: str
     status: Status
+    latency: Optional[float] = None
+    # seconds the service took to get ready, for handlers that wait for it
+    ready_time: Optional[float] = None
@@ -0,0 +1,118 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from onedep_manager.config import Config
+from onedep_manager.services.dispatcher import Dispatcher
+from onedep_manager.services.schemas import Status, InstanceStatus, Commands
+
+
+logger = logging.getLogger(__name__)
+
+# service name, status of one of its hosts
+StackCallback = Callable[[str, InstanceStatus], None]
+
+
+def _levels(names: List[str], deps: Dict[str, set]) -> List[List[str]]:
+    pending = {name: set(deps[name]) for name in names}
+    levels = []
+
+    while pending:
+        level = [name for name in names if name in pending and not pending[name]]
+
+        if not level:
+            raise ValueError(f"Services depend on each other in a cycle: {', '.join(n for n in names if n in pending)}")
+
+        for name in level:
+            del pending[name]
+
+        for rest in pending.values():
+            rest.difference_update(level)
+
+        levels.append(level)
+
+    return levels
+
+
+def service_levels(services: list) -> List[List[str]]:
+    """Groups services by their `depends_on`, so that each service comes
+    in a later level than all of its dependencies. Services of the same
+    level don't depend on each other. Keeps the config order within a
+    level.
+
+    Raises:
+        ValueError: if a service depends on an unknown service, or if
+            dependencies form a cycle.
+    """
+    names = [s.name for s in services]
+    deps = {s.name: set(s.depends_on or []) for s in services}
+
+    for name in names:
+        unknown = deps[name] - set(names)
+
+        if unknown:
+            raise ValueError(f"Service {name} depends on unknown services: {', '.join(sorted(unknown))}")
+
+    return _levels(names, deps)
+
+
+def run_stack(config: Config, dispatcher: Dispatcher, command: Commands, on_status: Optional[StackCallback] = None, max_workers: int = 8) -> Dict[str, List[InstanceStatus]]:
+    """Starts or stops all services of the config, a level of
+    `service_levels` at a time and the services of a level concurrently.
+    Services are stopped in reverse order, dependents first.
+
+    A service whose dependencies didn't start (or, when stopping, whose
+    dependents didn't stop) is skipped, and reported as such on all of
+    its hosts. Returns the status of each service, in the order they
+    were run.
+    """
+    if command == Commands.START:
+        run, expected = dispatcher.start_service, Status.RUNNING
+    elif command == Commands.STOP:
+        run, expected = dispatcher.stop_service, Status.STOPPED
+    else:
+        raise ValueError(f"Can't {command} the whole stack")
+
+    services = {s.name: s for s in config.get_services()}
+    levels = service_levels(list(services.values()))
+    blockers = {name: set(s.depends_on or []) for name, s in services.items()}
+
+    if command == Commands.STOP:
+        # the same graph, walked from the dependents
+        blockers = {name: {other for other, deps in blockers.items() if name in deps} for name in services}
+        levels = _levels(list(services), blockers)
+
+    results = {}
+    failed = set()
+
+    def run_service(name):
+        callback = (lambda s: on_status(name, s)) if on_status else None
+
+        try:
+            return run(name, on_status=callback)
+        except Exception as e:
+            logger.error("Could not %s %s: %s", command, name, e)
+            return [InstanceStatus(hostname=h, status=Status.FAILED) for h in services[name].hosts]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for level in levels:
+            runnable = []
+
+            for name in level:
+                if blockers[name] & failed:
+                    results[name] = [InstanceStatus(hostname=h, status=Status.SKIPPED) for h in services[name].hosts]
+                    failed.add(name)
+
+                    if on_status:
+                        for s in results[name]:
+                            on_status(name, s)
+                else:
+                    runnable.append(name)
+
+            for name, statuses in zip(runnable, executor.map(run_service, runnable)):
+                results[name] = statuses
+
+                if any(s.status != expected for s in statuses):
+                    failed.add(name)
+
+    return results
@@ -0,0 +1,148 @@
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, List, Optional
+
+from onedep_manager.services.dispatcher import RemoteDispatcher
+from onedep_manager.services.schemas import Status, InstanceStatus
+
+
+logger = logging.getLogger(__name__)
+
+# statuses a service is expected to stay in
+STABLE = (Status.RUNNING, Status.STOPPED)
+
+
+@dataclass
+class Cell:
+    status: Optional[Status] = None
+    # time.time() of the last change of status
+    since: Optional[float] = None
+
+
+@dataclass
+class Transition:
+    at: float
+    host: str
+    service: str
+    old: Optional[Status]
+    new: Status
+
+
+class WatchState:
+    """Last known status of each service on each host, and the most
+    recent status changes.
+    """
+    def __init__(self, by_host: Dict[str, List[str]], history: int = 10) -> None:
+        self.cells = {host: {name: Cell() for name in names} for host, names in by_host.items()}
+        self.transitions = []
+        self._history = history
+
+    @property
+    def services(self) -> List[str]:
+        names = []
+        for row in self.cells.values():
+            names.extend(name for name in row if name not in names)
+        return names
+
+    def update(self, host: str, statuses: Dict[str, InstanceStatus], now: Optional[float] = None) -> List[Transition]:
+        now = time.time() if now is None else now
+        changes = []
+
+        for name, result in statuses.items():
+            cell = self.cells[host].setdefault(name, Cell())
+
+            if cell.status == result.status:
+                continue
+
+            changes.append(Transition(at=now, host=host, service=name, old=cell.status, new=result.status))
+            cell.status, cell.since = result.status, now
+
+        # the first status seen for a service is not a transition
+        self.transitions = (self.transitions + [c for c in changes if c.old is not None])[-self._history:]
+
+        return changes
+
+    def settled(self, host: str) -> bool:
+        return all(cell.status in STABLE for cell in self.cells[host].values())
+
+
+class Watcher:
+    """Polls the status of services over the dispatcher's pooled
+    connections, one request per host. Hosts are polled every `fast`
+    seconds while any of their services is changing or not in a stable
+    state; while nothing changes, their interval doubles up to `slow`.
+    """
+    def __init__(self, dispatcher: RemoteDispatcher, services: Optional[List[str]] = None, fast: float = 1, slow: float = 30, max_workers: int = 16) -> None:
+        self._dispatcher = dispatcher
+        self._by_host = dispatcher.services_by_host(services)
+        self._fast = fast
+        self._slow = slow
+        self._max_workers = max_workers
+        self.state = WatchState({host: list(modules) for host, modules in self._by_host.items()})
+        self.intervals = {host: fast for host in self._by_host}
+        self.due = {host: 0.0 for host in self._by_host}
+
+    def _poll(self, host: str) -> Dict[str, InstanceStatus]:
+        try:
+            return self._dispatcher.get_host_status(host, self._by_host[host])
+        except Exception as e:
+            logger.error("Could not poll %s: %s", host, e)
+            return {name: InstanceStatus(hostname=host, status=Status.UNKNOWN) for name in self._by_host[host]}
+
+    def record(self, host: str, statuses: Dict[str, InstanceStatus], now: Optional[float] = None) -> List[Transition]:
+        """Stores a poll result and schedules the next poll of `host`"""
+        now = time.monotonic() if now is None else now
+        changes = self.state.update(host, statuses)
+
+        if changes or not self.state.settled(host):
+            self.intervals[host] = self._fast
+        else:
+            self.intervals[host] = min(self.intervals[host] * 2, self._slow)
+
+        self.due[host] = now + self.intervals[host]
+        return changes
+
+    def run(self, on_change: Callable[[WatchState], None], stop: Optional[threading.Event] = None) -> None:
+        """Polls until `stop` is set, calling `on_change` whenever a
+        status changed.
+        """
+        stop = stop or threading.Event()
+
+        if not self._by_host:
+            return
+
+        executor = ThreadPoolExecutor(max_workers=min(self._max_workers, len(self._by_host)))
+        in_flight = {}
+
+        try:
+            while not stop.is_set():
+                now = time.monotonic()
+
+                for host, due in self.due.items():
+                    if due <= now and host not in in_flight.values():
+                        in_flight[executor.submit(self._poll, host)] = host
+
+                pending = [due for host, due in self.due.items() if host not in in_flight.values()]
+                # wake up at least every second to check `stop`
+                timeout = min([1] + [max(0, due - time.monotonic()) for due in pending])
+
+                if not in_flight:
+                    stop.wait(timeout)
+                    continue
+
+                done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    host = in_flight.pop(future)
+
+                    if self.record(host, future.result()):
+                        on_change(self.state)
+        finally:
+            # cancel_futures needs Python 3.9
+            for future in in_flight:
+                future.cancel()
+
+            executor.shutdown(wait=False)
@@ -0,0 +1,218 @@
+import os
+import sys
+import mmap
+import json
+import struct
+import hashlib
+import logging
+from typing import Any, Optional
+
+from wwpdb.utils.config.ConfigInfo import getSiteId
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"ODMS"
+FORMAT_VERSION = 1
+# magic, format version, number of keys, fingerprint of the sources
+HEADER = struct.Struct("<4sII20s")
+# key offset, key length, value offset, value length
+ENTRY = struct.Struct("<IIII")
+
+# returned by `SiteSnapshot.lookup` for values that must be read from ConfigInfo
+MISSING = object()
+
+
+def snapshot_sources(site_id: Optional[str] = None) -> list:
+    """Files the site configuration is built from. Changes to any of
+    them make the snapshot stale.
+    """
+    import wwpdb.utils.config.ConfigInfoData as cid
+
+    site_id = site_id or getSiteId()
+    top_dir = os.getenv("TOP_WWPDB_SITE_CONFIG_DIR", "")
+    site_dir = os.path.join(top_dir, str(os.getenv("WWPDB_SITE_LOC")).lower(), site_id.lower())
+
+    sources = [
+        os.path.join(site_dir, "site.cfg"),
+        os.path.join(site_dir, "ConfigInfoFileCache.json"),
+        cid.__file__,
+    ]
+
+    # generated module with the site values, imported by ConfigInfoData if found
+    cache = sys.modules.get("ConfigInfoFileCache")
+
+    if getattr(cache, "__file__", None):
+        sources.append(cache.__file__)
+
+    return sources
+
+
+def fingerprint(site_id: Optional[str] = None) -> bytes:
+    site_id = site_id or getSiteId()
+    h = hashlib.sha1(site_id.encode("utf-8"))
+
+    for path in snapshot_sources(site_id):
+        try:
+            st = os.stat(path)
+            h.update(f"{path}:{st.st_mtime_ns}:{st.st_size}".encode("utf-8"))
+        except OSError:
+            h.update(f"{path}:-".encode("utf-8"))
+
+    return h.digest()
+
+
+def snapshot_path(site_id: Optional[str] = None) -> Optional[str]:
+    """Location of the snapshot of a site, under ODM_CONFIG_DIR. Uses
+    the environment so the site config doesn't have to be loaded to
+    find it.
+    """
+    top_dir = os.getenv("TOP_WWPDB_SITE_CONFIG_DIR")
+
+    if not top_dir:
+        return None
+
+    return os.path.join(top_dir, "odm", f"site_{(site_id or getSiteId()).lower()}.snapshot")
+
+
+def write_snapshot(path: str, config: dict, fp: bytes) -> None:
+    """Writes `config` as a snapshot: a header, an index of fixed size
+    entries sorted by key, and the keys and JSON encoded values.
+
+    Values that don't survive a JSON round trip (e.g. dicts of tuples)
+    are indexed with an empty value, so readers fall back to ConfigInfo
+    for them instead of getting a different type.
+    """
+    items = []
+
+    for key, value in config.items():
+        try:
+            encoded = json.dumps(value)
+            if json.loads(encoded) != value:
+                encoded = ""
+        except (TypeError, ValueError):
+            encoded = ""
+
+        items.append((str(key).encode("utf-8"), encoded.encode("utf-8")))
+
+    items.sort()
+
+    index = bytearray()
+    data = bytearray()
+    offset = HEADER.size + ENTRY.size * len(items)
+
+    for key, value in items:
+        index += ENTRY.pack(offset + len(data), len(key), offset + len(data) + len(key), len(value))
+        data += key + value
+
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # holds site secrets, so only readable by its owner
+    with os.fdopen(os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(items), fp))
+        f.write(index)
+        f.write(data)
+
+    os.replace(tmp_file, path)
+
+
+class SiteSnapshot:
+    """Read-only view of a snapshot file. The file is memory mapped and
+    keys are found with a binary search over the index, so only the
+    pages that are touched are read.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self._count, self.fingerprint = HEADER.unpack_from(self._mm, 0)
+
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a site config snapshot")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _entry(self, i: int) -> tuple:
+        return ENTRY.unpack_from(self._mm, HEADER.size + ENTRY.size * i)
+
+    def _key(self, i: int) -> bytes:
+        key_offset, key_len, _, _ = self._entry(i)
+        return self._mm[key_offset:key_offset + key_len]
+
+    def lookup(self, key: str, default: Any = None) -> Any:
+        """Returns the value of `key`, `default` if the site config
+        doesn't have it, or MISSING if it must be read from ConfigInfo.
+        """
+        target = key.encode("utf-8")
+        lo, hi = 0, self._count
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+
+            if self._key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo == self._count or self._key(lo) != target:
+            return default
+
+        _, _, value_offset, value_len = self._entry(lo)
+
+        if value_len == 0:
+            return MISSING
+
+        return json.loads(self._mm[value_offset:value_offset + value_len])
+
+    def close(self) -> None:
+        self._mm.close()
+
+
+def open_snapshot(site_id: Optional[str] = None, build: bool = True) -> Optional[SiteSnapshot]:
+    """Returns the snapshot of a site, (re)compiling it from ConfigInfo
+    if it's missing or its sources changed. Returns None if there's no
+    usable snapshot, in which case callers should use ConfigInfo.
+    """
+    site_id = (site_id or getSiteId()).upper()
+    path = snapshot_path(site_id)
+
+    if path is None:
+        return None
+
+    fp = fingerprint(site_id)
+
+    try:
+        snapshot = SiteSnapshot(path)
+
+        if snapshot.fingerprint == fp:
+            return snapshot
+
+        snapshot.close()
+    except (OSError, ValueError, struct.error):
+        pass
+
+    if not build:
+        return None
+
+    from wwpdb.utils.config.ConfigInfoData import ConfigInfoData
+
+    config = ConfigInfoData(siteId=site_id).getConfigDictionary()
+
+    try:
+        write_snapshot(path, config, fp)
+        return SiteSnapshot(path)
+    except (OSError, ValueError, struct.error) as e:
+        logger.debug("Could not write site config snapshot to %s: %s", path, e)
+        return None
+
+
+def remove_snapshot(site_id: Optional[str] = None) -> None:
+    path = snapshot_path(site_id)
+
+    if path is not None and os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import threading
+import functools
+import contextlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+_NO_SPAN = contextlib.nullcontext()
+
+
+@dataclass
+class Span:
+    name: str
+    category: str
+    # nanoseconds since the tracer started
+    start: int
+    duration: int
+    thread_id: int
+    thread_name: str
+    args: Dict[str, str] = field(default_factory=dict)
+
+
+class Tracer:
+    """Collects timed spans from all threads of the process"""
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+        self.spans = []
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, **args):
+        start = time.perf_counter_ns()
+
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            thread = threading.current_thread()
+            span = Span(name=name, category=category, start=start - self._origin, duration=end - start,
+                        thread_id=thread.ident, thread_name=thread.name, args={k: str(v) for k, v in args.items()})
+
+            with self._lock:
+                self.spans.append(span)
+
+    def chrome_trace(self) -> dict:
+        """Spans in the Chrome trace event format, for chrome://tracing
+        or https://ui.perfetto.dev
+        """
+        pid = os.getpid()
+        events = []
+        threads = {}
+
+        for s in self.spans:
+            threads[s.thread_id] = s.thread_name
+            events.append({"name": s.name, "cat": s.category, "ph": "X", "ts": s.start / 1000, "dur": s.duration / 1000, "pid": pid, "tid": s.thread_id, "args": s.args})
+
+        for tid, name in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def summary(self) -> List[dict]:
+        """Time spent per category, slowest first. `wall` counts the
+        time any span of the category was open, so spans running in
+        parallel threads are not counted twice; `busy` adds them all up.
+        """
+        by_category = {}
+
+        for s in self.spans:
+            by_category.setdefault(s.category, []).append(s)
+
+        rows = []
+
+        for category, spans in by_category.items():
+            wall, end = 0, None
+
+            for s in sorted(spans, key=lambda s: s.start):
+                stop = s.start + s.duration
+
+                if end is None or s.start >= end:
+                    wall += s.duration
+                    end = stop
+                elif stop > end:
+                    wall += stop - end
+                    end = stop
+
+            rows.append({
+                "category": category,
+                "spans": len(spans),
+                "wall": wall / 1e9,
+                "busy": sum(s.duration for s in spans) / 1e9,
+                "slowest": max(spans, key=lambda s: s.duration).name,
+                "max": max(s.duration for s in spans) / 1e9,
+            })
+
+        return sorted(rows, key=lambda r: r["wall"], reverse=True)
+
+    def write_chrome_trace(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+_tracer = None
+
+
+def enable() -> Tracer:
+    """Starts recording spans, if not already"""
+    global _tracer
+
+    if _tracer is None:
+        _tracer = Tracer()
+
+    return _tracer
+
+
+def disable() -> None:
+    global _tracer
+    _tracer = None
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+
+def span(name: str, category: str, **args):
+    """Context manager timing its block as a span. Costs next to nothing
+    while tracing is off.
+    """
+    if _tracer is None:
+        return _NO_SPAN
+
+    return _tracer.span(name, category, **args)
+
+
+def traced(category: str, name: Optional[str] = None):
+    """Decorator recording each call of a function as a span"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+
+            with _tracer.span(span_name, category):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,392 @@
+import os
+import re
+import time
+import stat
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from typing import Iterable, Iterator, Optional, Tuple
+
+from onedep_manager.paths import PathResolver
+
+
+# locations that hold one directory per deposition
+SCAN_TYPES = ('tempdep', 'deposit', 'archive', 'upload', 'pickles', 'wfinst')
+SCAN_WORKERS = 8
+
+_DEP_ID = re.compile(r"D_(\d+)", re.IGNORECASE)
+_MOCK_DEP_ID = "D_000000"
+
+
+@dataclass
+class TreeUsage:
+    dep_id: str
+    location: str
+    path: str
+    files: int = 0
+    size: int = 0
+    # newest modification time in the tree, the directory itself included
+    mtime: float = 0
+
+
+def dep_id_number(dep_id: str) -> Optional[int]:
+    match = _DEP_ID.fullmatch(dep_id)
+    return int(match.group(1)) if match else None
+
+
+def _in_range(dep_id: str, first: Optional[int], last: Optional[int]) -> bool:
+    number = dep_id_number(dep_id)
+
+    if number is None:
+        return first is None and last is None
+
+    return (first is None or number >= first) and (last is None or number <= last)
+
+
+def location_roots(resolver: PathResolver, types: Iterable[str] = SCAN_TYPES) -> dict:
+    """Directories holding the per deposition directories of each type,
+    derived from the path of a mock deposition.
+    """
+    roots = {}
+
+    for type_ in types:
+        if type_ == 'wfinst':
+            roots[type_] = resolver.resolve(type_, f"{_MOCK_DEP_ID}:W_001").rsplit('/', 3)[0]
+        else:
+            roots[type_] = resolver.resolve(type_, _MOCK_DEP_ID).rsplit('/', 1)[0]
+
+    return roots
+
+
+def walk_usage(path: str) -> Tuple[int, int, float]:
+    """Returns the number of files, their total size and the newest
+    modification time under `path`. The walk is iterative and keeps only
+    pending directories in memory, never the file listings.
+    """
+    files, size = 0, 0
+    pending = [path]
+
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        mtime = 0
+
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+
+                    mtime = max(mtime, st.st_mtime)
+
+                    if stat.S_ISDIR(st.st_mode):
+                        pending.append(entry.path)
+                    else:
+                        files += 1
+                        size += st.st_size
+        except OSError:
+            # vanished or unreadable directories don't stop the scan
+            continue
+
+    return files, size, mtime
+
+
+def find_depositions(root: str, first: Optional[int] = None, last: Optional[int] = None) -> Iterator[str]:
+    """Yields the deposition ids that have a directory in `root`,
+    optionally restricted to the numeric range [first, last].
+    """
+    try:
+        with os.scandir(root) as it:
+            for entry in it:
+                number = dep_id_number(entry.name)
+
+                if number is None or not entry.is_dir(follow_symlinks=False):
+                    continue
+
+                if (first is not None and number < first) or (last is not None and number > last):
+                    continue
+
+                yield entry.name
+    except OSError:
+        return
+
+
+def scan(roots: dict, dep_ids: Optional[Iterable[str]] = None, first: Optional[int] = None, last: Optional[int] = None,
+         older_than: Optional[float] = None, newer_than: Optional[float] = None, workers: int = SCAN_WORKERS) -> Iterator[TreeUsage]:
+    """Measures the deposition directories of each location in `roots`
+    (type -> root directory) and yields a TreeUsage per existing
+    directory, in completion order.
+
+    Depositions are `dep_ids` if given, or those found in each root.
+    `older_than` and `newer_than` are ages in seconds, compared to the
+    newest modification in each tree. At most `2 * workers` trees are
+    in flight at once, so memory stays bounded however many there are.
+    """
+    now = time.time()
+
+    if dep_ids is not None:
+        dep_ids = list(dep_ids)
+
+    def targets():
+        for location, root in roots.items():
+            if dep_ids is None:
+                ids = find_depositions(root, first, last)
+            else:
+                ids = (d for d in dep_ids if _in_range(d, first, last))
+
+            for dep_id in ids:
+                path = os.path.join(root, dep_id)
+
+                if os.path.isdir(path):
+                    yield TreeUsage(dep_id=dep_id, location=location, path=path)
+
+    def measure(usage):
+        usage.files, usage.size, usage.mtime = walk_usage(usage.path)
+        return usage
+
+    def keep(usage):
+        age = now - usage.mtime
+        return (older_than is None or age >= older_than) and (newer_than is None or age <= newer_than)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = set()
+
+        for usage in targets():
+            if len(in_flight) >= 2 * workers:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                yield from (f.result() for f in done if keep(f.result()))
+
+            in_flight.add(executor.submit(measure, usage))
+
+        for future in as_completed(in_flight):
+            if keep(future.result()):
+                yield future.result()
+
+
+class RateLimiter:
+    """Spaces calls to `wait` so there are at most `rate` per second.
+    No limit if `rate` is None or 0.
+    """
+    def __init__(self, rate: Optional[float] = None) -> None:
+        self._interval = 1 / rate if rate else 0
+        self._next = 0
+
+    def wait(self) -> None:
+        if not self._interval:
+            return
+
+        now = time.monotonic()
+
+        if now < self._next:
+            time.sleep(self._next - now)
+            now = self._next
+
+        self._next = now + self._interval
+
+
+class UsageIndex:
+    """Persistent index of the size of deposition trees, kept in SQLite.
+
+    Each directory is recorded with its mtime and the count and size of
+    the files directly in it. On refresh, directories whose mtime didn't
+    change are not listed again: their subdirectories (known from the
+    index) are only stat'ed. Files rewritten in place don't change the
+    mtime of their directory, so their new size is only picked up once
+    something is added to or removed from that directory.
+
+    Refreshes commit after each deposition and remember where they got
+    to, so an interrupted refresh continues from there on the next run.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS dirs (
+            path TEXT PRIMARY KEY,
+            parent TEXT,
+            mtime REAL,
+            files INTEGER,
+            size INTEGER,
+            newest REAL
+        );
+        CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+        CREATE TABLE IF NOT EXISTS trees (
+            path TEXT PRIMARY KEY,
+            location TEXT,
+            dep_id TEXT,
+            dep_number INTEGER,
+            files INTEGER,
+            size INTEGER,
+            newest REAL,
+            scanned_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS trees_size ON trees (location, size);
+        CREATE INDEX IF NOT EXISTS trees_newest ON trees (location, newest);
+        CREATE TABLE IF NOT EXISTS state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, db_file: str) -> None:
+        import sqlite3
+
+        self.db_file = db_file
+        self._db = sqlite3.connect(db_file)
+        self._db.executescript(self.SCHEMA)
+        self._limiter = RateLimiter()
+
+    def close(self) -> None:
+        self._db.close()
+
+    def _get_state(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value: Optional[str]) -> None:
+        if value is None:
+            self._db.execute("DELETE FROM state WHERE key = ?", (key,))
+        else:
+            self._db.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+
+    def _forget(self, path: str) -> None:
+        """Removes a directory and everything under it from the index"""
+        prefix = path.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        self._db.execute("DELETE FROM dirs WHERE path = ? OR path LIKE ? ESCAPE '\\'", (path, f"{prefix}/%"))
+
+    def _refresh_dir(self, path: str, mtime: float) -> Tuple[int, int, float]:
+        """Returns the number of files, total size and newest mtime of
+        the tree at `path`, listing only the directories that changed.
+        """
+        row = self._db.execute("SELECT mtime, files, size, newest FROM dirs WHERE path = ?", (path,)).fetchone()
+
+        if row is not None and row[0] == mtime:
+            files, size, newest = row[1:]
+            children = []
+
+            for (child,) in self._db.execute("SELECT path FROM dirs WHERE parent = ?", (path,)).fetchall():
+                self._limiter.wait()
+
+                try:
+                    children.append((child, os.stat(child).st_mtime))
+                except OSError:
+                    self._forget(child)
+        else:
+            files, size, newest = 0, 0, mtime
+            children = []
+            self._limiter.wait()
+
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        try:
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+
+                        if stat.S_ISDIR(st.st_mode):
+                            children.append((entry.path, st.st_mtime))
+                        else:
+                            files += 1
+                            size += st.st_size
+                            newest = max(newest, st.st_mtime)
+            except OSError:
+                self._forget(path)
+                return 0, 0, 0
+
+            known = {p for (p,) in self._db.execute("SELECT path FROM dirs WHERE parent = ?", (path,))}
+
+            for gone in known - {child for child, _ in children}:
+                self._forget(gone)
+
+            self._db.execute("INSERT OR REPLACE INTO dirs (path, parent, mtime, files, size, newest) VALUES (?, ?, ?, ?, ?, ?)",
+                             (path, os.path.dirname(path), mtime, files, size, newest))
+
+        for child, child_mtime in children:
+            child_files, child_size, child_newest = self._refresh_dir(child, child_mtime)
+            files += child_files
+            size += child_size
+            newest = max(newest, child_mtime, child_newest)
+
+        return files, size, newest
+
+    def refresh(self, roots: dict, first: Optional[int] = None, last: Optional[int] = None, rate: Optional[float] = None) -> Iterator[TreeUsage]:
+        """Brings the index up to date with the deposition directories
+        of each location in `roots` (type -> root directory), yielding a
+        TreeUsage as each deposition is done. `rate` limits the number
+        of directories listed or stat'ed per second.
+        """
+        self._limiter = RateLimiter(rate)
+
+        for location, root in roots.items():
+            key = f"refresh:{location}:{first}:{last}"
+            cursor = self._get_state(key)
+
+            if cursor is None:
+                pass_start, resume_after = time.time(), -1
+            else:
+                pass_start, resume_after = (float(v) for v in cursor.split(":"))
+
+            dep_ids = sorted(find_depositions(root, first, last), key=dep_id_number)
+
+            for dep_id in dep_ids:
+                number = dep_id_number(dep_id)
+
+                if number <= resume_after:
+                    continue
+
+                path = os.path.join(root, dep_id)
+                self._limiter.wait()
+
+                try:
+                    mtime = os.stat(path).st_mtime
+                except OSError:
+                    continue
+
+                files, size, newest = self._refresh_dir(path, mtime)
+                usage = TreeUsage(dep_id=dep_id, location=location, path=path, files=files, size=size, mtime=newest)
+
+                self._db.execute("INSERT OR REPLACE INTO trees (path, location, dep_id, dep_number, files, size, newest, scanned_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                 (path, location, dep_id, number, files, size, newest, time.time()))
+                self._set_state(key, f"{pass_start}:{number}")
+                self._db.commit()
+
+                yield usage
+
+            # depositions not seen in a complete pass are gone
+            stale = self._db.execute(
+                "SELECT path FROM trees WHERE location = ? AND scanned_at < ? AND dep_number >= ? AND dep_number <= ?",
+                (location, pass_start, first if first is not None else -1, last if last is not None else 2**63 - 1),
+            ).fetchall()
+
+            for (path,) in stale:
+                self._forget(path)
+                self._db.execute("DELETE FROM trees WHERE path = ?", (path,))
+
+            self._set_state(key, None)
+            self._db.commit()
+
+    def _trees(self, where: str, params: tuple, order: str, limit: Optional[int]) -> list:
+        query = f"SELECT dep_id, location, path, files, size, newest FROM trees WHERE {where} ORDER BY {order}"
+
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+
+        return [TreeUsage(dep_id=r[0], location=r[1], path=r[2], files=r[3], size=r[4], mtime=r[5]) for r in self._db.execute(query, params)]
+
+    def top(self, limit: int = 50, locations: Optional[Iterable[str]] = None) -> list:
+        """Largest deposition trees"""
+        locations = tuple(locations or SCAN_TYPES)
+        where = f"location IN ({', '.join('?' * len(locations))})"
+        return self._trees(where, locations, "size DESC", limit)
+
+    def older(self, days: float, locations: Optional[Iterable[str]] = None, limit: Optional[int] = None) -> list:
+        """Deposition trees not modified in `days` days, oldest first"""
+        locations = tuple(locations or SCAN_TYPES)
+        where = f"location IN ({', '.join('?' * len(locations))}) AND newest < ?"
+        return self._trees(where, locations + (time.time() - days * 24 * 3600,), "newest ASC", limit)
+
+
+def get_usage_index() -> UsageIndex:
+    from onedep_manager.config import get_config
+
+    return UsageIndex(os.path.join(get_config().ODM_CONFIG_DIR, "usage.db"))
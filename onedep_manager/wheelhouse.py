@@ -0,0 +1,184 @@
+import os
+import re
+import json
+import logging
+import subprocess
+
+from onedep_manager.config import get_config
+from onedep_manager.packages import _normalize
+from onedep_manager.tracing import span
+
+
+logger = logging.getLogger(__name__)
+
+# what pip builds projects without a [build-system] table with (PEP 517)
+DEFAULT_BUILD_REQUIRES = ["setuptools>=40.8.0", "wheel"]
+
+
+def _wheel_project(filename: str) -> str:
+    """Normalized project name of a wheel file,
+    from `{name}-{version}(-{build})?-{python}-{abi}-{platform}.whl`
+    """
+    return _normalize(filename.split("-", 1)[0])
+
+
+def _wheel_version(filename: str) -> str:
+    return filename.split("-")[1]
+
+
+def requirement_name(requirement: str) -> str:
+    """Project name of a requirement, e.g. 'setuptools' for
+    'setuptools>=40.8.0; python_version >= "3.8"'
+    """
+    return re.split(r"[\s<>=!~;\[@(]", requirement.strip(), 1)[0]
+
+
+def build_requires(source: str) -> list:
+    """Requirements needed to build the project checked out in
+    `source`, from the `requires` of its pyproject.toml [build-system]
+    table. Read with a regular expression, as tomllib is not available
+    before Python 3.11.
+    """
+    try:
+        with open(os.path.join(source, "pyproject.toml")) as f:
+            pyproject = f.read()
+    except OSError:
+        return list(DEFAULT_BUILD_REQUIRES)
+
+    table = re.search(r"^\[build-system\][^\[]*?^requires\s*=\s*\[(.*?)\]", pyproject, re.MULTILINE | re.DOTALL)
+
+    if table is None:
+        return list(DEFAULT_BUILD_REQUIRES)
+
+    return re.findall(r"[\"']([^\"']+)[\"']", table.group(1))
+
+
+class Wheelhouse:
+    """Directory of built wheels that `pip install` can use with
+    `--find-links`, so packages can be reinstalled, or rolled out to
+    other hosts with the same deploy path, without downloading or
+    building them again. With `--no-index`, installs are made from the
+    wheelhouse only.
+
+    `manifest.json` maps keys made of the package name and the version
+    pip resolved to the wheel built for them. `install` uses it to skip
+    `pip wheel` for packages that already have one.
+    """
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self._manifest_file = os.path.join(root, "manifest.json")
+        os.makedirs(root, exist_ok=True)
+        self._manifest = self._load()
+
+    def _load(self) -> dict:
+        try:
+            with open(self._manifest_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self) -> None:
+        with open(self._manifest_file, "w") as f:
+            json.dump(self._manifest, f, indent=2)
+
+    @staticmethod
+    def key(name: str, version: str) -> str:
+        return f"{_normalize(name)}=={version}"
+
+    def has(self, key: str) -> bool:
+        filename = self._manifest.get(key)
+        return filename is not None and os.path.exists(os.path.join(self.root, filename))
+
+    def missing(self, targets: list) -> list:
+        """(name, requirement) targets with no wheel in the manifest"""
+        built = {key.split("==", 1)[0] for key in self._manifest if self.has(key)}
+        return [(name, requirement) for name, requirement in targets if _normalize(name) not in built]
+
+    def wheels(self) -> list:
+        return sorted(f for f in os.listdir(self.root) if f.endswith(".whl"))
+
+    def fill(self, targets: list) -> bool:
+        """Builds wheels for (name, requirement) targets, and their
+        dependencies, with a single `pip wheel` run. Wheels already in
+        the wheelhouse are reused by pip.
+
+        Returns:
+            bool: True if all wheels were built, False otherwise.
+        """
+        if not targets:
+            return True
+
+        try:
+            with span("pip wheel", "pip", packages=len(targets)):
+                result = subprocess.run(["pip", "wheel", "-w", self.root, *self.pip_args()] + [requirement for _, requirement in targets], text=True, capture_output=True)
+
+            logger.debug(result.stdout.strip())
+            logger.debug(result.stderr.strip())
+        except Exception as e:
+            logger.error(e)
+            return False
+
+        saved = {}
+        for line in result.stdout.splitlines():
+            line = line.strip()
+
+            for prefix in ("Saved ", "File was already downloaded "):
+                if line.startswith(prefix):
+                    filename = os.path.basename(line[len(prefix):])
+                    saved[_wheel_project(filename)] = filename
+
+        for name, _ in targets:
+            filename = saved.get(_normalize(name))
+
+            if filename is not None:
+                self._manifest[self.key(name, _wheel_version(filename))] = filename
+
+        self._save()
+
+        return result.returncode == 0
+
+    def pip_args(self, offline: bool = False) -> list:
+        """Arguments that make pip use the wheelhouse"""
+        args = ["--find-links", self.root]
+
+        if offline:
+            args.append("--no-index")
+
+        return args
+
+    def size(self) -> tuple:
+        """Returns the number of wheels and their total size in bytes"""
+        wheels = self.wheels()
+        return len(wheels), sum(os.path.getsize(os.path.join(self.root, w)) for w in wheels)
+
+    def prune(self, keep: int = 1) -> tuple:
+        """Keeps only the `keep` newest wheels of each project.
+
+        Returns:
+            tuple: Number of wheels removed and bytes freed.
+        """
+        projects = {}
+
+        for wheel in self.wheels():
+            projects.setdefault(_wheel_project(wheel), []).append(wheel)
+
+        removed, freed = 0, 0
+
+        for wheels in projects.values():
+            wheels.sort(key=lambda w: os.path.getmtime(os.path.join(self.root, w)), reverse=True)
+
+            for wheel in wheels[keep:]:
+                path = os.path.join(self.root, wheel)
+                freed += os.path.getsize(path)
+                os.remove(path)
+                removed += 1
+
+        self._manifest = {k: f for k, f in self._manifest.items() if os.path.exists(os.path.join(self.root, f))}
+        self._save()
+
+        return removed, freed
+
+
+def get_wheelhouse() -> Wheelhouse:
+    config = get_config()
+    return Wheelhouse(os.path.join(config.from_site("SITE_DEPLOY_PATH"), "wheelhouse"))
@@ -1,7 +1,10 @@
+import time
 import pytest
+import threading
+from unittest.mock import MagicMock
 from click.testing import CliRunner
 
-from onedep_manager.cli.packages import get, update, install
+from onedep_manager.cli.packages import get, update, install, packages_group
 from onedep_manager.schemas import PackageDistribution
 
 from wwpdb.utils.config.ConfigInfoData import ConfigInfoData
@@ -17,9 +20,10 @@ def mock_config(monkeypatch):
 
 
 def test_get(monkeypatch, mock_config):
+    monkeypatch.setattr("onedep_manager.cli.packages.get_package_cache", lambda: None)
     monkeypatch.setattr(
         "onedep_manager.cli.packages.get_wwpdb_packages",
-        lambda name=None, branch=None: [
+        lambda name=None, branch=None, **kwargs: [
             PackageDistribution(name="wwpdb.utils.config", version="0.1.0", path="/foo/bar/wwpdb.utils.config", branch="master"),
             PackageDistribution(name="wwpdb.utils.foobar", version="0.2.0", path="/top/dir/wwpdb.utils.foobar")
         ]
@@ -39,6 +43,26 @@ def test_get(monkeypatch, mock_config):
     assert "${ONEDEP_PATH}/wwpdb.utils" in result.output
 
 
+def test_get_keeps_package_order(monkeypatch, mock_config):
+    monkeypatch.setattr("onedep_manager.cli.packages.get_package_cache", lambda: None)
+    # as if wwpdb.io had finished its git checks first
+    monkeypatch.setattr(
+        "onedep_manager.cli.packages.get_wwpdb_packages",
+        lambda name=None, branch=None, **kwargs: [
+            PackageDistribution(name="wwpdb.utils.db", version="0.3.0", path="/foo/wwpdb.utils.db", branch="master"),
+            PackageDistribution(name="wwpdb.io", version="0.2.0", path="/foo/wwpdb.io", branch="master"),
+            PackageDistribution(name="wwpdb.utils.config", version="0.1.0", path="/foo/wwpdb.utils.config", branch="master"),
+        ]
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(get, ["all"])
+
+    assert result.exit_code == 0
+    positions = [result.output.index(name) for name in ("wwpdb.utils.config", "wwpdb.io", "wwpdb.utils.db")]
+    assert positions == sorted(positions)
+
+
 def test_update(monkeypatch, mock_config):
     monkeypatch.setattr(
         "onedep_manager.cli.packages.pull",
@@ -64,7 +88,17 @@ def test_update(monkeypatch, mock_config):
     assert "0.1.0 -> 0.2.0" in result.output
 
 
-def test_install_dev(monkeypatch, mock_config):
+@pytest.fixture
+def mock_pip(monkeypatch):
+    """Installs report pip's exit code, so don't run the real pip"""
+    mock_run = MagicMock()
+    mock_run.return_value.returncode = 0
+    mock_run.return_value.stdout = mock_run.return_value.stderr = ""
+    monkeypatch.setattr("onedep_manager.packages.subprocess.run", mock_run)
+    return mock_run
+
+
+def test_install_dev(monkeypatch, mock_config, mock_pip):
     monkeypatch.setattr(
         "onedep_manager.cli.packages.get_package",
         lambda name=None, branch=None: PackageDistribution(name="wwpdb.utils.config", version="0.1.0", path="/foo/bar/wwpdb.utils.config", branch="master"),
@@ -83,7 +117,24 @@ def test_install_dev(monkeypatch, mock_config):
     assert "master" in result.output
 
 
-def test_install(monkeypatch, mock_config):
+def test_install_normalized_name(monkeypatch, mock_config, mock_pip):
+    mock_clone = MagicMock(return_value="/foo/bar/wwpdb.utils.config")
+    monkeypatch.setattr("onedep_manager.cli.packages.clone", mock_clone)
+    monkeypatch.setattr("onedep_manager.cli.packages.get_package", lambda name=None, branch=None: None)
+
+    runner = CliRunner()
+    result = runner.invoke(install, ["-d", "WWPDB_Utils-Config"])
+
+    assert result.exit_code == 0
+    mock_clone.assert_called_once_with(package_name="py-wwpdb_utils_config", reference="develop")
+
+    result = runner.invoke(install, ["wwpdb_io"])
+
+    assert result.exit_code == 0
+    assert mock_pip.call_args[0][0][-1] == "wwpdb.io"
+
+
+def test_install(monkeypatch, mock_config, mock_pip):
     monkeypatch.setattr(
         "onedep_manager.cli.packages.get_package",
         lambda name=None, branch=None: PackageDistribution(name="wwpdb.utils.config", version="0.1.0", path="/foo/bar/wwpdb.utils.config"),
@@ -100,3 +151,147 @@ def test_install(monkeypatch, mock_config):
     assert "0.1.0" in result.output
     assert "/foo/bar/wwpdb.utils.config" in result.output
     assert "master" not in result.output
+
+
+@pytest.fixture
+def two_packages(monkeypatch):
+    monkeypatch.setattr("onedep_manager.cli.packages.pull", lambda package: True)
+    monkeypatch.setattr(
+        "onedep_manager.cli.packages.get_wwpdb_packages",
+        lambda name=None, branch=None, **kwargs: [
+            PackageDistribution(name="wwpdb.utils.config", version="0.1.0", path="/foo/bar/wwpdb.utils.config", branch="master", editable=True),
+            PackageDistribution(name="wwpdb.io", version="0.1.0", path=None),
+        ]
+    )
+    monkeypatch.setattr(
+        "onedep_manager.cli.packages.get_package",
+        lambda name=None, branch=None: PackageDistribution(name=name, version="0.2.0", path=None),
+    )
+
+
+def test_update_all_batched(monkeypatch, mock_config, two_packages):
+    mock_batch = MagicMock(return_value=True)
+    mock_single = MagicMock(return_value=True)
+    monkeypatch.setattr("onedep_manager.cli.packages.install_packages", mock_batch)
+    monkeypatch.setattr("onedep_manager.cli.packages.install_package", mock_single)
+
+    runner = CliRunner()
+    result = runner.invoke(update, ["all"])
+
+    assert result.exit_code == 0
+    mock_batch.assert_called_once_with([("/foo/bar/wwpdb.utils.config", True), ("wwpdb.io", False)])
+    mock_single.assert_not_called()
+    assert result.output.count("0.1.0 -> 0.2.0") == 2
+
+
+def test_update_all_batch_failure(monkeypatch, mock_config, two_packages):
+    monkeypatch.setattr("onedep_manager.cli.packages.install_packages", MagicMock(return_value=False))
+    mock_single = MagicMock(side_effect=lambda source, edit=False: source != "wwpdb.io")
+    monkeypatch.setattr("onedep_manager.cli.packages.install_package", mock_single)
+
+    runner = CliRunner()
+    result = runner.invoke(update, ["all"])
+
+    assert result.exit_code == 0
+    assert mock_single.call_count == 2
+    assert "Failed to update 'wwpdb.io'" in result.output
+    assert result.output.count("0.1.0 -> 0.2.0") == 1
+
+
+def test_update_pulls_concurrently(monkeypatch, mock_config):
+    packages = [PackageDistribution(name=f"wwpdb.utils.p{i}", version="0.1.0", path=f"/foo/p{i}", branch="master", editable=True) for i in range(4)]
+    installing = threading.Lock()
+    # only lets the pulls through once all four are running at the same time
+    pulling = threading.Barrier(4, timeout=5)
+
+    def concurrent_pull(package):
+        pulling.wait()
+        return True
+
+    def serial_install(source, edit=False):
+        # installs must never overlap
+        assert installing.acquire(blocking=False)
+        time.sleep(0.01)
+        installing.release()
+        return True
+
+    monkeypatch.setattr("onedep_manager.cli.packages.get_wwpdb_packages", lambda name=None, branch=None, **kwargs: packages)
+    monkeypatch.setattr("onedep_manager.cli.packages.pull", concurrent_pull)
+    monkeypatch.setattr("onedep_manager.cli.packages.install_package", serial_install)
+    monkeypatch.setattr(
+        "onedep_manager.cli.packages.get_package",
+        lambda name=None, branch=None: PackageDistribution(name=name, version="0.2.0", path=None),
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(update, ["all", "--no-batch", "-j", "4"])
+
+    assert result.exit_code == 0
+    assert not pulling.broken
+    assert result.output.count("0.1.0 -> 0.2.0") == 4
+
+
+def test_update_all_wheelhouse(monkeypatch, mock_config, two_packages):
+    wheelhouse = MagicMock()
+    wheelhouse.fill.return_value = True
+    wheelhouse.pip_args.return_value = ["--find-links", "/wheelhouse"]
+    mock_batch = MagicMock(return_value=True)
+    monkeypatch.setattr("onedep_manager.cli.packages.get_wheelhouse", lambda: wheelhouse)
+    monkeypatch.setattr("onedep_manager.cli.packages.build_requires", lambda source: ["setuptools>=40.8.0", "wheel"])
+    monkeypatch.setattr("onedep_manager.cli.packages.install_packages", mock_batch)
+
+    runner = CliRunner()
+    result = runner.invoke(update, ["all", "--wheelhouse"])
+
+    assert result.exit_code == 0
+    # the editable package is built from its checkout, only its build dependencies are fetched
+    wheelhouse.fill.assert_called_once_with([("setuptools", "setuptools>=40.8.0"), ("wheel", "wheel"), ("wwpdb.io", "wwpdb.io")])
+    mock_batch.assert_called_once_with([("/foo/bar/wwpdb.utils.config", True), ("wwpdb.io", False)], pip_args=["--find-links", "/wheelhouse"])
+    # update looks for new versions even if there are wheels already
+    wheelhouse.missing.assert_not_called()
+
+
+def test_install_reuses_wheels(monkeypatch, mock_config):
+    wheelhouse = MagicMock()
+    wheelhouse.missing.return_value = []
+    wheelhouse.pip_args.return_value = ["--find-links", "/wheelhouse"]
+    mock_single = MagicMock(return_value=True)
+    monkeypatch.setattr("onedep_manager.cli.packages.get_wheelhouse", lambda: wheelhouse)
+    monkeypatch.setattr("onedep_manager.cli.packages.install_package", mock_single)
+    monkeypatch.setattr("onedep_manager.cli.packages.get_package", lambda name=None, branch=None: None)
+
+    runner = CliRunner()
+    result = runner.invoke(install, ["wwpdb.io", "--wheelhouse"])
+
+    assert result.exit_code == 0
+    wheelhouse.missing.assert_called_once_with([("wwpdb.io", "wwpdb.io")])
+    wheelhouse.fill.assert_not_called()
+    mock_single.assert_called_once_with("wwpdb.io", edit=False, pip_args=["--find-links", "/wheelhouse"])
+
+
+def test_wheelhouse_prune_keeps_one(monkeypatch, mock_config):
+    wheelhouse = MagicMock()
+    monkeypatch.setattr("onedep_manager.cli.packages.get_wheelhouse", lambda: wheelhouse)
+
+    runner = CliRunner()
+    result = runner.invoke(packages_group, ["wheelhouse", "prune", "--keep", "0"])
+
+    assert result.exit_code == 2
+    wheelhouse.prune.assert_not_called()
+
+
+def test_install_offline(monkeypatch, mock_config):
+    wheelhouse = MagicMock()
+    wheelhouse.pip_args.return_value = ["--find-links", "/wheelhouse", "--no-index"]
+    mock_single = MagicMock(return_value=True)
+    monkeypatch.setattr("onedep_manager.cli.packages.get_wheelhouse", lambda: wheelhouse)
+    monkeypatch.setattr("onedep_manager.cli.packages.install_package", mock_single)
+    monkeypatch.setattr("onedep_manager.cli.packages.get_package", lambda name=None, branch=None: None)
+
+    runner = CliRunner()
+    result = runner.invoke(install, ["wwpdb.io", "--offline"])
+
+    assert result.exit_code == 0
+    wheelhouse.fill.assert_not_called()
+    wheelhouse.pip_args.assert_called_once_with(offline=True)
+    mock_single.assert_called_once_with("wwpdb.io", edit=False, pip_args=["--find-links", "/wheelhouse", "--no-index"])
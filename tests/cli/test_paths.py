@@ -0,0 +1,101 @@
+import json
+import pytest
+from unittest.mock import MagicMock
+from click.testing import CliRunner
+
+from onedep_manager.cli.paths import get, batch, scan, usage_group
+from onedep_manager.usage import UsageIndex
+
+
+@pytest.fixture
+def mock_locators(monkeypatch):
+    pathinfo = MagicMock()
+    pathinfo.return_value.getDepositPath.side_effect = lambda dataSetId: f"/deposit/{dataSetId}"
+    pathinfo.return_value.getArchivePath.side_effect = lambda dataSetId: f"/archive/{dataSetId}"
+    monkeypatch.setattr("onedep_manager.paths.PathInfo", pathinfo)
+
+    return pathinfo
+
+
+def test_get(mock_locators):
+    runner = CliRunner()
+    result = runner.invoke(get, ["deposit", "D_1000"])
+
+    assert result.exit_code == 0
+    assert result.output == "/deposit/D_1000\n"
+
+
+def test_get_invalid_type(mock_locators):
+    runner = CliRunner()
+    result = runner.invoke(get, ["foo", "D_1000"])
+
+    assert result.exit_code == 0
+    assert "Invalid path type: foo" in result.output
+
+
+def test_batch(mock_locators):
+    runner = CliRunner()
+    result = runner.invoke(batch, ["archive"], input="D_1000\n\ndeposit:D_1001\nD_1002\n")
+
+    assert result.exit_code == 0
+    assert result.output == "D_1000\t/archive/D_1000\nD_1001\t/deposit/D_1001\nD_1002\t/archive/D_1002\n"
+    mock_locators.assert_called_once()
+
+
+def test_batch_file_jsonl(mock_locators, tmp_path):
+    ids = tmp_path / "ids.txt"
+    ids.write_text("deposit:D_1000\nwfinst:D_1000\nD_1001\n")
+
+    runner = CliRunner()
+    result = runner.invoke(batch, ["-f", str(ids), "--jsonl"])
+
+    lines = [json.loads(l) for l in result.output.splitlines()]
+
+    assert result.exit_code == 1
+    assert lines[0] == {"type": "deposit", "id": "D_1000", "path": "/deposit/D_1000", "error": None}
+    assert lines[1]["path"] is None and "Invalid workflow instance" in lines[1]["error"]
+    assert lines[2] == {"type": None, "id": "D_1001", "path": None, "error": "No path type given"}
+
+
+def test_scan(monkeypatch, tmp_path):
+    (tmp_path / "deposit" / "D_1000").mkdir(parents=True)
+    (tmp_path / "deposit" / "D_1000" / "model.cif").write_bytes(b"0" * 2048)
+    monkeypatch.setattr("onedep_manager.cli.paths.location_roots", lambda resolver, types: {"deposit": str(tmp_path / "deposit"), "archive": str(tmp_path / "archive")})
+
+    runner = CliRunner()
+    result = runner.invoke(scan, [])
+
+    assert result.exit_code == 0
+    assert "D_1000" in result.output
+    assert "2.0 KB" in result.output
+
+    result = runner.invoke(scan, ["--jsonl", "--to", "D_999"])
+    assert result.exit_code == 0
+    assert result.output == ""
+
+    result = runner.invoke(scan, ["--jsonl", "D_1000"])
+    assert json.loads(result.output)["bytes"] == 2048
+
+    result = runner.invoke(scan, ["--from", "foo"])
+    assert result.exit_code != 0
+
+
+def test_usage(monkeypatch, tmp_path):
+    (tmp_path / "deposit" / "D_1000").mkdir(parents=True)
+    (tmp_path / "deposit" / "D_1000" / "model.cif").write_bytes(b"0" * 2048)
+    monkeypatch.setattr("onedep_manager.cli.paths.location_roots", lambda resolver, types: {"deposit": str(tmp_path / "deposit")})
+    monkeypatch.setattr("onedep_manager.cli.paths.get_usage_index", lambda: UsageIndex(str(tmp_path / "usage.db")))
+
+    runner = CliRunner()
+    result = runner.invoke(usage_group, ["refresh", "--rate", "100"])
+
+    assert result.exit_code == 0
+    assert "Indexed 1 trees (2.0 KB)" in result.output
+
+    result = runner.invoke(usage_group, ["top", "--jsonl"])
+    assert result.exit_code == 0
+    assert json.loads(result.output)["bytes"] == 2048
+
+    result = runner.invoke(usage_group, ["older", "30", "--jsonl"])
+    assert result.exit_code == 0
+    assert result.output == ""
@@ -1,11 +1,15 @@
+import json
 import shutil
 import pytest
 from unittest.mock import MagicMock
 from click.testing import CliRunner
+from rich.console import Console
 
-from onedep_manager.cli.services import start, stop, status
+from onedep_manager.cli.common import ConsolePrinter
+from onedep_manager.cli.services import start, stop, status, restart, _render_watch
 from wwpdb.utils.config.ConfigInfoData import ConfigInfoData
 from onedep_manager.services.schemas import Status, InstanceStatus
+from onedep_manager.services.watch import WatchState
 
 
 @pytest.fixture
@@ -58,3 +62,53 @@ def test_service_status(mock_config, monkeypatch):
     assert result.exit_code == 0
     assert "localhost" in result.output
     assert "running" in result.output
+
+
+def test_restart_local_rejects_rolling_options(monkeypatch):
+    mock_dispatch = MagicMock()
+    monkeypatch.setattr("onedep_manager.cli.services.LocalDispatcher", mock_dispatch)
+    runner = CliRunner()
+
+    for args, options in ((["-r"], "--rolling"), (["-b", "2"], "--batch"), (["-r", "--continue-on-failure"], "--rolling, --continue-on-failure")):
+        result = runner.invoke(restart, ["foo", "-l", *args])
+
+        assert result.exit_code == 2
+        assert f"{options} can't be used with --local" in result.output
+
+    mock_dispatch.assert_not_called()
+
+
+def test_status_all(monkeypatch):
+    mock_dispatch = MagicMock()
+    mock_dispatch.return_value.get_all_status.return_value = {
+        "host1": {"apache": InstanceStatus(hostname="host1", status=Status.RUNNING)},
+        "host2": {"apache": InstanceStatus(hostname="host2", status=Status.STOPPED), "wfe": InstanceStatus(hostname="host2", status=Status.RUNNING)},
+    }
+    monkeypatch.setattr("onedep_manager.cli.services.get_config", MagicMock())
+    monkeypatch.setattr("onedep_manager.cli.services.RemoteDispatcher", mock_dispatch)
+
+    runner = CliRunner()
+    result = runner.invoke(status, ["all"])
+
+    assert result.exit_code == 0
+    assert "wfe" in result.output
+    assert "stopped" in result.output
+
+    result = runner.invoke(status, ["all", "--json"])
+
+    assert result.exit_code == 0
+    assert json.loads(result.output) == {"host1": {"apache": "running"}, "host2": {"apache": "stopped", "wfe": "running"}}
+
+
+def test_render_watch():
+    state = WatchState({"host1": ["apache"], "host2": ["apache", "wfe"]})
+    state.update("host1", {"apache": InstanceStatus(hostname="host1", status=Status.STOPPED)})
+    state.update("host1", {"apache": InstanceStatus(hostname="host1", status=Status.RUNNING)})
+
+    console = Console(record=True, width=200)
+    console.print(_render_watch(ConsolePrinter(console=console), state))
+    output = console.export_text()
+
+    assert "wfe" in output
+    assert "running (since" in output
+    assert "stopped → running" in output
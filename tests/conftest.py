@@ -0,0 +1,39 @@
+import pytest
+
+from onedep_manager.config import clear_configs
+from onedep_manager.services.handlers import default_registry
+
+
+@pytest.fixture(autouse=True)
+def no_site_snapshot(monkeypatch):
+    """Most tests mock ConfigInfoData, so don't let them read (or write)
+    site config snapshots. tests/test_snapshot.py uses them directly.
+    """
+    monkeypatch.setattr("onedep_manager.config.open_snapshot", lambda *args, **kwargs: None)
+    monkeypatch.setattr("onedep_manager.cli.config.open_snapshot", lambda *args, **kwargs: None)
+
+
+@pytest.fixture(autouse=True)
+def fresh_configs():
+    """Tests mock the site config in different ways, so don't share
+    Config instances between them.
+    """
+    clear_configs()
+    yield
+    clear_configs()
+
+
+@pytest.fixture(autouse=True)
+def no_path_templates_cache(monkeypatch):
+    """Path templates depend on the mocked site config, don't keep them"""
+    monkeypatch.setattr("onedep_manager.paths.templates_cache_path", lambda *args, **kwargs: None)
+
+
+@pytest.fixture(autouse=True)
+def fresh_handlers():
+    """Test modules register different handler classes under the same
+    dotted path, so don't keep them between tests.
+    """
+    default_registry.clear()
+    yield
+    default_registry.clear()
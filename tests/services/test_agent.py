@@ -0,0 +1,125 @@
+import sys
+import socket
+import threading
+import pytest
+from unittest.mock import MagicMock
+
+from paramiko.ssh_exception import ChannelException
+
+from onedep_manager.config import Config
+from onedep_manager.services.agent import AgentServer
+from onedep_manager.services.dispatcher import RemoteDispatcher
+from onedep_manager.services.handlers import Handler
+from onedep_manager.services.schemas import Status
+
+
+class HandlerTest(Handler):
+    def __init__(self):
+        super().__init__(config=None)
+
+    def start(self):
+        return Status.RUNNING
+
+    restart = start
+
+    def stop(self):
+        return Status.STOPPED
+
+    status = stop
+
+
+@pytest.fixture
+def agent():
+    # hack to make sure we can import this module
+    sys.modules["tests.test_services"] = sys.modules[__name__]
+
+    server = AgentServer(config=Config(config_file="tests/fixtures/config.yaml"), port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _request(server, line):
+    with socket.create_connection(server.server_address) as conn:
+        conn.sendall(line)
+        return conn.makefile().readline().strip()
+
+
+def test_agent_runs_handler(agent):
+    assert _request(agent, b"3f1c8e0a9b start apache\n") == "running"
+
+
+def test_agent_bad_requests(agent):
+    assert _request(agent, b"3f1c8e0a9b start bar\n") == "failed"
+    assert _request(agent, b"3f1c8e0a9b dance apache\n") == "failed"
+    assert _request(agent, b"3f1c8e0a9b\n") == "failed"
+    assert _request(agent, b"\n") == "failed"
+
+
+def test_agent_requires_token(agent, monkeypatch):
+    handler = MagicMock(return_value=Status.RUNNING)
+    monkeypatch.setattr(HandlerTest, "start", handler)
+
+    assert _request(agent, b"start apache\n") == "failed"
+    assert _request(agent, b"wrongtoken start apache\n") == "failed"
+    handler.assert_not_called()
+
+    config = Config(config_file="tests/fixtures/config.yaml")
+    monkeypatch.setattr(config, "get_agent_token", lambda: None)
+
+    with pytest.raises(ValueError, match="agent_token"):
+        AgentServer(config=config, port=0)
+
+
+def test_dispatcher_prefers_agent(agent):
+    pool = MagicMock()
+    pool.open_tunnel.side_effect = lambda host, port, timeout: socket.create_connection(agent.server_address)
+
+    config = Config(config_file="tests/fixtures/config.yaml")
+    status = RemoteDispatcher(config=config, pool=pool).start_service("apache")
+
+    assert status[0].status == Status.RUNNING
+    pool.exec_command.assert_not_called()
+
+
+def test_dispatcher_falls_back_without_agent():
+    pool = MagicMock()
+    pool.open_tunnel.side_effect = ChannelException(2, "Connect failed")
+    pool.exec_command.return_value = "running"
+
+    config = Config(config_file="tests/fixtures/config.yaml")
+    status = RemoteDispatcher(config=config, pool=pool).start_service("apache")
+
+    assert status[0].status == Status.RUNNING
+    pool.exec_command.assert_called_once()
+    assert pool.exec_command.call_args[0][1] == "python -m tests.test_services start"
+
+
+def test_agent_several_services(agent):
+    assert _request(agent, b"3f1c8e0a9b status apache foo\n") == "apache=stopped foo=failed"
+
+
+def test_dispatcher_all_status_through_agent(agent):
+    pool = MagicMock()
+    pool.open_tunnel.side_effect = lambda host, port, timeout: socket.create_connection(agent.server_address)
+
+    config = Config(config_file="tests/fixtures/config.yaml")
+    matrix = RemoteDispatcher(config=config, pool=pool).get_all_status()
+
+    assert {name: s.status for name, s in matrix["localhost"].items()} == {"apache": Status.STOPPED, "foo": Status.FAILED}
+    # both services of the host in one request
+    pool.open_tunnel.assert_called_once()
+    pool.exec_command.assert_not_called()
+
+
+def test_dispatcher_needs_token_for_agent(monkeypatch):
+    pool = MagicMock()
+    pool.exec_command.return_value = "running"
+
+    config = Config(config_file="tests/fixtures/config.yaml")
+    monkeypatch.setattr(config, "get_agent_token", lambda: None)
+    status = RemoteDispatcher(config=config, pool=pool).start_service("apache")
+
+    assert status[0].status == Status.RUNNING
+    pool.open_tunnel.assert_not_called()
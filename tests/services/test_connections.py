@@ -0,0 +1,121 @@
+import socket
+import threading
+
+import paramiko
+import pytest
+
+from onedep_manager.services.connections import ConnectionPool
+
+
+class StandInServer(paramiko.ServerInterface):
+    """Accepts any password and answers every exec request with 'running'"""
+    def __init__(self) -> None:
+        self.commands = []
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_env_request(self, channel, name, value):
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        self.commands.append(command.decode("utf-8"))
+        threading.Thread(target=self._reply, args=(channel,), daemon=True).start()
+        return True
+
+    def _reply(self, channel):
+        # only send EOF: closing could beat the exec confirmation to the client
+        channel.sendall(b"running\n")
+        channel.send_exit_status(0)
+        channel.shutdown_write()
+
+
+class StandInSSHHost:
+    """Minimal SSH host listening on localhost. Counts the handshakes
+    it completes so tests can tell new connections from reused ones.
+    """
+    host_key = paramiko.RSAKey.generate(2048)
+
+    def __init__(self) -> None:
+        self.handshakes = 0
+        self.server = StandInServer()
+        self._transports = []
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(5)
+        self.port = self._sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(self.host_key)
+            transport.start_server(server=self.server)
+            self._transports.append(transport)
+            self.handshakes += 1
+
+    def close(self):
+        self._sock.close()
+
+        for transport in self._transports:
+            transport.close()
+
+
+@pytest.fixture
+def ssh_host():
+    host = StandInSSHHost()
+    yield host
+    host.close()
+
+
+def _pool(ssh_host, **kwargs):
+    return ConnectionPool(host_key_policy=paramiko.AutoAddPolicy(), port=ssh_host.port, username="odm", password="odm", allow_agent=False, look_for_keys=False, **kwargs)
+
+
+def test_reuses_connection(ssh_host):
+    pool = _pool(ssh_host)
+
+    assert pool.exec_command("127.0.0.1", "python -m foo status") == "running"
+    assert pool.exec_command("127.0.0.1", "python -m foo start") == "running"
+
+    # second command went over the same transport, no new handshake
+    assert ssh_host.handshakes == 1
+    assert ssh_host.server.commands == ["python -m foo status", "python -m foo start"]
+
+    pool.close()
+
+
+def test_replaces_broken_connection(ssh_host):
+    pool = _pool(ssh_host)
+
+    pool.exec_command("127.0.0.1", "python -m foo status")
+    pool.get("127.0.0.1").get_transport().close()
+
+    assert pool.exec_command("127.0.0.1", "python -m foo status") == "running"
+    assert ssh_host.handshakes == 2
+
+    pool.close()
+
+
+def test_evicts_idle_connection(ssh_host):
+    pool = _pool(ssh_host, idle_timeout=0)
+
+    pool.exec_command("127.0.0.1", "python -m foo status")
+    pool.exec_command("127.0.0.1", "python -m foo status")
+
+    assert ssh_host.handshakes == 2
+
+    pool.close()
@@ -1,18 +1,31 @@
 import sys
+import time
+import threading
+import yaml
 import pytest
 import socket
 from unittest.mock import MagicMock
 
-from onedep_manager.services.dispatcher import LocalDispatcher, RemoteDispatcher
-from onedep_manager.services.schemas import Status
+from onedep_manager.services.dispatcher import LocalDispatcher, RemoteDispatcher, batch_size
+from onedep_manager.services.connections import ConnectionPool
+from onedep_manager.services.handlers import Handler, HandlerRegistry
+from onedep_manager.services.schemas import Status, InstanceStatus
 from onedep_manager.config import Config
 
 
-class HandlerTest:
+class HandlerTest(Handler):
+    def __init__(self):
+        super().__init__(config=None)
+
     def start(self):
         print("service started succesfully")
         return Status.RUNNING
 
+    restart = status = start
+
+    def stop(self):
+        return Status.STOPPED
+
 
 def test_local_dispatcher():
     # hack to make sure we can import this module
@@ -34,14 +47,234 @@ def test_local_dispatcher():
         dispatcher.start_service("service2")
 
 
+def test_local_dispatcher_loads_handlers_lazily(caplog):
+    sys.modules["tests.test_services"] = sys.modules[__name__]
+
+    config = Config(config_file="tests/fixtures/config.yaml")
+    registry = HandlerRegistry()
+    dispatcher = LocalDispatcher(config=config, handlers=registry)
+
+    # foo's handler doesn't exist on this host, which is only a problem
+    # if foo is asked for
+    dispatcher.start_service("apache")
+    assert "foo" not in caplog.text
+
+    with pytest.raises(Exception):
+        dispatcher.start_service("foo")
+
+    assert "Handler of foo can't be used" in caplog.text
+
+
 def test_remote_dispatcher(monkeypatch):
     mock_ssh = MagicMock()
-    mock_ssh.return_value.exec_command.return_value = (None, "running", None)
-    monkeypatch.setattr("onedep_manager.services.dispatcher.SSHClient", mock_ssh)
+    mock_stdout = MagicMock()
+    mock_stdout.read.return_value = b"running"
+    mock_ssh.return_value.exec_command.return_value = (None, mock_stdout, None)
+    monkeypatch.setattr("onedep_manager.services.connections.SSHClient", mock_ssh)
 
     config = Config(config_file="tests/fixtures/config.yaml")
-    dispatcher = RemoteDispatcher(config=config)
+    dispatcher = RemoteDispatcher(config=config, pool=ConnectionPool(), use_agent=False)
     status = dispatcher.start_service("apache")
 
     assert status[0].hostname == "localhost"
     assert status[0].status == Status.RUNNING
+    assert status[0].ready_time is None
+
+    mock_stdout.read.return_value = b"running 0.250"
+    status = dispatcher.restart_service("apache")
+
+    assert status[0].status == Status.RUNNING
+    assert status[0].ready_time == 0.25
+
+    # only the last line is the reply, the handler may print before it
+    mock_stdout.read.return_value = b"stopped\nhttpd started in 2s\nrunning 2.000\n"
+    status = dispatcher.start_service("apache")
+
+    assert status[0].status == Status.RUNNING
+    assert status[0].ready_time == 2.0
+
+
+@pytest.fixture
+def farm_config(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    hosts = ["host1", "host2", "host3", "host4"]
+
+    with open(config_file, "w") as f:
+        yaml.dump({"services": [{"name": "apache", "description": "DepUI server", "handler": "tests.test_services.HandlerTest", "hosts": hosts}]}, f)
+
+    return Config(config_file=str(config_file))
+
+
+def test_remote_dispatcher_concurrent(farm_config, monkeypatch):
+    # all hosts are queried at once, so none answers until all four are asked
+    asked = threading.Barrier(4, timeout=5)
+
+    def slow_host(self, host, service, module, command):
+        asked.wait()
+        return InstanceStatus(hostname=host, status=Status.RUNNING, latency=0.3)
+
+    monkeypatch.setattr(RemoteDispatcher, "_run_onhost", slow_host)
+
+    dispatcher = RemoteDispatcher(config=farm_config)
+    streamed = []
+    status = dispatcher.get_status("apache", on_status=streamed.append)
+
+    assert not asked.broken
+    assert [s.hostname for s in status] == ["host1", "host2", "host3", "host4"]
+    assert all(s.status == Status.RUNNING for s in status)
+    assert len(streamed) == 4
+
+
+def test_remote_dispatcher_deadline(farm_config, monkeypatch):
+    release, answered = threading.Event(), threading.Event()
+
+    def dead_host(self, host, service, module, command):
+        if host == "host3":
+            # hangs until the test is over
+            release.wait(5)
+            answered.set()
+        return InstanceStatus(hostname=host, status=Status.RUNNING, latency=0.0)
+
+    monkeypatch.setattr(RemoteDispatcher, "_run_onhost", dead_host)
+
+    dispatcher = RemoteDispatcher(config=farm_config, timeout=0.2)
+    streamed = []
+
+    try:
+        status = dispatcher.restart_service("apache", on_status=streamed.append)
+        # returned at the deadline, without waiting for host3
+        assert not answered.is_set()
+    finally:
+        release.set()
+
+    assert status[2].hostname == "host3"
+    assert status[2].status == Status.UNKNOWN
+    assert [s.status for s in status if s.hostname != "host3"] == [Status.RUNNING] * 3
+    assert streamed[-1].hostname == "host3"
+
+
+def test_remote_dispatcher_waits_for_ready(farm_config):
+    def exec_command(host, command, environment, timeout):
+        # the handler answers once its service is up, after host_timeout
+        if timeout < 0.2:
+            raise TimeoutError("timed out")
+        return "running 0.200"
+
+    pool = MagicMock()
+    pool.exec_command.side_effect = exec_command
+    dispatcher = RemoteDispatcher(config=farm_config, pool=pool, use_agent=False, host_timeout=0.1, ready_timeout=0.5)
+
+    status = dispatcher.start_service("apache")
+    assert all(s.status == Status.RUNNING and s.ready_time == 0.2 for s in status)
+    assert {c.kwargs["timeout"] for c in pool.exec_command.call_args_list} == {0.6}
+
+    # status doesn't wait for anything, so host_timeout still applies
+    status = dispatcher.get_status("apache")
+    assert all(s.status == Status.FAILED for s in status)
+
+
+def test_batch_size():
+    assert batch_size(1, 4) == 1
+    assert batch_size("2", 4) == 2
+    assert batch_size("25%", 4) == 1
+    assert batch_size("30%", 4) == 2
+    assert batch_size("1%", 4) == 1
+
+    for invalid in ("0", "-1", "0%", "150%", "half"):
+        with pytest.raises(ValueError):
+            batch_size(invalid, 4)
+
+
+def test_rolling_restart(farm_config, monkeypatch):
+    running = set()
+    batches = []
+
+    def restart_host(self, host, service, module, command):
+        running.add(host)
+        batches.append(frozenset(running))
+        time.sleep(0.05)
+        running.discard(host)
+        return InstanceStatus(hostname=host, status=Status.RUNNING, latency=0.05)
+
+    monkeypatch.setattr(RemoteDispatcher, "_run_onhost", restart_host)
+
+    streamed = []
+    status = RemoteDispatcher(config=farm_config).rolling_restart("apache", batch="50%", on_status=streamed.append)
+
+    assert [s.hostname for s in status] == ["host1", "host2", "host3", "host4"]
+    assert all(s.status == Status.RUNNING for s in status)
+    assert len(streamed) == 4
+    # never more than one batch restarting at once, and in config order
+    assert max(len(b) for b in batches) <= 2
+    assert all(b <= {"host1", "host2"} or b <= {"host3", "host4"} for b in batches)
+
+
+def test_rolling_restart_abort(farm_config, monkeypatch):
+    def restart_host(self, host, service, module, command):
+        status = Status.FAILED if host == "host2" else Status.RUNNING
+        return InstanceStatus(hostname=host, status=status, latency=0.0)
+
+    monkeypatch.setattr(RemoteDispatcher, "_run_onhost", restart_host)
+    dispatcher = RemoteDispatcher(config=farm_config)
+
+    status = dispatcher.rolling_restart("apache", batch=1)
+    assert [s.status for s in status] == [Status.RUNNING, Status.FAILED, Status.SKIPPED, Status.SKIPPED]
+
+    status = dispatcher.rolling_restart("apache", batch=1, abort_on_failure=False)
+    assert [s.status for s in status] == [Status.RUNNING, Status.FAILED, Status.RUNNING, Status.RUNNING]
+
+
+@pytest.fixture
+def cluster_config(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    services = [
+        {"name": "apache", "description": "DepUI server", "handler": "handlers.apache.ApacheHandler", "hosts": ["host1", "host2"]},
+        {"name": "wfe", "description": "Workflow engine", "handler": "handlers.wfe.WfeHandler", "hosts": ["host2", "host3"]},
+    ]
+
+    with open(config_file, "w") as f:
+        yaml.dump({"services": services}, f)
+
+    return Config(config_file=str(config_file))
+
+
+def test_all_status(cluster_config):
+    replies = {"host1": "apache=running", "host2": "apache=running\nwfe=", "host3": "running"}
+    pool = MagicMock()
+    pool.exec_command.side_effect = lambda host, command, environment, timeout: replies[host]
+
+    matrix = RemoteDispatcher(config=cluster_config, pool=pool, use_agent=False).get_all_status()
+
+    assert list(matrix) == ["host1", "host2", "host3"]
+    assert {h: {n: s.status for n, s in row.items()} for h, row in matrix.items()} == {
+        "host1": {"apache": Status.RUNNING},
+        "host2": {"apache": Status.RUNNING, "wfe": Status.FAILED},
+        "host3": {"wfe": Status.RUNNING},
+    }
+    # one call per host, asking for all of its services
+    assert pool.exec_command.call_count == 3
+    host2 = next(c for c in pool.exec_command.call_args_list if c[0][0] == "host2")
+    assert "python -m handlers.apache status" in host2[0][1]
+    assert "python -m handlers.wfe status" in host2[0][1]
+
+
+def test_all_status_deadline(cluster_config, monkeypatch):
+    release, answered = threading.Event(), threading.Event()
+
+    def status_onhost(self, host, modules):
+        if host == "host3":
+            release.wait(5)
+            answered.set()
+        return {name: InstanceStatus(hostname=host, status=Status.RUNNING) for name in modules}
+
+    monkeypatch.setattr(RemoteDispatcher, "get_host_status", status_onhost)
+
+    try:
+        matrix = RemoteDispatcher(config=cluster_config, timeout=0.2).get_all_status(services=["wfe"])
+        assert not answered.is_set()
+    finally:
+        release.set()
+
+    assert list(matrix) == ["host2", "host3"]
+    assert matrix["host2"]["wfe"].status == Status.RUNNING
+    assert matrix["host3"]["wfe"].status == Status.UNKNOWN
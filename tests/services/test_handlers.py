@@ -0,0 +1,228 @@
+import os
+import socket
+import importlib
+import threading
+import pytest
+from unittest.mock import MagicMock
+
+from onedep_manager.services.handlers import Handler, HandlerRegistry, Probe, TcpProbe, find_process, read_pid_file, poll, format_reply, parse_reply, format_replies, parse_replies
+from onedep_manager.services.schemas import Status, Commands
+
+
+@pytest.fixture
+def proc_dir(tmp_path):
+    proc = tmp_path / "proc"
+
+    for pid, name in ((1, "systemd"), (215, "httpd"), (230, "httpd"), (400, "a_very_long_process_name")):
+        (proc / str(pid)).mkdir(parents=True)
+        (proc / str(pid) / "comm").write_text(f"{name[:15]}\n")
+
+    (proc / "self").mkdir()
+    return str(proc)
+
+
+def test_read_pid_file(tmp_path):
+    (tmp_path / "ok.pid").write_text("230\n")
+    (tmp_path / "bad.pid").write_text("")
+
+    assert read_pid_file(str(tmp_path / "ok.pid")) == 230
+    assert read_pid_file(str(tmp_path / "bad.pid")) is None
+    assert read_pid_file(str(tmp_path / "missing.pid")) is None
+
+
+def test_find_process_pid_file(proc_dir, tmp_path, monkeypatch):
+    (tmp_path / "httpd.pid").write_text("230\n")
+    (tmp_path / "stale.pid").write_text("1\n")
+
+    scandir = MagicMock(side_effect=AssertionError("should not scan /proc"))
+    monkeypatch.setattr("onedep_manager.services.handlers.os.scandir", scandir)
+
+    assert find_process("httpd", pid_files=[str(tmp_path / "missing.pid"), str(tmp_path / "httpd.pid")], proc_dir=proc_dir) == 230
+
+
+def test_find_process_scan(proc_dir, tmp_path):
+    (tmp_path / "stale.pid").write_text("1\n")
+
+    assert find_process("httpd", pid_files=[str(tmp_path / "stale.pid")], proc_dir=proc_dir) in (215, 230)
+    assert find_process("a_very_long_process_name", proc_dir=proc_dir) == 400
+    assert find_process("nginx", proc_dir=proc_dir) is None
+
+
+def test_find_process_without_proc(tmp_path, monkeypatch):
+    proc = MagicMock(pid=42, info={"name": "httpd"})
+    monkeypatch.setattr("psutil.process_iter", lambda attrs: iter([proc]))
+
+    assert find_process("httpd", proc_dir=str(tmp_path / "missing")) == 42
+    assert find_process("nginx", proc_dir=str(tmp_path / "missing")) is None
+
+
+def test_poll_backoff(monkeypatch):
+    sleeps = []
+    now = [0.0]
+
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr("onedep_manager.services.handlers.time.monotonic", lambda: now[0])
+    monkeypatch.setattr("onedep_manager.services.handlers.time.sleep", fake_sleep)
+
+    answers = iter([False, False, False, True])
+    assert poll(lambda: next(answers), timeout=10, interval=0.1, factor=2, max_interval=0.3) == pytest.approx(0.6)
+    assert sleeps == pytest.approx([0.1, 0.2, 0.3])
+
+    sleeps.clear()
+    now[0] = 0.0
+    assert poll(lambda: False, timeout=1, interval=0.4, factor=2) is None
+    # the last wait is cut at the deadline
+    assert sleeps == pytest.approx([0.4, 0.6])
+
+
+class FlakyProbe(Probe):
+    def __init__(self, failures):
+        self.failures = failures
+
+    def check(self):
+        self.failures -= 1
+        return self.failures < 0
+
+
+class ProbedHandler(Handler):
+    ready_timeout = 2
+
+    def __init__(self, probes):
+        self._probes = probes
+
+    def probes(self):
+        return self._probes
+
+    def start(self):
+        ready_time = self.wait_ready()
+        return Status.FAILED if ready_time is None else (Status.RUNNING, ready_time)
+
+    stop = restart = status = start
+
+
+def test_handler_wait_ready():
+    handler = ProbedHandler([FlakyProbe(2), FlakyProbe(0)])
+
+    status, ready_time = handler.start()
+    assert status == Status.RUNNING
+    assert 0 < ready_time < 1
+
+    handler = ProbedHandler([FlakyProbe(1000)])
+    handler.ready_timeout = 0.1
+    assert handler.start() == Status.FAILED
+
+
+def test_tcp_probe():
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    port = server.getsockname()[1]
+
+    assert TcpProbe(port).check()
+    server.close()
+    assert not TcpProbe(port).check()
+
+
+def test_replies():
+    assert format_reply(Status.RUNNING) == "running"
+    assert format_reply(Status.RUNNING, 1.5) == "running 1.500"
+    assert parse_reply("running 1.500") == (Status.RUNNING, 1.5)
+    assert parse_reply("stopped") == (Status.STOPPED, None)
+    assert parse_reply("Traceback (most recent call last):") == (None, None)
+    assert parse_reply("") == (None, None)
+
+
+def test_several_replies():
+    reply = format_replies({"apache": Status.RUNNING, "wfe": Status.STOPPED})
+
+    assert reply == "apache=running wfe=stopped"
+    assert parse_replies(reply) == {"apache": Status.RUNNING, "wfe": Status.STOPPED}
+    assert parse_replies("apache=running\nwfe=") == {"apache": Status.RUNNING, "wfe": None}
+    assert parse_replies("running") == {}
+
+
+class CountingHandler(Handler):
+    created = 0
+
+    def __init__(self):
+        CountingHandler.created += 1
+
+    def start(self):
+        return Status.RUNNING, 0.5
+
+    def stop(self):
+        return Status.STOPPED
+
+    restart = start
+    status = stop
+
+
+class HalfHandler(Handler):
+    def start(self):
+        return Status.RUNNING
+
+
+def test_registry():
+    registry = HandlerRegistry()
+    path = f"{__name__}.CountingHandler"
+    CountingHandler.created = 0
+
+    assert registry.resolve(path) is CountingHandler
+    assert registry.run(path, Commands.START) == (Status.RUNNING, 0.5)
+    assert registry.run(path, Commands.STOP) == (Status.STOPPED, None)
+    assert registry.instance(path) is registry.instance(path)
+    assert CountingHandler.created == 1
+
+
+def test_registry_errors(monkeypatch):
+    registry = HandlerRegistry()
+    imports = []
+    import_module = importlib.import_module
+    monkeypatch.setattr("onedep_manager.services.handlers.importlib.import_module", lambda name: imports.append(name) or import_module(name))
+
+    for path, message in ((f"{__name__}.HalfHandler", "restart, status, stop not implemented"), (f"{__name__}.FlakyProbe", "not a Handler"), (f"{__name__}.Missing", "has no attribute"), ("nomodule.Handler", "No module named"), ("nodots", "not enough values")):
+        with pytest.raises(Exception, match=message):
+            registry.resolve(path)
+
+        # failures are not cached, so the import is tried again
+        with pytest.raises(Exception, match=message):
+            registry.resolve(path)
+
+    assert len(imports) == 8
+
+
+class SlowStartHandler(Handler):
+    def __init__(self):
+        self.starting = threading.Event()
+        self.started = threading.Event()
+
+    def start(self):
+        self.starting.set()
+        self.started.wait(5)
+        return Status.RUNNING, 1.0
+
+    def status(self):
+        return Status.STOPPED
+
+    stop = restart = status
+
+
+def test_registry_status_during_start():
+    registry = HandlerRegistry()
+    path = f"{__name__}.SlowStartHandler"
+    handler = registry.instance(path)
+    results = []
+
+    starting = threading.Thread(target=lambda: results.append(registry.run(path, Commands.START)))
+    starting.start()
+    assert handler.starting.wait(5)
+
+    # status answers while start is still waiting for its service
+    assert registry.run(path, Commands.STATUS) == (Status.STOPPED, None)
+
+    handler.started.set()
+    starting.join()
+    assert results == [(Status.RUNNING, 1.0)]
@@ -0,0 +1,119 @@
+import time
+import yaml
+import pytest
+import threading
+from unittest.mock import MagicMock
+
+from onedep_manager.config import Config
+from onedep_manager.schemas import Service
+from onedep_manager.services.stack import service_levels, run_stack
+from onedep_manager.services.schemas import Status, InstanceStatus, Commands
+
+
+def _service(name, depends_on=()):
+    return Service(name=name, description=name, handler=f"handlers.{name}.Handler", hosts=["host1", "host2"], depends_on=list(depends_on))
+
+
+STACK = [
+    _service("apache", ["wfe", "dbproxy"]),
+    _service("wfe", ["mq", "dbproxy"]),
+    _service("mq"),
+    _service("dbproxy"),
+    _service("monitor"),
+]
+
+
+@pytest.fixture
+def stack_config(tmp_path):
+    config_file = tmp_path / "config.yaml"
+
+    with open(config_file, "w") as f:
+        yaml.dump({"services": [vars(s) for s in STACK]}, f)
+
+    return Config(config_file=str(config_file))
+
+
+def test_service_levels():
+    assert service_levels(STACK) == [["mq", "dbproxy", "monitor"], ["wfe"], ["apache"]]
+    assert service_levels([_service("a")]) == [["a"]]
+
+    with pytest.raises(ValueError, match="unknown services: db"):
+        service_levels([_service("a", ["db"])])
+
+    with pytest.raises(ValueError, match="cycle: a, b"):
+        service_levels([_service("a", ["b"]), _service("b", ["a"]), _service("c")])
+
+
+def _dispatcher(status, failing=()):
+    order = []
+    running = set()
+    peak = []
+    lock = threading.Lock()
+
+    def run(name, on_status=None):
+        with lock:
+            order.append(name)
+            running.add(name)
+            peak.append(len(running))
+
+        time.sleep(0.05)
+
+        with lock:
+            running.discard(name)
+
+        result = [InstanceStatus(hostname=h, status=Status.FAILED if name in failing else status) for h in ("host1", "host2")]
+
+        for s in result:
+            if on_status:
+                on_status(s)
+
+        return result
+
+    dispatcher = MagicMock()
+    dispatcher.start_service.side_effect = run
+    dispatcher.stop_service.side_effect = run
+
+    return dispatcher, order, peak
+
+
+def test_start_stack(stack_config):
+    dispatcher, order, peak = _dispatcher(Status.RUNNING)
+    streamed = []
+
+    results = run_stack(stack_config, dispatcher, Commands.START, on_status=lambda name, s: streamed.append(name))
+
+    # the three services of the first level start together
+    assert max(peak) == 3
+    assert set(order[:3]) == {"mq", "dbproxy", "monitor"}
+    assert order[3:] == ["wfe", "apache"]
+    assert all(s.status == Status.RUNNING for statuses in results.values() for s in statuses)
+    assert len(streamed) == 10
+
+
+def test_stop_stack(stack_config):
+    dispatcher, order, peak = _dispatcher(Status.STOPPED)
+    run_stack(stack_config, dispatcher, Commands.STOP)
+
+    assert set(order[:2]) == {"apache", "monitor"}
+    assert order[2] == "wfe"
+    assert set(order[3:]) == {"mq", "dbproxy"}
+
+
+def test_stack_skips_after_failure(stack_config):
+    dispatcher, order, peak = _dispatcher(Status.RUNNING, failing=["mq"])
+    results = run_stack(stack_config, dispatcher, Commands.START)
+
+    assert "wfe" not in order and "apache" not in order
+    assert [s.status for s in results["wfe"]] == [Status.SKIPPED, Status.SKIPPED]
+    assert [s.status for s in results["apache"]] == [Status.SKIPPED, Status.SKIPPED]
+    assert results["dbproxy"][0].status == Status.RUNNING
+
+    dispatcher, order, peak = _dispatcher(Status.STOPPED, failing=["apache"])
+    results = run_stack(stack_config, dispatcher, Commands.STOP)
+
+    # apache still uses everything below it
+    assert set(order) == {"apache", "monitor"}
+    assert {name for name, statuses in results.items() if statuses[0].status == Status.SKIPPED} == {"wfe", "mq", "dbproxy"}
+
+    with pytest.raises(ValueError):
+        run_stack(stack_config, dispatcher, Commands.RESTART)
@@ -0,0 +1,88 @@
+import time
+import threading
+from unittest.mock import MagicMock
+
+from onedep_manager.services.watch import WatchState, Watcher
+from onedep_manager.services.schemas import Status, InstanceStatus
+
+
+def _statuses(host, **statuses):
+    return {name: InstanceStatus(hostname=host, status=status) for name, status in statuses.items()}
+
+
+def _dispatcher(replies):
+    dispatcher = MagicMock()
+    dispatcher.services_by_host.return_value = {"host1": {"apache": "handlers.apache"}, "host2": {"apache": "handlers.apache", "wfe": "handlers.wfe"}}
+    dispatcher.get_host_status.side_effect = lambda host, modules: replies[host]()
+    return dispatcher
+
+
+def test_watch_state():
+    state = WatchState({"host1": ["apache"], "host2": ["apache", "wfe"]})
+
+    assert state.services == ["apache", "wfe"]
+    assert len(state.update("host1", _statuses("host1", apache=Status.STOPPED), now=100)) == 1
+    # first statuses are not transitions
+    assert state.transitions == []
+    assert state.update("host1", _statuses("host1", apache=Status.STOPPED), now=110) == []
+
+    changes = state.update("host1", _statuses("host1", apache=Status.RUNNING), now=120)
+    assert [(c.old, c.new, c.at) for c in changes] == [(Status.STOPPED, Status.RUNNING, 120)]
+    assert state.transitions == changes
+    assert state.cells["host1"]["apache"].since == 120
+
+    state.update("host2", _statuses("host2", apache=Status.RUNNING, wfe=Status.UNKNOWN))
+    assert state.settled("host1")
+    assert not state.settled("host2")
+
+
+def test_watcher_adaptive_interval():
+    watcher = Watcher(_dispatcher({}), fast=1, slow=8)
+
+    watcher.record("host1", _statuses("host1", apache=Status.RUNNING), now=0)
+    assert watcher.intervals["host1"] == 1
+
+    for expected in (2, 4, 8, 8):
+        watcher.record("host1", _statuses("host1", apache=Status.RUNNING), now=0)
+        assert watcher.intervals["host1"] == expected
+
+    assert watcher.due["host1"] == 8
+
+    # a change brings the host back to fast polling
+    watcher.record("host1", _statuses("host1", apache=Status.STOPPED), now=0)
+    assert watcher.intervals["host1"] == 1
+
+    # so does a service that isn't settled
+    watcher.record("host2", _statuses("host2", apache=Status.RUNNING, wfe=Status.FAILED), now=0)
+    watcher.record("host2", _statuses("host2", apache=Status.RUNNING, wfe=Status.FAILED), now=0)
+    assert watcher.intervals["host2"] == 1
+
+
+def test_watcher_run():
+    polls = {"host1": 0, "host2": 0}
+
+    def host1():
+        polls["host1"] += 1
+        return _statuses("host1", apache=Status.RUNNING if polls["host1"] > 6 else Status.UNKNOWN)
+
+    def host2():
+        polls["host2"] += 1
+        return _statuses("host2", apache=Status.RUNNING, wfe=Status.RUNNING)
+
+    watcher = Watcher(_dispatcher({"host1": host1, "host2": host2}), fast=0.01, slow=10)
+    stop = threading.Event()
+    changes = []
+
+    def on_change(state):
+        changes.append(state)
+        if state.transitions:
+            stop.set()
+
+    thread = threading.Thread(target=watcher.run, args=(on_change,), kwargs={"stop": stop})
+    thread.start()
+    thread.join(timeout=5)
+
+    assert not thread.is_alive()
+    assert [(t.host, t.old, t.new) for t in watcher.state.transitions] == [("host1", Status.UNKNOWN, Status.RUNNING)]
+    # host1 is polled fast until it settles, host2 is stable and backs off
+    assert polls["host2"] < polls["host1"]
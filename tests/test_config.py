@@ -1,6 +1,6 @@
 import pytest
 
-from onedep_manager.config import Config
+from onedep_manager.config import Config, get_config
 
 
 def test_get_services():
@@ -19,3 +19,43 @@ def test_single_service():
 
     with pytest.raises(Exception):
         config.get_service("bar")
+
+
+def test_get_config_is_shared(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text("services:\n  - name: apache\n    hosts: [localhost]\n    handler: foo.Bar\n    description: Foo\n")
+
+    config = get_config(str(config_file))
+
+    assert get_config(str(config_file)) is config
+    assert get_config(str(tmp_path / ".." / tmp_path.name / "config.yaml")) is config
+    assert get_config("tests/fixtures/config.yaml") is not config
+    assert config.get_service("apache") is config.get_service("apache")
+
+    config_file.write_text("services:\n  - name: foo\n    hosts: [localhost]\n    handler: foo.Bar\n    description: Foo\n")
+    assert [s.name for s in config.get_services()] == ["apache"]
+
+    config.reload()
+    assert [s.name for s in config.get_services()] == ["foo"]
+
+    with pytest.raises(Exception):
+        config.get_service("apache")
+
+
+def test_from_site_is_memoized(monkeypatch):
+    calls = []
+
+    def get(self, variable, default=None):
+        calls.append(variable)
+        return f"/{variable.lower()}"
+
+    monkeypatch.setattr("onedep_manager.config.ConfigInfo.get", get)
+    config = Config("tests/fixtures/config.yaml")
+
+    assert config.from_site("SITE_DEPLOY_PATH") == "/site_deploy_path"
+    assert config.from_site("SITE_DEPLOY_PATH") == "/site_deploy_path"
+    assert calls == ["TOP_WWPDB_SITE_CONFIG_DIR", "SITE_DEPLOY_PATH"]
+
+    config.reload()
+    assert config.from_site("SITE_DEPLOY_PATH") == "/site_deploy_path"
+    assert calls.count("SITE_DEPLOY_PATH") == 2
@@ -0,0 +1,87 @@
+import sys
+import json
+import subprocess
+from click.testing import CliRunner
+
+from onedep_manager import tracing
+from onedep_manager.main import cli
+
+
+# cumulative import time allowed for `paths get`, in seconds. The shell
+# helpers call it on every keystroke, so keep this tight
+PATHS_GET_IMPORT_BUDGET = 1.0
+HEAVY_MODULES = ("paramiko", "git", "psutil")
+
+
+def _import_time(*args):
+    """Runs the cli under `python -X importtime` and returns its total
+    import time, in seconds.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-m", "onedep_manager.main", *args], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, name = line.split("|")
+        # nested imports are indented under the module that triggered
+        # them, and already counted in its cumulative time
+        if not name[1:].startswith(" "):
+            total += int(cumulative) / 1e6
+
+    return total
+
+
+def _loaded_modules(*args):
+    """Runs the cli in a fresh interpreter and returns the names of all
+    modules it loaded, including the ones the command imports while it
+    runs.
+    """
+    script = "import sys; from onedep_manager.main import cli; cli(sys.argv[1:], standalone_mode=False); print(*sys.modules, file=sys.stderr)"
+    result = subprocess.run([sys.executable, "-c", script, *args], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+    return set(result.stderr.split())
+
+
+def test_help_lists_all_groups():
+    runner = CliRunner()
+    result = runner.invoke(cli, ["--help"])
+
+    assert result.exit_code == 0
+    for group in ("config", "instance", "packages", "paths", "services", "tools"):
+        assert group in result.output
+
+
+def test_paths_get_import_budget():
+    # a real lookup, so the imports made by the command itself count too
+    args = ("paths", "get", "deposit", "D_000001")
+    assert _import_time(*args) < PATHS_GET_IMPORT_BUDGET
+
+    modules = _loaded_modules(*args)
+
+    assert "onedep_manager.cli.paths" in modules
+    assert not [m for m in modules if m.split(".")[0] in HEAVY_MODULES]
+    assert "onedep_manager.cli.services" not in modules
+    assert "onedep_manager.cli.packages" not in modules
+
+
+def test_profile(tmp_path):
+    runner = CliRunner()
+    result = runner.invoke(cli, ["--profile", "paths", "--help"])
+
+    assert result.exit_code == 0
+    assert "import" in result.output
+    assert "Wall time" in result.output
+
+    trace_file = tmp_path / "trace.json"
+    result = runner.invoke(cli, ["paths", "--help"], env={"ODM_PROFILE_OUTPUT": str(trace_file)})
+
+    assert result.exit_code == 0
+    with open(trace_file) as f:
+        names = [e["name"] for e in json.load(f)["traceEvents"]]
+
+    assert "import onedep_manager.cli.paths" in names
+    assert tracing.get_tracer() is None
@@ -1,97 +1,151 @@
 import pytest
 import subprocess
+from importlib import metadata
 from unittest.mock import MagicMock
 
 from onedep_manager.schemas import PackageDistribution
-from onedep_manager.packages import get_wwpdb_packages, switch_reference, pull
+from onedep_manager.packages import get_wwpdb_packages, get_package, install_package, install_packages, switch_reference, pull, PackageIndex, PackageCache, ONEDEP_PACKAGES, _to_package, onedep_package_name
 
 
-class MockDistribution:
-    def __init__(self, name, version, path):
-        self.metadata = {
-            "Name": name,
-            "Version": version
-        }
-        self._path = path
+def make_distribution(location, name, version):
+    """Creates an .egg-info directory for `name` in `location`, as
+    done by editable installs
+    """
+    egg = location / f"{name}.egg-info"
+    egg.mkdir(parents=True)
+    (egg / "PKG-INFO").write_text(f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n")
+
+    return egg
+
+
+def make_dist_info(site_packages, name, version):
+    """Creates a .dist-info directory for `name` in `site_packages`"""
+    dist_info = site_packages / f"{name.replace('-', '_')}-{version}.dist-info"
+    dist_info.mkdir(parents=True)
+    (dist_info / "METADATA").write_text(f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n")
+
+    return dist_info
+
+
+@pytest.fixture
+def index_paths(monkeypatch):
+    """Restricts package discovery to the given directories"""
+    def use_paths(*paths):
+        monkeypatch.setattr("onedep_manager.packages._package_index", PackageIndex(paths=[str(p) for p in paths]))
 
+    return use_paths
 
-def test_get_wwpdb_packages(monkeypatch):
-    monkeypatch.setattr(
-        "onedep_manager.packages.metadata.distributions",
-        lambda: [MockDistribution("wwpdb.utils.config", "0.1.0", "/foo/bar/wwpdb.utils.config/wwpdb.utils.config.egg-info")]
-    )
+
+def test_get_wwpdb_packages(index_paths, tmp_path):
+    source = tmp_path / "wwpdb.utils.config"
+    make_distribution(source, "wwpdb.utils.config", "0.1.0")
+    index_paths(source)
 
     package = next(get_wwpdb_packages())
 
     assert package.name == "wwpdb.utils.config"
     assert package.version == "0.1.0"
-    assert package.path == "/foo/bar/wwpdb.utils.config"
-
+    assert package.path == str(source)
 
-def test_get_single_package(monkeypatch):
-    package1 = MockDistribution("wwpdb.utils.config", "0.1.0", "/foo/bar/wwpdb.utils.config/wwpdb.utils.config.egg-info")
-    package2 = MockDistribution("wwpdb.utils.foobar", "0.2.0", "/foo/bar/wwpdb.utils.foobar/wwpdb.utils.foobar.egg-info")
 
-    monkeypatch.setattr(
-        "onedep_manager.packages.metadata.distributions",
-        lambda: [package1, package2]
-    )
+def test_get_single_package(index_paths, tmp_path):
+    make_distribution(tmp_path / "wwpdb.utils.config", "wwpdb.utils.config", "0.1.0")
+    make_distribution(tmp_path / "wwpdb.utils.db", "wwpdb.utils.db", "0.2.0")
+    index_paths(tmp_path / "wwpdb.utils.config", tmp_path / "wwpdb.utils.db")
 
     packages = list(get_wwpdb_packages(name="wwpdb.utils.config"))
 
     assert len(packages) == 1
     assert packages[0].name == "wwpdb.utils.config"
     assert packages[0].version == "0.1.0"
-    assert packages[0].path == "/foo/bar/wwpdb.utils.config"
+    assert packages[0].path == str(tmp_path / "wwpdb.utils.config")
 
 
-def test_get_with_patterns(monkeypatch):
-    package1 = MockDistribution("wwpdb.utils.config", "0.1.0", "/foo/bar/wwpdb.utils.config/wwpdb.utils.config.egg-info")
-    package2 = MockDistribution("wwpdb.utils.foobar", "0.2.0", "/foo/bar/wwpdb.utils.foobar/wwpdb.utils.foobar.egg-info")
-    package3 = MockDistribution("wwpdb.apps.foobar", "0.2.0", "/foo/bar/wwpdb.apps.foobar/wwpdb.apps.foobar.egg-info")
-
-    monkeypatch.setattr(
-        "onedep_manager.packages.metadata.distributions",
-        lambda: [package1, package2, package3]
-    )
+def test_get_with_patterns(index_paths, tmp_path):
+    make_distribution(tmp_path / "wwpdb.utils.config", "wwpdb.utils.config", "0.1.0")
+    make_distribution(tmp_path / "wwpdb.utils.db", "wwpdb.utils.db", "0.2.0")
+    make_distribution(tmp_path / "wwpdb.apps.deposit", "wwpdb.apps.deposit", "0.2.0")
+    index_paths(tmp_path / "wwpdb.utils.config", tmp_path / "wwpdb.utils.db", tmp_path / "wwpdb.apps.deposit")
 
     packages = list(get_wwpdb_packages(name="wwpdb.utils"))
     assert len(packages) == 2
 
 
-def test_branch(monkeypatch, tmp_path):
+def test_ignores_other_packages(index_paths, tmp_path):
+    site_packages = tmp_path / "site-packages"
+    make_dist_info(site_packages, "wwpdb.utils.foobar", "0.1.0")
+    make_dist_info(site_packages, "wwpdb.io", "1.3.2")
+    index_paths(site_packages)
+
+    packages = list(get_wwpdb_packages())
+
+    assert [p.name for p in packages] == ["wwpdb.io"]
+    assert packages[0].editable == False
+
+
+def test_get_package_normalizes_names(index_paths, tmp_path):
+    site_packages = tmp_path / "site-packages"
+    make_dist_info(site_packages, "wwpdb.utils.config", "1.0.3")
+    index_paths(site_packages)
+
+    assert get_package("wwpdb-utils-config", branch=False).version == "1.0.3"
+    assert get_package("WWPDB_Utils.Config", branch=False).version == "1.0.3"
+    assert get_package("wwpdb.utils.foobar") is None
+
+
+def test_onedep_package_name():
+    assert onedep_package_name("wwpdb.io") == "wwpdb.io"
+    assert onedep_package_name("WWPDB_IO") == "wwpdb.io"
+    assert onedep_package_name("wwpdb-utils-config") == "wwpdb.utils.config"
+    assert onedep_package_name("wwpdb.utils.foobar") is None
+
+
+def test_index_benchmark(index_paths, monkeypatch, tmp_path):
+    """Lookups in an environment with 600 unrelated distributions
+    should only read the metadata of OneDep packages
+    """
+    site_packages = tmp_path / "site-packages"
+    for i in range(600):
+        make_dist_info(site_packages, f"fake-package-{i}", "1.0.0")
+    for name in ONEDEP_PACKAGES[:3]:
+        make_dist_info(site_packages, name, "1.0.0")
+
+    names = [d.metadata["Name"] for d in metadata.distributions(path=[str(site_packages)]) if d.metadata["Name"] in ONEDEP_PACKAGES]
+
+    read = set()
+    read_text = metadata.PathDistribution.read_text
+    monkeypatch.setattr(metadata.PathDistribution, "read_text", lambda self, filename: read.add(self._path.name) or read_text(self, filename))
+
+    index_paths(site_packages)
+    packages = list(get_wwpdb_packages(branch=False))
+
+    assert sorted(p.name for p in packages) == sorted(names) == sorted(ONEDEP_PACKAGES[:3])
+    assert read == {f"{name.replace('-', '_')}-1.0.0.dist-info" for name in ONEDEP_PACKAGES[:3]}
+
+
+def test_branch(index_paths, tmp_path):
     d = tmp_path / "wwpdb.utils.config"
-    egg = d / "wwpdb.utils.config.egg-info"
-    egg.mkdir(parents=True)
+    make_distribution(d, "wwpdb.utils.config", "0.1.0")
+    index_paths(d)
 
     subprocess.run(["git", "init"], cwd=d)
     subprocess.run(["git", "checkout", "-b", "foobar"], cwd=d)
 
-    monkeypatch.setattr(
-        "onedep_manager.packages.metadata.distributions",
-        lambda: [MockDistribution("wwpdb.utils.config", "0.1.0", str(egg))]
-    )
-
     package = next(get_wwpdb_packages(branch=True))
 
     assert package.branch == "foobar"
 
 
-def test_detached_head(monkeypatch, tmp_path):
+def test_detached_head(index_paths, tmp_path):
     d = tmp_path / "wwpdb.utils.config"
-    egg = d / "wwpdb.utils.config.egg-info"
-    egg.mkdir(parents=True)
+    make_distribution(d, "wwpdb.utils.config", "0.1.0")
+    index_paths(d)
 
     subprocess.run(["git", "init"], cwd=d)
     subprocess.run(["git", "commit", "--allow-empty", "-m", "Initial commit"], cwd=d)
     subprocess.run(["git", "commit", "--allow-empty", "-m", "Second commit"], cwd=d)
     subprocess.run(["git", "checkout", "HEAD~1"], cwd=d)
 
-    monkeypatch.setattr(
-        "onedep_manager.packages.metadata.distributions",
-        lambda: [MockDistribution("wwpdb.utils.config", "0.1.0", str(egg))]
-    )
-
     package = next(get_wwpdb_packages(branch=True))
     assert package.branch == "HEAD"
 
@@ -144,3 +198,82 @@ def test_update(monkeypatch, tmp_path):
     success = pull(package=package)
 
     assert success == True
+
+
+def test_package_cache(index_paths, monkeypatch, tmp_path):
+    d = tmp_path / "wwpdb.utils.config"
+    make_distribution(d, "wwpdb.utils.config", "0.1.0")
+    index_paths(d)
+
+    subprocess.run(["git", "init"], cwd=d)
+    subprocess.run(["git", "commit", "--allow-empty", "-m", "Initial commit"], cwd=d)
+
+    cache_file = str(tmp_path / "packages_cache.json")
+    package = list(get_wwpdb_packages(cache=PackageCache(cache_file)))[0]
+    assert package.branch == "main"
+
+    inspected = MagicMock(side_effect=_to_package)
+    monkeypatch.setattr("onedep_manager.packages._to_package", inspected)
+
+    # nothing changed, so the cached state is reused
+    package = list(get_wwpdb_packages(cache=PackageCache(cache_file)))[0]
+    assert package.branch == "main"
+    assert package.path == str(d)
+    inspected.assert_not_called()
+
+    # switching branches changes .git/HEAD
+    subprocess.run(["git", "checkout", "-b", "develop"], cwd=d)
+    package = list(get_wwpdb_packages(cache=PackageCache(cache_file)))[0]
+    assert package.branch == "develop"
+    inspected.assert_called_once()
+
+
+def test_branches_without_dirty_check(index_paths, tmp_path):
+    dirs = []
+    for name in ("wwpdb.utils.config", "wwpdb.utils.db", "wwpdb.io"):
+        d = tmp_path / name
+        make_distribution(d, name, "0.1.0")
+        subprocess.run(["git", "init"], cwd=d)
+        (d / "README").write_text("foo")
+        subprocess.run(["git", "add", "README"], cwd=d)
+        subprocess.run(["git", "commit", "-m", "Initial commit"], cwd=d)
+        dirs.append(d)
+
+    subprocess.run(["git", "checkout", "-b", "foobar"], cwd=dirs[1])
+    subprocess.run(["git", "checkout", "--detach"], cwd=dirs[2])
+    (dirs[0] / "README").write_text("bar")
+    index_paths(*dirs)
+
+    branches = {p.name: p.branch for p in get_wwpdb_packages(workers=2)}
+    assert branches == {"wwpdb.utils.config": "main*", "wwpdb.utils.db": "foobar", "wwpdb.io": "HEAD"}
+
+    branches = {p.name: p.branch for p in get_wwpdb_packages(dirty=False, workers=2)}
+    assert branches == {"wwpdb.utils.config": "main", "wwpdb.utils.db": "foobar", "wwpdb.io": "HEAD"}
+
+
+def test_install_packages_single_pip_run(monkeypatch):
+    mock_run = MagicMock()
+    mock_run.return_value.returncode = 0
+    monkeypatch.setattr("onedep_manager.packages.subprocess.run", mock_run)
+
+    assert install_packages([("/foo/bar/wwpdb.utils.config", True), ("wwpdb.io", False)]) == True
+
+    mock_run.assert_called_once()
+    assert mock_run.call_args[0][0] == ["pip", "install", "-U", "-e", "/foo/bar/wwpdb.utils.config", "wwpdb.io"]
+
+    mock_run.return_value.returncode = 1
+    assert install_packages([("wwpdb.io", False)]) == False
+
+
+def test_install_package_reports_pip_failures(monkeypatch):
+    mock_run = MagicMock()
+    mock_run.return_value.returncode = 1
+    mock_run.return_value.stdout = ""
+    mock_run.return_value.stderr = "ERROR: No matching distribution found for wwpdb.io==9.9"
+    monkeypatch.setattr("onedep_manager.packages.subprocess.run", mock_run)
+
+    assert install_package("wwpdb.io", version="9.9") == False
+    assert mock_run.call_args[0][0] == ["pip", "install", "-U", "wwpdb.io==9.9"]
+
+    mock_run.return_value.returncode = 0
+    assert install_package("/foo/bar/wwpdb.io", edit=True) == True
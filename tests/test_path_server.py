@@ -0,0 +1,120 @@
+import os
+import socket
+import threading
+import pytest
+from unittest.mock import MagicMock
+
+from onedep_manager.path_server import PathServer, default_socket_path
+
+
+def resolve(type_, identifier):
+    if type_ != "deposit":
+        raise ValueError(f"Invalid path type: {type_}")
+    return f"/deposit/{identifier}"
+
+
+@pytest.fixture
+def server(tmp_path):
+    resolver = MagicMock()
+    resolver.resolve.side_effect = resolve
+    # short path, unix sockets have a small length limit
+    socket_path = os.path.join("/tmp", f"odm-test-{os.getpid()}.sock")
+
+    server = PathServer(socket_path, resolver=resolver)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def ask(socket_path, *lines):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(socket_path)
+        s.sendall("".join(f"{line}\n" for line in lines).encode("utf-8"))
+        s.shutdown(socket.SHUT_WR)
+
+        reply = b""
+        while chunk := s.recv(4096):
+            reply += chunk
+
+    return reply.decode("utf-8").splitlines()
+
+
+def test_requests(server):
+    assert ask(server.socket_path, "deposit D_1000") == ["OK /deposit/D_1000"]
+    assert ask(server.socket_path, "deposit D_1000", "", "foo D_1001", "tool bar", "deposit") == [
+        "OK /deposit/D_1000",
+        "ERR Invalid path type: foo",
+        "ERR Invalid path type: tool",
+        "ERR Expected '<type> <identifier>'",
+    ]
+
+
+def test_reloads_on_site_config_change(monkeypatch, tmp_path):
+    stamp = [b"1"]
+    config, index = MagicMock(), MagicMock()
+    monkeypatch.setattr("onedep_manager.path_server.fingerprint", lambda site=None: stamp[0])
+    monkeypatch.setattr("onedep_manager.path_server.PathResolver", lambda site=None: MagicMock(site=site))
+    monkeypatch.setattr("onedep_manager.path_server.get_config", lambda: config)
+    monkeypatch.setattr("onedep_manager.packages.get_package_index", lambda: index)
+
+    server = PathServer(str(tmp_path / "paths.sock"), site="PDBE_TEST")
+    first = server.get_resolver()
+
+    # checked at most every reload_interval
+    stamp[0] = b"2"
+    assert server.get_resolver() is first
+
+    server.reload_interval = 0
+    second = server.get_resolver()
+
+    assert second is not first
+    assert second.site == "PDBE_TEST"
+    config.reload.assert_called_once()
+    index.refresh.assert_called_once()
+
+    # nothing changed since
+    assert server.get_resolver() is second
+    server.server_close()
+
+
+def test_socket_lifecycle(tmp_path):
+    socket_path = os.path.join("/tmp", f"odm-test-{os.getpid()}-stale.sock")
+
+    # a socket nobody listens on any more
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+
+    server = PathServer(socket_path, resolver=MagicMock())
+    # only the owner may connect
+    assert os.stat(socket_path).st_mode & 0o077 == 0
+
+    # the server is still listening, so its socket is left alone
+    with pytest.raises(FileExistsError, match="already listening"):
+        PathServer(socket_path, resolver=MagicMock())
+
+    server.server_close()
+    assert not os.path.exists(socket_path)
+
+
+def test_keeps_other_files(tmp_path):
+    path = tmp_path / "paths.sock"
+    path.write_text("foo")
+
+    with pytest.raises(FileExistsError, match="not a socket"):
+        PathServer(str(path), resolver=MagicMock())
+
+    assert path.read_text() == "foo"
+
+
+def test_default_socket_path(monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", "/run/user/1000")
+    monkeypatch.delenv("ODM_PATH_SOCKET", raising=False)
+    assert default_socket_path("PDBE_TEST") == f"/run/user/1000/onedep-paths-{os.getuid()}-pdbe_test.sock"
+
+    monkeypatch.setenv("ODM_PATH_SOCKET", "/foo/bar.sock")
+    assert default_socket_path("PDBE_TEST") == "/foo/bar.sock"
@@ -0,0 +1,149 @@
+import pytest
+from unittest.mock import MagicMock
+
+from onedep_manager.config import Config
+from onedep_manager.paths import PathResolver, PathTemplates, PATH_TYPES, TEMPLATE_SHAPES, derive_template, parse_entry
+
+from wwpdb.utils.config.ConfigInfoData import ConfigInfoData
+
+
+@pytest.fixture
+def locators(monkeypatch):
+    pathinfo = MagicMock()
+    pathinfo.return_value.getDepositPath.side_effect = lambda dataSetId: f"/deposit/{dataSetId}"
+    pathinfo.return_value.getArchivePath.side_effect = lambda dataSetId: f"/archive/{dataSetId}"
+    pathinfo.return_value.getInstancePath.side_effect = lambda dataSetId, wfInstanceId: f"/wfinst/{dataSetId}/instance/{wfInstanceId}"
+    ccdpathinfo = MagicMock()
+    ccdpathinfo.return_value.getFilePath.side_effect = lambda idCode: f"/ccd/{idCode[0]}/{idCode}/{idCode}.cif"
+
+    monkeypatch.setattr("onedep_manager.paths.PathInfo", pathinfo)
+    monkeypatch.setattr("onedep_manager.paths.ChemRefPathInfo", ccdpathinfo)
+
+    return pathinfo, ccdpathinfo
+
+
+def test_resolve(locators):
+    pathinfo, ccdpathinfo = locators
+    config = MagicMock()
+    config.from_site.side_effect = lambda v: {"SITE_ARCHIVE_STORAGE_PATH": "/storage", "SITE_WF_XML_PATH": "/wfxml"}[v]
+    resolver = PathResolver(config=config)
+
+    assert resolver.resolve("deposit", "D_1000") == "/deposit/D_1000"
+    assert resolver.resolve("archive", "D_1001") == "/archive/D_1001"
+    assert resolver.resolve("wfinst", "D_1000:W_001") == "/wfinst/D_1000/instance/W_001"
+    assert resolver.resolve("upload", "D_1000") == "/storage/deposit/temp_files/deposition_uploads/D_1000"
+    assert resolver.resolve("wfxml", "wf_op_annot") == "/wfxml/wf_op_annot.xml"
+
+    # locators are built once, and only when needed
+    pathinfo.assert_called_once()
+    ccdpathinfo.assert_not_called()
+
+    assert resolver.resolve("ccid", "ATP") == "/ccd/A/ATP/ATP.cif"
+    ccdpathinfo.assert_called_once()
+
+
+def test_resolve_errors(locators):
+    resolver = PathResolver(config=MagicMock())
+
+    with pytest.raises(ValueError):
+        resolver.resolve("foo", "D_1000")
+
+    with pytest.raises(ValueError):
+        resolver.resolve("wfinst", "D_1000")
+
+    with pytest.raises(ValueError, match="Invalid path type: tool"):
+        resolver.resolve("tool", "foo")
+
+    # and so are types _locate has no lookup for
+    with pytest.raises(ValueError, match="Invalid path type: foo"):
+        resolver._locate("foo", "D_1000")
+
+
+def test_parse_entry():
+    assert parse_entry("D_1000\n") == (None, "D_1000")
+    assert parse_entry("D_1000", default_type="archive") == ("archive", "D_1000")
+    assert parse_entry("deposit:D_1000", default_type="archive") == ("deposit", "D_1000")
+    assert parse_entry("wfinst:D_1000:W_001") == ("wfinst", "D_1000:W_001")
+    assert parse_entry("D_1000:W_001", default_type="wfinst") == ("wfinst", "D_1000:W_001")
+
+
+@pytest.fixture
+def site_paths(monkeypatch):
+    """Real locators over a mocked site config"""
+    config_dictionary = ConfigInfoData.getConfigDictionary
+
+    def get(s):
+        d = dict(config_dictionary(s))
+        d.update({
+            "SITE_ARCHIVE_STORAGE_PATH": "/onedep/data",
+            "SITE_WEB_APPS_SESSIONS_PATH": "/onedep/sessions",
+            "SITE_WF_XML_PATH": "/onedep/wf-defs",
+            "SITE_REFDATA_TOP_CVS_SB_PATH": "/onedep/reference/cvs",
+        })
+        return d
+
+    monkeypatch.setattr(ConfigInfoData, "getConfigDictionary", get)
+
+
+CONFORMANCE_IDS = {
+    'tempdep': ["D_1000", "D_8000123456", "d_1292110001", "foo"],
+    'deposit': ["D_1000", "D_8000123456", "d_1292110001"],
+    'archive': ["D_1000", "D_8000123456", "d_1292110001"],
+    'upload': ["D_1000", "d_1292110001"],
+    'pickles': ["D_1000", "d_1292110001"],
+    'wfinst': ["D_1000:W_001", "d_1292110001:w_123"],
+    'session': ["abcd1234"],
+    'ccid': ["A", "ATP", "atp", "7ZTVU", "a1ab", "PRD_000001", "prd_000123", "PRDCC_000001", "FAM_000010", "XYZXYZXYZ"],
+    'wfxml': ["wf_op_annot_fs"],
+}
+
+
+def test_templates_match_locators(site_paths):
+    assert set(CONFORMANCE_IDS) == set(PATH_TYPES) - {'package'}
+
+    resolver = PathResolver(config=Config("tests/fixtures/config.yaml"))
+    locators = PathResolver(config=Config("tests/fixtures/config.yaml"), templates=False)
+
+    for type_, identifiers in CONFORMANCE_IDS.items():
+        for identifier in identifiers:
+            assert resolver.resolve(type_, identifier) == locators.resolve(type_, identifier), (type_, identifier)
+
+    # every shape got a template
+    for type_, shape, _, _ in TEMPLATE_SHAPES:
+        assert resolver.templates.get(type_, shape) is not None, (type_, shape)
+
+
+def test_templates_skip_the_locators(locators):
+    pathinfo, _ = locators
+
+    first = PathTemplates(PathResolver(config=MagicMock())._locate)
+    assert first.render("deposit", "D_1000") == "/deposit/D_1000"
+    assert first.render("deposit", "foo") is None
+    calls = pathinfo.return_value.getDepositPath.call_count
+
+    # the template is applied without asking the locator again
+    assert first.render("deposit", "D_2000") == "/deposit/D_2000"
+    assert pathinfo.return_value.getDepositPath.call_count == calls
+
+
+def test_templates_cache(locators, tmp_path):
+    pathinfo, _ = locators
+    cache_file = str(tmp_path / "templates.json")
+
+    PathTemplates(PathResolver(config=MagicMock())._locate, cache_file=cache_file, stamp="a").render("deposit", "D_1000")
+    pathinfo.reset_mock()
+
+    assert PathTemplates(PathResolver(config=MagicMock())._locate, cache_file=cache_file, stamp="a").render("deposit", "D_2000") == "/deposit/D_2000"
+    pathinfo.assert_not_called()
+
+    # other stamps derive them again
+    assert PathTemplates(PathResolver(config=MagicMock())._locate, cache_file=cache_file, stamp="b").render("deposit", "D_2000") == "/deposit/D_2000"
+    pathinfo.assert_called_once()
+
+
+def test_derive_template():
+    assert derive_template("d_8000000017", "/data/deposit/D_8000000017") == "/data/deposit/{P0}"
+    assert derive_template("d_8000000017:w_917", "/data/workflow/D_8000000017/instance/W_917") == "/data/workflow/{P0}/instance/{P1}"
+    assert derive_template("xq7", "/cvs/ligand-dict-v3/X/XQ7/XQ7.cif") == "/cvs/ligand-dict-v3/{first}/{P0}/{P0}.cif"
+    assert derive_template("xq7k9", "/cvs/ligand-dict-v3/K9/XQ7K9/XQ7K9.cif") == "/cvs/ligand-dict-v3/{last2}/{P0}/{P0}.cif"
+    assert derive_template("prd_800017", "/{cvs}/prd-v3/7/PRD_800017.cif") == "/{{cvs}}/prd-v3/{last}/{P0}.cif"
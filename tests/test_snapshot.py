@@ -0,0 +1,101 @@
+import os
+import sys
+import types
+import pytest
+
+from onedep_manager.snapshot import SiteSnapshot, write_snapshot, open_snapshot, remove_snapshot, snapshot_path, snapshot_sources, MISSING
+
+from wwpdb.utils.config.ConfigInfoData import ConfigInfoData
+
+
+@pytest.fixture
+def site_dir(monkeypatch, tmp_path):
+    site_dir = tmp_path / "pdbe" / "pdbe_test"
+    site_dir.mkdir(parents=True)
+    (site_dir / "site.cfg").write_text("[pdbe_test]\n")
+
+    monkeypatch.setenv("TOP_WWPDB_SITE_CONFIG_DIR", str(tmp_path))
+    monkeypatch.setenv("WWPDB_SITE_LOC", "pdbe")
+    monkeypatch.setenv("WWPDB_SITE_ID", "PDBE_TEST")
+
+    return site_dir
+
+
+def test_lookup(tmp_path):
+    config = {
+        "GASCOIGNE": "Central Yharnam",
+        "LUDWIG": "Underground Corpse Pile",
+        "ABC": ["a", "b", "c"],
+        "MARIA": {"tower": "Astral Clocktower"},
+        "TUPLES": {"ccd": ("pdbx", "cif")},
+        "EMPTY": "",
+    }
+    path = str(tmp_path / "site.snapshot")
+
+    write_snapshot(path, config, b"0" * 20)
+    snapshot = SiteSnapshot(path)
+
+    assert len(snapshot) == len(config)
+    assert snapshot.fingerprint == b"0" * 20
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+    for key in ("GASCOIGNE", "LUDWIG", "ABC", "MARIA", "EMPTY"):
+        assert snapshot.lookup(key) == config[key]
+
+    # would come back as lists
+    assert snapshot.lookup("TUPLES") is MISSING
+    assert snapshot.lookup("BAR") is None
+    assert snapshot.lookup("AAA", default="foo") == "foo"
+    assert snapshot.lookup("ZZZ") is None
+
+
+def test_not_a_snapshot(tmp_path):
+    path = tmp_path / "site.snapshot"
+    path.write_bytes(b"not a snapshot, but long enough for a header")
+
+    with pytest.raises(ValueError):
+        SiteSnapshot(str(path))
+
+
+def test_open_snapshot(monkeypatch, site_dir):
+    calls = []
+
+    def config_dictionary(s):
+        calls.append(1)
+        return {"GASCOIGNE": "Central Yharnam"}
+
+    monkeypatch.setattr(ConfigInfoData, "getConfigDictionary", config_dictionary)
+
+    assert open_snapshot(build=False) is None
+    assert open_snapshot().lookup("GASCOIGNE") == "Central Yharnam"
+    assert os.path.exists(snapshot_path())
+    assert len(calls) == 1
+
+    # fresh snapshots are reused
+    assert open_snapshot().lookup("GASCOIGNE") == "Central Yharnam"
+    assert len(calls) == 1
+
+    # and rebuilt when site.cfg changes
+    st = os.stat(site_dir / "site.cfg")
+    os.utime(site_dir / "site.cfg", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert open_snapshot(build=False) is None
+    assert open_snapshot().lookup("GASCOIGNE") == "Central Yharnam"
+    assert len(calls) == 2
+
+    remove_snapshot()
+    assert not os.path.exists(snapshot_path())
+    assert open_snapshot(build=False) is None
+
+
+def test_snapshot_sources(monkeypatch, site_dir):
+    monkeypatch.delitem(sys.modules, "ConfigInfoFileCache", raising=False)
+    sources = snapshot_sources()
+
+    assert str(site_dir / "site.cfg") in sources
+    assert str(site_dir / "ConfigInfoFileCache.json") in sources
+
+    cache = types.ModuleType("ConfigInfoFileCache")
+    cache.__file__ = str(site_dir / "ConfigInfoFileCache.py")
+    monkeypatch.setitem(sys.modules, "ConfigInfoFileCache", cache)
+
+    assert snapshot_sources() == sources + [cache.__file__]
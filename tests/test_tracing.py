@@ -0,0 +1,81 @@
+import json
+import time
+import threading
+import pytest
+
+from onedep_manager import tracing
+from onedep_manager.tracing import Tracer, Span, span, traced
+
+
+@pytest.fixture(autouse=True)
+def no_tracer():
+    tracing.disable()
+    yield
+    tracing.disable()
+
+
+def test_disabled_spans_record_nothing():
+    with span("nothing", "test"):
+        pass
+
+    assert tracing.get_tracer() is None
+
+
+def test_spans():
+    tracer = tracing.enable()
+
+    @traced("git", "git pull")
+    def pull():
+        time.sleep(0.01)
+        return "pulled"
+
+    with span("install", "pip", source="wwpdb.io"):
+        assert pull() == "pulled"
+
+    threads = [threading.Thread(target=pull) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert [(s.name, s.category) for s in tracer.spans[:2]] == [("git pull", "git"), ("install", "pip")]
+    assert tracer.spans[1].args == {"source": "wwpdb.io"}
+    assert tracer.spans[1].duration >= tracer.spans[0].duration >= 10_000_000
+    assert len({s.thread_id for s in tracer.spans}) == 3
+
+
+def _span(name, category, start, duration, thread=1):
+    return Span(name=name, category=category, start=int(start * 1e9), duration=int(duration * 1e9), thread_id=thread, thread_name=f"t{thread}")
+
+
+def test_summary():
+    tracer = Tracer()
+    tracer.spans = [
+        _span("git branch", "git", 0, 1, thread=1),
+        # overlaps the first one, in another thread
+        _span("git branch", "git", 0.5, 1, thread=2),
+        _span("git pull", "git", 3, 0.5),
+        _span("pip install", "pip", 4, 2),
+    ]
+
+    git, pip = sorted(tracer.summary(), key=lambda r: r["category"])
+
+    assert git["spans"] == 3
+    assert git["wall"] == pytest.approx(2)
+    assert git["busy"] == pytest.approx(2.5)
+    assert pip["wall"] == pytest.approx(2)
+    assert pip["slowest"] == "pip install"
+
+
+def test_chrome_trace(tmp_path):
+    tracer = Tracer()
+    tracer.spans = [_span("ssh connect", "ssh", 0.001, 0.002)]
+    tracer.write_chrome_trace(str(tmp_path / "trace.json"))
+
+    with open(tmp_path / "trace.json") as f:
+        events = json.load(f)["traceEvents"]
+
+    assert events[0]["ph"] == "X"
+    assert events[0]["ts"] == pytest.approx(1000)
+    assert events[0]["dur"] == pytest.approx(2000)
+    assert events[1] == {"name": "thread_name", "ph": "M", "pid": events[0]["pid"], "tid": 1, "args": {"name": "t1"}}
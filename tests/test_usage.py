@@ -0,0 +1,226 @@
+import os
+import time
+import threading
+import pytest
+from unittest.mock import MagicMock
+
+from onedep_manager.usage import walk_usage, find_depositions, location_roots, scan, dep_id_number, UsageIndex, RateLimiter
+
+
+def make_tree(root, dep_id, files, mtime=None):
+    """Creates `root/dep_id` with `files` ({relative path: size})"""
+    base = root / dep_id
+
+    for name, size in files.items():
+        path = base / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"0" * size)
+
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    base.mkdir(parents=True, exist_ok=True)
+
+    if mtime is not None:
+        for dirpath, dirnames, _ in os.walk(base):
+            for d in dirnames:
+                os.utime(os.path.join(dirpath, d), (mtime, mtime))
+        os.utime(base, (mtime, mtime))
+
+    return base
+
+
+@pytest.fixture
+def storage(tmp_path):
+    old = time.time() - 100 * 24 * 3600
+    deposit = tmp_path / "deposit"
+    archive = tmp_path / "archive"
+
+    make_tree(deposit, "D_1000", {"a.cif": 10, "sub/b.cif": 20, "sub/deeper/c.cif": 30})
+    make_tree(deposit, "D_1001", {"a.cif": 5}, mtime=old)
+    make_tree(deposit, "D_2000", {})
+    (deposit / "not_a_deposition").mkdir()
+    make_tree(archive, "D_1000", {"a.cif": 100}, mtime=old)
+
+    return {"deposit": str(deposit), "archive": str(archive), "upload": str(tmp_path / "missing")}
+
+
+def test_walk_usage(storage):
+    files, size, mtime = walk_usage(os.path.join(storage["deposit"], "D_1000"))
+
+    assert (files, size) == (3, 60)
+    assert mtime > time.time() - 60
+    assert walk_usage(os.path.join(storage["deposit"], "D_9999"))[:2] == (0, 0)
+
+
+def test_find_depositions(storage):
+    assert sorted(find_depositions(storage["deposit"])) == ["D_1000", "D_1001", "D_2000"]
+    assert sorted(find_depositions(storage["deposit"], first=1001)) == ["D_1001", "D_2000"]
+    assert sorted(find_depositions(storage["deposit"], first=1000, last=1001)) == ["D_1000", "D_1001"]
+    assert list(find_depositions(storage["upload"])) == []
+
+
+def test_scan(storage):
+    results = {(u.dep_id, u.location): (u.files, u.size) for u in scan(storage, workers=1)}
+
+    assert results == {
+        ("D_1000", "deposit"): (3, 60),
+        ("D_1001", "deposit"): (1, 5),
+        ("D_2000", "deposit"): (0, 0),
+        ("D_1000", "archive"): (1, 100),
+    }
+
+
+def test_scan_filters(storage):
+    day = 24 * 3600
+
+    assert {(u.dep_id, u.location) for u in scan(storage, older_than=30 * day)} == {("D_1001", "deposit"), ("D_1000", "archive")}
+    assert {(u.dep_id, u.location) for u in scan(storage, newer_than=30 * day, last=1999)} == {("D_1000", "deposit")}
+    assert {(u.dep_id, u.location) for u in scan(storage, dep_ids=iter(["D_1000", "D_3000"]))} == {("D_1000", "deposit"), ("D_1000", "archive")}
+
+
+def test_scan_bounded_in_flight(tmp_path, monkeypatch):
+    for i in range(12):
+        (tmp_path / f"D_{1000 + i}").mkdir()
+
+    lock = threading.Lock()
+    running, started, peak = 0, 0, 0
+
+    def slow_walk(path):
+        nonlocal running, started, peak
+
+        with lock:
+            running += 1
+            started += 1
+            peak = max(peak, running)
+
+        time.sleep(0.02)
+
+        with lock:
+            running -= 1
+
+        return 0, 0, time.time()
+
+    monkeypatch.setattr("onedep_manager.usage.walk_usage", slow_walk)
+    ahead = []
+
+    for consumed, _ in enumerate(scan({"deposit": str(tmp_path)}, workers=2)):
+        # trees walked before the caller took this one
+        ahead.append(started - consumed)
+        # a slow caller, so unbounded workers would get far ahead
+        time.sleep(0.03)
+
+    assert len(ahead) == 12
+    # both workers walk at once, and no more than 2 * workers trees are in flight
+    assert peak == 2
+    assert max(ahead) <= 4
+
+
+def test_location_roots():
+    resolver = MagicMock()
+    resolver.resolve.side_effect = lambda type_, identifier: "/data/{}/{}".format(
+        "workflow" if type_ == "wfinst" else type_,
+        identifier.replace(":", "/instance/"),
+    )
+
+    assert location_roots(resolver, ["deposit", "wfinst"]) == {"deposit": "/data/deposit", "wfinst": "/data/workflow"}
+
+
+def test_dep_id_number():
+    assert dep_id_number("D_1000") == 1000
+    assert dep_id_number("d_8000000017") == 8000000017
+    assert dep_id_number("foo") is None
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = UsageIndex(str(tmp_path / "usage.db"))
+    yield index
+    index.close()
+
+
+def test_index_refresh(storage, index):
+    results = {(u.dep_id, u.location): (u.files, u.size) for u in index.refresh(storage)}
+
+    assert results == {
+        ("D_1000", "deposit"): (3, 60),
+        ("D_1001", "deposit"): (1, 5),
+        ("D_2000", "deposit"): (0, 0),
+        ("D_1000", "archive"): (1, 100),
+    }
+    assert [(u.dep_id, u.location) for u in index.top(limit=2)] == [("D_1000", "archive"), ("D_1000", "deposit")]
+    assert [u.dep_id for u in index.top(locations=["deposit"])] == ["D_1000", "D_1001", "D_2000"]
+    assert {(u.dep_id, u.location) for u in index.older(30)} == {("D_1001", "deposit"), ("D_1000", "archive")}
+    assert [u.dep_id for u in index.older(30, locations=["deposit"])] == ["D_1001"]
+
+
+def test_index_lists_changed_dirs_only(storage, index, monkeypatch):
+    list(index.refresh(storage))
+
+    listed = []
+    scandir = os.scandir
+
+    def counting_scandir(path):
+        listed.append(path)
+        return scandir(path)
+
+    monkeypatch.setattr("onedep_manager.usage.os.scandir", counting_scandir)
+    list(index.refresh(storage))
+    # only the location roots, to find the depositions
+    assert sorted(listed) == sorted([storage["deposit"], storage["archive"], storage["upload"]])
+
+    deeper = os.path.join(storage["deposit"], "D_1000", "sub", "deeper")
+    with open(os.path.join(deeper, "d.cif"), "wb") as f:
+        f.write(b"0" * 40)
+
+    listed.clear()
+    results = {(u.dep_id, u.location): (u.files, u.size) for u in index.refresh(storage)}
+
+    assert deeper in listed
+    assert os.path.join(storage["deposit"], "D_1000") not in listed
+    assert results[("D_1000", "deposit")] == (4, 100)
+
+
+def test_index_removes_gone_trees(storage, index):
+    list(index.refresh(storage))
+
+    sub = os.path.join(storage["deposit"], "D_1000", "sub")
+    for dirpath, _, filenames in os.walk(sub, topdown=False):
+        for name in filenames:
+            os.remove(os.path.join(dirpath, name))
+        os.rmdir(dirpath)
+    os.remove(os.path.join(storage["deposit"], "D_1001", "a.cif"))
+    os.rmdir(os.path.join(storage["deposit"], "D_1001"))
+
+    results = {(u.dep_id, u.location): (u.files, u.size) for u in index.refresh(storage)}
+
+    assert results[("D_1000", "deposit")] == (1, 10)
+    assert ("D_1001", "deposit") not in results
+    assert [u.dep_id for u in index.top(locations=["deposit"])] == ["D_1000", "D_2000"]
+
+
+def test_index_resumes(storage, index):
+    refresh = index.refresh({"deposit": storage["deposit"]})
+    assert next(refresh).dep_id == "D_1000"
+    refresh.close()
+
+    assert [u.dep_id for u in index.refresh({"deposit": storage["deposit"]})] == ["D_1001", "D_2000"]
+    # a complete pass starts over
+    assert [u.dep_id for u in index.refresh({"deposit": storage["deposit"]})] == ["D_1000", "D_1001", "D_2000"]
+    assert [u.dep_id for u in index.top()] == ["D_1000", "D_1001", "D_2000"]
+
+
+def test_rate_limiter(monkeypatch):
+    sleeps = []
+    now = [100.0]
+
+    monkeypatch.setattr("onedep_manager.usage.time.monotonic", lambda: now[0])
+    monkeypatch.setattr("onedep_manager.usage.time.sleep", sleeps.append)
+
+    limiter = RateLimiter(4)
+    limiter.wait()
+    limiter.wait()
+    assert sleeps == [0.25]
+
+    RateLimiter(None).wait()
+    assert sleeps == [0.25]
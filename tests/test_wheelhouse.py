@@ -0,0 +1,133 @@
+import os
+import json
+from unittest.mock import MagicMock
+
+from onedep_manager.wheelhouse import Wheelhouse, build_requires, requirement_name, DEFAULT_BUILD_REQUIRES
+
+
+def make_wheel(root, filename, size=10, mtime=None):
+    path = root / filename
+    path.write_bytes(b"0" * size)
+
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+    return path
+
+
+def test_fill_records_wheels(monkeypatch, tmp_path):
+    wheelhouse = Wheelhouse(str(tmp_path))
+
+    mock_run = MagicMock()
+    mock_run.return_value.returncode = 0
+    mock_run.return_value.stdout = (
+        "Collecting setuptools>=40.8.0\n"
+        "Saved ./wh/setuptools-69.0.2-py3-none-any.whl\n"
+        f"File was already downloaded {tmp_path}/wwpdb.io-0.1.0-py3-none-any.whl\n"
+        "Saved ./wh/six-1.17.0-py2.py3-none-any.whl\n"
+    )
+    mock_run.return_value.stderr = ""
+    monkeypatch.setattr("onedep_manager.wheelhouse.subprocess.run", mock_run)
+
+    make_wheel(tmp_path, "setuptools-69.0.2-py3-none-any.whl")
+    make_wheel(tmp_path, "wwpdb.io-0.1.0-py3-none-any.whl")
+
+    assert wheelhouse.fill([("setuptools", "setuptools>=40.8.0"), ("wwpdb.io", "wwpdb.io")]) == True
+    assert mock_run.call_args[0][0] == ["pip", "wheel", "-w", str(tmp_path), "--find-links", str(tmp_path), "setuptools>=40.8.0", "wwpdb.io"]
+
+    # keyed on the versions pip resolved
+    io_key = Wheelhouse.key("wwpdb.io", "0.1.0")
+    assert wheelhouse.has(Wheelhouse.key("setuptools", "69.0.2"))
+    assert wheelhouse.has(io_key)
+    assert not wheelhouse.has(Wheelhouse.key("wwpdb.io", "0.2.0"))
+
+    # manifest is kept between runs
+    assert Wheelhouse(str(tmp_path)).has(io_key)
+    assert json.loads((tmp_path / "manifest.json").read_text())[io_key] == "wwpdb.io-0.1.0-py3-none-any.whl"
+
+
+def test_missing(tmp_path):
+    wheelhouse = Wheelhouse(str(tmp_path))
+
+    make_wheel(tmp_path, "wwpdb.io-0.1.0-py3-none-any.whl")
+    wheelhouse._manifest = {
+        Wheelhouse.key("wwpdb.io", "0.1.0"): "wwpdb.io-0.1.0-py3-none-any.whl",
+        # pruned, or removed by hand
+        Wheelhouse.key("setuptools", "69.0.2"): "setuptools-69.0.2-py3-none-any.whl",
+    }
+
+    targets = [("setuptools", "setuptools>=40.8.0"), ("wwpdb_io", "wwpdb_io"), ("wheel", "wheel")]
+    assert wheelhouse.missing(targets) == [("setuptools", "setuptools>=40.8.0"), ("wheel", "wheel")]
+
+
+def test_fill_failure(monkeypatch, tmp_path):
+    mock_run = MagicMock()
+    mock_run.return_value.returncode = 1
+    mock_run.return_value.stdout = ""
+    mock_run.return_value.stderr = "ERROR: No matching distribution found for wwpdb.io"
+    monkeypatch.setattr("onedep_manager.wheelhouse.subprocess.run", mock_run)
+
+    wheelhouse = Wheelhouse(str(tmp_path))
+
+    assert wheelhouse.fill([("wwpdb.io", "wwpdb.io")]) == False
+    assert wheelhouse._manifest == {}
+
+    # nothing to build
+    assert wheelhouse.fill([]) == True
+    mock_run.assert_called_once()
+
+
+def test_pip_args(tmp_path):
+    wheelhouse = Wheelhouse(str(tmp_path))
+
+    assert wheelhouse.pip_args() == ["--find-links", str(tmp_path)]
+    assert wheelhouse.pip_args(offline=True) == ["--find-links", str(tmp_path), "--no-index"]
+
+
+def test_size_and_prune(tmp_path):
+    wheelhouse = Wheelhouse(str(tmp_path))
+
+    make_wheel(tmp_path, "wwpdb.io-0.1.0-py3-none-any.whl", size=100, mtime=1000)
+    make_wheel(tmp_path, "wwpdb.io-0.2.0-py3-none-any.whl", size=200, mtime=2000)
+    make_wheel(tmp_path, "wwpdb_io-0.3.0-py3-none-any.whl", size=300, mtime=3000)
+    make_wheel(tmp_path, "six-1.17.0-py2.py3-none-any.whl", size=50, mtime=1000)
+
+    wheelhouse._manifest = {
+        Wheelhouse.key("wwpdb.io", "0.1.0"): "wwpdb.io-0.1.0-py3-none-any.whl",
+        Wheelhouse.key("wwpdb.io", "0.3.0"): "wwpdb_io-0.3.0-py3-none-any.whl",
+    }
+
+    assert wheelhouse.size() == (4, 650)
+    assert wheelhouse.prune(keep=1) == (2, 300)
+    assert wheelhouse.wheels() == ["six-1.17.0-py2.py3-none-any.whl", "wwpdb_io-0.3.0-py3-none-any.whl"]
+    assert wheelhouse.size() == (2, 350)
+
+    assert not wheelhouse.has(Wheelhouse.key("wwpdb.io", "0.1.0"))
+    assert wheelhouse.has(Wheelhouse.key("wwpdb.io", "0.3.0"))
+
+
+def test_build_requires(tmp_path):
+    assert build_requires(str(tmp_path)) == DEFAULT_BUILD_REQUIRES
+
+    (tmp_path / "pyproject.toml").write_text(
+        "[tool.black]\n"
+        "line-length = 120\n"
+        "\n"
+        "[build-system]\n"
+        "requires = [\n"
+        "    \"setuptools>=61\",\n"
+        "    'wheel',\n"
+        "]\n"
+        "build-backend = \"setuptools.build_meta\"\n"
+    )
+    assert build_requires(str(tmp_path)) == ["setuptools>=61", "wheel"]
+
+    (tmp_path / "pyproject.toml").write_text("[tool.black]\nline-length = 120\n")
+    assert build_requires(str(tmp_path)) == DEFAULT_BUILD_REQUIRES
+
+
+def test_requirement_name():
+    assert requirement_name("setuptools>=40.8.0") == "setuptools"
+    assert requirement_name("wheel") == "wheel"
+    assert requirement_name("cython[extra] ; python_version < '3.12'") == "cython"
+    assert requirement_name("poetry-core @ https://example.org/poetry.tar.gz") == "poetry-core"